@@ -0,0 +1,31 @@
+"""
+grid generation time for each city with default and finer grid steps
+
+run from EPAM_final directory: python -m benchmarks.bench_grid
+"""
+
+import time
+
+from data_preproc import get_grid, get_min_max_cord
+
+
+def main(cities=("Mos", "SPb", "Ekb"), scales=(1, 2, 4)):
+    """
+    print number of cells and grid generation time for each city and step scale
+    """
+
+    for city in cities:
+        borders = get_min_max_cord(f"Data_preproc/{city}_geo.json", city)
+        for scale in scales:
+            start = time.perf_counter()
+            grid_df = get_grid(
+                *borders, step_lat=0.004 / scale, step_long=0.0025 / scale
+            )
+            elapsed = time.perf_counter() - start
+            print(
+                f"{city}, step / {scale}: {len(grid_df)} cells, {elapsed * 1000:.0f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+interpolation engines on city grids: fit and predict time,
+peak memory of numpy and python allocations, cross-validation error
+
+run from EPAM_final directory after data_preproc.py:
+python -m benchmarks.bench_interpolation
+"""
+
+import time
+import tracemalloc
+
+import geopandas as gpd
+import numpy as np
+from sklearn.model_selection import KFold
+
+from data_preproc import (
+    CITY_WATER,
+    bound_grid,
+    centroid_coordinates,
+    get_grid,
+    get_min_max_cord,
+    water_mask,
+)
+from interpolation import ENGINES, make_engine, project
+from knn_tuner import best_knn_params
+
+
+def train_data(city, app):
+    """
+    :param city: city key
+    :param app: apartment type key
+    :return: coordinates and prices of grid cells with offers
+    """
+
+    prices = gpd.read_file(f"Data_preproc/{city}_{app}_grid_gpd.gpkg")
+    prices = prices.rename(columns={"price_per_": "price_per_square"})
+    prices = prices[prices["price_per_square"] > 50000]
+
+    return centroid_coordinates(prices), prices["price_per_square"].to_numpy()
+
+
+def predict_points(city, scale=1):
+    """
+    :param city: city key
+    :param scale: grid step is divided by scale
+    :return: coordinates of bounded grid cells
+    """
+
+    geo_city = f"Data_preproc/{city}_geo.json"
+    grid_df = get_grid(
+        *get_min_max_cord(geo_city, city),
+        step_lat=0.004 / scale,
+        step_long=0.0025 / scale,
+    )
+    border = gpd.read_file(geo_city).at[0, "geometry"]
+
+    return centroid_coordinates(
+        bound_grid(grid_df, border, water_mask(CITY_WATER[city]))
+    )
+
+
+def engine_params(name, X, y):
+    """
+    :return: tuned parameters of KNN engines, default ones for others
+    """
+
+    if not name.startswith("knn"):
+        return {}
+    if ENGINES[name][1]:
+        X = project(X, X[:, 1].mean())
+
+    return best_knn_params(X, y)[0]
+
+
+def cv_error(name, params, X, y, n_splits=5):
+    """
+    :return: mean RMSE and R^2 of engine on KFold splits
+    """
+
+    rmse, r2 = [], []
+    for train, test in KFold(n_splits).split(X):
+        y_pred = make_engine(name, **params).fit(X[train], y[train]).predict(X[test])
+        error = y[test] - y_pred
+        rmse.append(np.sqrt(np.mean(error**2)))
+        r2.append(1 - np.sum(error**2) / np.sum((y[test] - y[test].mean()) ** 2))
+
+    return np.mean(rmse), np.mean(r2)
+
+
+def main(cities=("Mos", "SPb", "Ekb"), apps=("sec",), scales=(1, 2)):
+    """
+    print engines benchmark for each city, apartment type and grid step scale
+    """
+
+    for city in cities:
+        points = {scale: predict_points(city, scale) for scale in scales}
+        for app in apps:
+            X, y = train_data(city, app)
+            for name in ENGINES:
+                params = engine_params(name, X, y)
+                rmse, r2 = cv_error(name, params, X, y)
+                for scale, X_predict in points.items():
+                    tracemalloc.start()
+                    start = time.perf_counter()
+                    engine = make_engine(name, **params).fit(X, y)
+                    fitted = time.perf_counter()
+                    engine.predict(X_predict)
+                    done = time.perf_counter()
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    print(
+                        f"{city} {app} {name} {params}, step / {scale}: "
+                        f"{len(X)} -> {len(X_predict)} cells, "
+                        f"fit {(fitted - start) * 1000:.1f} ms, "
+                        f"predict {(done - fitted) * 1000:.1f} ms, "
+                        f"peak {peak / 2**20:.1f} MiB, "
+                        f"CV RMSE {rmse:.0f} ₽/m², R^2 {r2:.3f}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
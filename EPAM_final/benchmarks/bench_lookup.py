@@ -0,0 +1,37 @@
+"""
+batch price lookup speed for each city
+
+run from EPAM_final directory: python -m benchmarks.bench_lookup
+"""
+
+import time
+
+import numpy as np
+
+from price_lookup import PriceLookup
+
+
+def main(cities=("Mos", "SPb", "Ekb"), app="sec", n_points=(10_000, 1_000_000)):
+    """
+    print lookups per second of random points in grid bounds (and 10% around)
+    """
+
+    rng = np.random.default_rng(0)
+    for city in cities:
+        lookup = PriceLookup(city, app)
+        lat_min, lat_max = lookup.long_array[0], lookup.long_array[-1]
+        long_min, long_max = lookup.lat_array[0], lookup.lat_array[-1]
+        for n in n_points:
+            lat = rng.uniform(lat_min, lat_max + 0.1 * (lat_max - lat_min), n)
+            long = rng.uniform(long_min, long_max + 0.1 * (long_max - long_min), n)
+            start = time.perf_counter()
+            _, _, out = lookup.lookup(lat, long)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{city}, {n} points: {n / elapsed / 1e6:.1f} M lookups/s, "
+                f"{out.mean():.0%} out of city grid"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+scaling of duplicate coordinates aggregation with number of offers
+
+run from EPAM_final directory: python -m benchmarks.bench_offers_prep
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_preproc import group_offers_by_location
+
+
+def random_offers(n_offers, seed=0):
+    """
+    random Moscow offers, about a half of them share coordinates with others
+
+    :param n_offers: number of offers
+    :param seed: random seed
+    :return: pandas.DataFrame with offers
+    """
+
+    rng = np.random.default_rng(seed)
+    n_locations = max(n_offers // 2, 1)
+    location = rng.integers(0, n_locations, n_offers)
+    long = 37.3 + 0.6 * rng.random(n_locations)
+    lat = 55.5 + 0.4 * rng.random(n_locations)
+
+    return pd.DataFrame(
+        {
+            "price_per_square": rng.normal(250000, 50000, n_offers),
+            "location_long": long[location],
+            "location_lat": lat[location],
+        }
+    )
+
+
+def main(sizes=(1_000, 10_000, 100_000, 1_000_000)):
+    """
+    print aggregation time and time per offer for each number of offers
+    """
+
+    for n_offers in sizes:
+        offers_df = random_offers(n_offers)
+        for tolerance in (None, 1e-4):
+            start = time.perf_counter()
+            locations = group_offers_by_location(offers_df, tolerance)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{n_offers} offers, tolerance {tolerance}: {len(locations)} locations, "
+                f"{elapsed * 1000:.1f} ms, {elapsed / n_offers * 1e6:.2f} µs/offer"
+            )
+
+
+if __name__ == "__main__":
+    main()
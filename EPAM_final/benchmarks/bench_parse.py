@@ -0,0 +1,51 @@
+"""
+compare fast html extractors with BeautifulSoup parsers on test pages
+
+run from EPAM_final directory: python -m benchmarks.bench_parse
+"""
+
+import timeit
+
+from get_data_from_web import get_links, get_offers, soup_links, soup_offers
+
+PAGES = {
+    "offers_page.htm": (soup_links, get_links),
+    "offer_data_page.htm": (soup_offers, get_offers),
+}
+
+
+def per_page_time(parser, html, number):
+    """
+    best of 3 mean parse time of one page
+
+    :param parser: parser function
+    :param html: page html
+    :param number: number of parser calls in one run
+    :return: seconds per page
+    """
+
+    return min(timeit.repeat(lambda: parser(html), number=number, repeat=3)) / number
+
+
+def main(number=20):
+    """
+    print per page parse time of current and fast parsers
+    """
+
+    for page, (soup_parser, fast_parser) in PAGES.items():
+        with open(f"tests/{page}", encoding="utf-8") as file:
+            html = file.read()
+
+        assert soup_parser(html) == fast_parser(html)
+
+        soup_time = per_page_time(soup_parser, html, number)
+        fast_time = per_page_time(fast_parser, html, number)
+        print(
+            f"{page}: {soup_parser.__name__} {soup_time * 1000:.2f} ms, "
+            f"{fast_parser.__name__} {fast_time * 1000:.3f} ms, "
+            f"x{soup_time / fast_time:.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
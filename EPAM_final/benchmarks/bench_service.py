@@ -0,0 +1,111 @@
+"""
+price service latency and throughput of point and bbox queries
+with one and many concurrent clients, p99 latency is compared with the target
+
+run from EPAM_final directory: python -m benchmarks.bench_service
+"""
+
+import asyncio
+import time
+from multiprocessing import Process
+
+import aiohttp
+import numpy as np
+
+from price_service import main as run_service
+
+PORT = 8081
+P99_TARGET = 5.0  # ms
+
+
+async def run_queries(queries, concurrency):
+    """
+    :param queries: list of (path, params) of requests
+    :param concurrency: number of concurrent clients
+    :return: numpy array of requests latencies in seconds, total time
+    """
+
+    latencies = []
+    queue = list(reversed(queries))
+
+    async def client(session):
+        while queue:
+            path, params = queue.pop()
+            start = time.perf_counter()
+            async with session.get(f"http://127.0.0.1:{PORT}{path}", params=params):
+                pass
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+
+    return np.array(latencies), time.perf_counter() - start
+
+
+async def wait_service(timeout=120):
+    """
+    :param timeout: seconds to wait for grids loading
+    """
+
+    async with aiohttp.ClientSession() as session:
+        for _ in range(timeout * 10):
+            try:
+                async with session.get(f"http://127.0.0.1:{PORT}/price"):
+                    return
+            except aiohttp.ClientConnectionError:
+                await asyncio.sleep(0.1)
+
+
+def main(city="SPb", app="sec", n_queries=20_000, concurrency=(1, 16)):
+    """
+    print requests per second, p50 and p99 latency of random point
+    and bbox queries for each number of concurrent clients,
+    the target is met only if p99 of all numbers of clients is below P99_TARGET
+    """
+
+    service = Process(target=run_service, args=(PORT,), daemon=True)
+    service.start()
+    asyncio.run(wait_service())
+
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(59.8, 60.1, n_queries)
+    long = rng.uniform(30.1, 30.5, n_queries)
+    size = rng.uniform(0.005, 0.05, n_queries)
+    queries = {
+        "point": [
+            ("/price", {"city": city, "app": app, "lat": y, "long": x})
+            for y, x in zip(lat, long)
+        ],
+        "bbox": [
+            (
+                "/bbox",
+                {
+                    "city": city,
+                    "app": app,
+                    "lat_min": y,
+                    "long_min": x,
+                    "lat_max": y + d,
+                    "long_max": x + d,
+                },
+            )
+            for y, x, d in zip(lat, long, size)
+        ],
+    }
+
+    for name, requests in queries.items():
+        for clients in concurrency:
+            latencies, elapsed = asyncio.run(run_queries(requests, clients))
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            # задержка под нагрузкой растет из-за очереди запросов одного процесса
+            status = "ok" if p99 < P99_TARGET else f"above {P99_TARGET:g} ms target"
+            print(
+                f"{name}, {clients} clients: {len(latencies) / elapsed:.0f} req/s, "
+                f"p50 {p50:.2f} ms, p99 {p99:.2f} ms ({status})"
+            )
+
+    service.terminate()
+
+
+if __name__ == "__main__":
+    main()
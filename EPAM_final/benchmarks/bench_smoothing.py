@@ -0,0 +1,47 @@
+"""
+smoothed prices and density surfaces time for each city with default
+and finer grid steps (10x cells with step / 3.16)
+
+run from EPAM_final directory: python -m benchmarks.bench_smoothing
+"""
+
+import time
+
+import numpy as np
+
+from data_preproc import get_min_max_cord, grid_axes
+from price_raster import raster_header
+from smoothing import smooth_surfaces
+
+
+def main(cities=("Mos", "SPb", "Ekb"), scales=(1, 10**0.5, 10), repeat=5):
+    """
+    print grid shape and best time of smooth_surfaces on random offers
+    in 10% of cells for each city and step scale
+    """
+
+    rng = np.random.default_rng(0)
+    for city in cities:
+        borders = get_min_max_cord(f"Data_preproc/{city}_geo.json", city)
+        for scale in scales:
+            header = raster_header(
+                *grid_axes(*borders, step_lat=0.004 / scale, step_long=0.0025 / scale)
+            )
+            shape = header["shape"]
+            rows, cols = np.nonzero(rng.random(shape) < 0.1)
+            prices = rng.uniform(1e5, 3e5, len(rows))
+            counts = rng.integers(1, 5, len(rows)).astype(np.float64)
+
+            elapsed = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                smooth_surfaces(rows, cols, prices, counts, header)
+                elapsed.append(time.perf_counter() - start)
+            print(
+                f"{city}, step / {scale:.2f}: {shape[0]} x {shape[1]} cells, "
+                f"{min(elapsed) * 1000:.0f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Append-only crawl progress file to resume interrupted crawl
+"""
+
+import json
+import os
+
+BATCH_SIZE = 50  # offers written to disk at once
+
+
+class Checkpoint:
+    """
+    json lines file with crawl progress of one city and apartment type:
+    {"type": "listing", "data": {offer url: refresh time, ...}}
+    {"type": "offer", "data": offer data dict}
+    ...
+    {"type": "done"}
+    """
+
+    def __init__(self, file_name, batch_size=BATCH_SIZE):
+        self.file_name = file_name
+        self.batch_size = batch_size
+        self.listing = None
+        self.offers = []
+        self.done = False
+        self.buffer = []
+
+        if os.path.exists(file_name):
+            self.load()
+
+    def load(self):
+        """
+        read progress from file,
+        broken last line (crawl stopped while writing) is cut off
+        """
+
+        size = 0
+        with open(self.file_name, "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                size += len(line)
+                if record["type"] == "listing":
+                    self.listing = record["data"]
+                elif record["type"] == "offer":
+                    self.offers.append(record["data"])
+                elif record["type"] == "done":
+                    self.done = True
+
+        if size < os.path.getsize(self.file_name):
+            os.truncate(self.file_name, size)
+
+    def append(self, records):
+        """
+        append records to file and flush them to disk
+
+        :param records: list of records dicts
+        """
+
+        with open(self.file_name, "a", encoding="utf-8") as file:
+            for record in records:
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def write_listing(self, listing):
+        """
+        :param listing: dict {offer url: offer refresh time on listing page}
+        """
+
+        self.listing = listing
+        self.append([{"type": "listing", "data": listing}])
+
+    def write(self, offer):
+        """
+        add offer to progress, offers are written by batches
+
+        :param offer: offer data dict
+        """
+
+        self.offers.append(offer)
+        self.buffer.append({"type": "offer", "data": offer})
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        write buffered offers
+        """
+
+        if self.buffer:
+            self.append(self.buffer)
+            self.buffer = []
+
+    def finish(self):
+        """
+        mark city and apartment type as done
+        """
+
+        self.flush()
+        self.done = True
+        self.append([{"type": "done"}])
+
+    def remove(self):
+        """
+        remove progress file after the whole crawl is done
+        """
+
+        if os.path.exists(self.file_name):
+            os.remove(self.file_name)
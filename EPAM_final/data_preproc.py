@@ -2,70 +2,146 @@
 Prepare data get from web to make predictions and draw on map
 """
 
+import hashlib
 import json
+import logging
+import os
+import shutil
 
 import geopandas as gpd
 import numpy as np
 import pandas as pd
-from shapely.geometry import Polygon
-
-
-def offers_data_prep(file_name):
+import shapely
+
+from jobs import WORKERS, failed_jobs, run_jobs
+from offers_storage import find_offers_file, read_offers_file
+from quadtree import (
+    COARSE_LEVELS,
+    FINE_LEVELS,
+    fill_cells,
+    fine_axes,
+    quad_ids,
+    quadtree_cells,
+)
+
+# water objects cut out of city grid
+CITY_WATER = {
+    "Mos": [],
+    "SPb": ["Data_preproc/Fin_gulf_geo.json"],
+    "Ekb": [f"Data_preproc/EKb_vod{i}.json" for i in range(1, 6)],
+}
+
+# bounded grids built in this run, key from grid_key()
+GRID_CACHE = {}
+
+
+def group_offers_by_location(offers_df, tolerance=None):
     """
-    create new column "coordinates"  = (longitude, latitude)
     apartments with the same coordinates replaced one with mean price
-    drop unnecessary columns
-
-    :param file_name: name of file with offers data
-    :return: pandas.DataFrame with modified data
+    and coordinates of the first apartment,
+    create new column "coordinates"  = "longitude, latitude"
+    and "offers_count" - number of apartments in location
+
+    :param offers_df: pandas.DataFrame with columns
+                      "price_per_square", "location_long", "location_lat"
+    :param tolerance: grid snapping step (degrees): coordinates rounded to the same
+                      multiple of tolerance are the same (points closer than
+                      tolerance on both sides of a rounding edge are not,
+                      points up to tolerance * sqrt(2) apart can be),
+                      None - only equal coordinates
+    :return: pandas.DataFrame with one row for each location
     """
 
-    orginal_df = pd.read_excel(f"{file_name}")[
-        ["price_per_square", "location_long", "location_lat"]
-    ].dropna()
-    orginal_df["coordinates"] = pd.Series(
-        orginal_df["location_long"].astype(str)
-        + ", "
-        + orginal_df["location_lat"].astype(str)
+    if tolerance:
+        # привязка к сетке с шагом tolerance, а не кластеризация по расстоянию
+        keys = [
+            (offers_df["location_long"] / tolerance).round(),
+            (offers_df["location_lat"] / tolerance).round(),
+        ]
+    else:
+        keys = [offers_df["location_long"], offers_df["location_lat"]]
+
+    df_new = (
+        offers_df.groupby(keys, sort=False)
+        .agg(
+            price_per_square=("price_per_square", "mean"),
+            offers_count=("price_per_square", "size"),
+            location_long=("location_long", "first"),
+            location_lat=("location_lat", "first"),
+        )
+        .reset_index(drop=True)
     )
-
-    df_new = pd.DataFrame(
-        columns=["price_per_square", "coordinates", "location_long", "location_lat"]
+    df_new["coordinates"] = (
+        df_new["location_long"].astype(str) + ", " + df_new["location_lat"].astype(str)
     )
 
-    for pair in orginal_df["coordinates"].unique():
-        price = orginal_df[orginal_df["coordinates"] == pair]["price_per_square"].mean()
-        loc_lat = orginal_df[orginal_df["coordinates"] == pair]["location_lat"].iloc[0]
-        loc_long = orginal_df[orginal_df["coordinates"] == pair]["location_long"].iloc[
-            0
+    return df_new[
+        [
+            "price_per_square",
+            "offers_count",
+            "coordinates",
+            "location_long",
+            "location_lat",
         ]
-        df_new = df_new.append(
-            pd.Series([price, pair, loc_long, loc_lat], index=df_new.columns),
-            ignore_index=True,
-        )
+    ]
 
-    return df_new
 
-
-def gdf_drop_unique(gdf):
+def offers_data_prep(file_name, tolerance=None):
     """
-    - create GeoPandasDataFrame where similar polygons with the same coordinates
-    replaced one with mean price
-    - create column "geoid"
+    create new column "coordinates"  = (longitude, latitude)
+    apartments with the same coordinates replaced one with mean price
+    drop unnecessary columns
 
-    :param gdf: GeoPandasDataFrame with several prices to one polygon
-    :return: GeoPandasDataFrame with mean price to one polygon
+    :param file_name: name of file with offers data (parquet or xlsx)
+    :param tolerance: grid snapping step (degrees) of coordinates,
+                      see group_offers_by_location
+    :return: pandas.DataFrame with modified data
     """
 
-    gdf_new = gpd.GeoDataFrame(columns=["price_per_square", "geometry"])
+    orginal_df = read_offers_file(
+        file_name, ["price_per_square", "location_long", "location_lat"]
+    ).dropna()
 
-    for coord in gdf["geometry"].unique():
-        price = gdf[gdf["geometry"] == coord]["price_per_square"].mean()
-        geometry = gdf[gdf["geometry"] == coord]["geometry"].iloc[0]
-        gdf_new = gdf_new.append(
-            {"price_per_square": price, "geometry": geometry}, ignore_index=True
-        )
+    return group_offers_by_location(orginal_df, tolerance)
+
+
+def cell_price_stats(gdf):
+    """
+    - aggregate prices of offers joined to grid cells in one pass:
+    mean price "price_per_square", "price_count", "price_median",
+    "price_std", "price_min", "price_max" for each cell
+    - "price_count" is number of offers: sum of "offers_count"
+      of locations, number of prices if there is no "offers_count"
+    - create columns "cell_id" (grid index) and "geoid"
+
+    :param gdf: GeoPandasDataFrame with several prices to one polygon,
+                index - grid index of the polygon
+    :return: GeoPandasDataFrame with price statistics to one polygon
+    """
 
+    stats = (
+        gdf["price_per_square"]
+        .groupby(level=0, sort=False)
+        .agg(["mean", "count", "median", "std", "min", "max"])
+    )
+    stats.columns = [
+        "price_per_square",
+        "price_count",
+        "price_median",
+        "price_std",
+        "price_min",
+        "price_max",
+    ]
+    if "offers_count" in gdf:
+        # цены усреднены по адресам, а число объявлений - сумма по адресам
+        stats["price_count"] = gdf["offers_count"].groupby(level=0, sort=False).sum()
+
+    geometry = gdf.geometry[~gdf.index.duplicated()]
+    gdf_new = gpd.GeoDataFrame(
+        stats, geometry=geometry.loc[stats.index].values, crs=gdf.crs
+    )
+    gdf_new["cell_id"] = stats.index
+    gdf_new = gdf_new.reset_index(drop=True)
     gdf_new["geoid"] = gdf_new.index.astype(str)
 
     return gdf_new
@@ -105,9 +181,9 @@ def get_min_max_cord(json_file_name, city):
         return max_lat, max_long, min_lat, min_long
 
 
-def get_grid(max_lat, max_long, min_lat, min_long, step_lat=0.004, step_long=0.0025):
+def grid_axes(max_lat, max_long, min_lat, min_long, step_lat=0.004, step_long=0.0025):
     """
-    Create polygon grid dataframe from min, max coordinates
+    grid lines of polygon grid
 
     :param max_lat: max latitude of city borders
     :param max_long: max longitude of city borders
@@ -115,11 +191,9 @@ def get_grid(max_lat, max_long, min_lat, min_long, step_lat=0.004, step_long=0.0
     :param min_long: min longitude of city borders
     :param step_lat: grid step on latitude
     :param step_long: grid step on latitude
-    :return: GeoPandasDataFrame polygon grid
+    :return: lat_array (x of grid columns), long_array (y of grid rows)
     """
 
-    grid_gdf = gpd.GeoDataFrame()
-
     delta_lat = max_lat - min_lat
     delta_long = max_long - min_long
     n_lat = delta_lat / step_lat
@@ -127,117 +201,538 @@ def get_grid(max_lat, max_long, min_lat, min_long, step_lat=0.004, step_long=0.0
 
     lat_array = np.linspace(min_lat, max_lat, num=int(n_lat))
     long_array = np.linspace(min_long, max_long, num=int(n_long))
-    len_lat = len(lat_array)
-    len_long = len(long_array)
-
-    for i, long in enumerate(long_array):
-        for j, lat in enumerate(lat_array):
-            print(i, j)
-            if i < (len_long - 1) and j < (len_lat - 1):
-                long_points = [long, long, long_array[i + 1], long_array[i + 1], long]
-                lat_points = [lat, lat_array[j + 1], lat_array[j + 1], lat, lat]
-                geometry = Polygon(zip(lat_points, long_points))
-                square = gpd.GeoDataFrame(index=[0], geometry=[geometry])
-                grid_gdf = grid_gdf.append(square)
+
+    return lat_array, long_array
+
+
+def axis_index(values, axis):
+    """
+    index of the grid interval [axis[i], axis[i + 1]) of every value
+    computed from origin and step of evenly spaced axis
+
+    :param values: numpy array of coordinates
+    :param axis: evenly spaced grid lines
+    :return: numpy array of intervals indexes, -1 for values out of grid
+    """
+
+    n_cells = len(axis) - 1
+    if n_cells < 1:
+        return np.full(len(values), -1)
+
+    step = (axis[-1] - axis[0]) / n_cells
+    index = np.floor((values - axis[0]) / step)
+    index = np.clip(np.nan_to_num(index), 0, n_cells - 1).astype(int)
+    # rounding error of division near grid lines
+    index = index - (values < axis[index]) + (values >= axis[index + 1])
+    out = ~((values >= axis[0]) & (values < axis[-1]))
+
+    return np.where(out, -1, index)
+
+
+def locate_cells(x, y, lat_array, long_array):
+    """
+    row and column of grid cells with points
+
+    :param x: numpy array of points x (location_long of offers)
+    :param y: numpy array of points y (location_lat of offers)
+    :param lat_array: grid lines x
+    :param long_array: grid lines y
+    :return: rows, cols numpy arrays, -1 for points out of grid
+    """
+
+    rows = axis_index(np.asarray(y, dtype=float), long_array)
+    cols = axis_index(np.asarray(x, dtype=float), lat_array)
+    out = (rows < 0) | (cols < 0)
+
+    return np.where(out, -1, rows), np.where(out, -1, cols)
+
+
+def join_prices_to_grid(grid_gdf, offers_df, lat_array, long_array):
+    """
+    attach offers prices to grid cells which contain offers locations,
+    (row, col) of offer cell is computed from grid lines and mapped
+    to grid cell by lookup table
+
+    :param grid_gdf: GeoPandasDataFrame grid cells with "row", "col" columns,
+                     cells of adaptive grid have "size" in grid cells too
+    :param offers_df: pandas.DataFrame with "price_per_square",
+                      "location_long", "location_lat" columns,
+                      "offers_count" of locations is attached too
+    :param lat_array: grid lines x
+    :param long_array: grid lines y
+    :return: GeoPandasDataFrame with one row for each offer in grid,
+             index - grid index of offer cell
+    """
+
+    rows, cols = locate_cells(
+        offers_df["location_long"].to_numpy(),
+        offers_df["location_lat"].to_numpy(),
+        lat_array,
+        long_array,
+    )
+
+    # lookup (row, col) -> position of cell in grid_gdf, -1 - no cell
+    lookup = np.full((max(len(long_array) - 1, 0), max(len(lat_array) - 1, 0)), -1)
+    fill_cells(
+        lookup,
+        grid_gdf["row"].to_numpy(),
+        grid_gdf["col"].to_numpy(),
+        grid_gdf["size"].to_numpy() if "size" in grid_gdf else 1,
+        np.arange(len(grid_gdf)),
+    )
+
+    in_grid = rows >= 0
+    cells = np.full(len(rows), -1)
+    cells[in_grid] = lookup[rows[in_grid], cols[in_grid]]
+    offers = np.flatnonzero(cells >= 0)
+    # cells order of grid, offers order inside cell
+    offers = offers[np.argsort(cells[offers], kind="stable")]
+
+    joined = grid_gdf.iloc[cells[offers]].copy()
+    joined["price_per_square"] = offers_df["price_per_square"].to_numpy()[offers]
+    if "offers_count" in offers_df:
+        joined["offers_count"] = offers_df["offers_count"].to_numpy()[offers]
+
+    return joined
+
+
+def centroid_coordinates(gdf):
+    """
+    coordinates of polygons centroids
+
+    :param gdf: GeoPandasDataFrame with polygons
+    :return: contiguous float64 numpy.array (n, 2) of centroids x, y
+    """
+
+    centroids = shapely.centroid(gdf.geometry.values)
+
+    return np.ascontiguousarray(shapely.get_coordinates(centroids), dtype=np.float64)
+
+
+def cell_polygons(rows, cols, lat_array, long_array, sizes=1):
+    """
+    polygons of grid cells (row, col): long_array[row] - long_array[row + size],
+                                       lat_array[col] - lat_array[col + size]
+
+    :param rows: numpy array of cells rows
+    :param cols: numpy array of cells columns
+    :param lat_array: grid lines x
+    :param long_array: grid lines y
+    :param sizes: numpy array of cells sizes in grid cells or one size of all cells
+    :return: numpy array of shapely polygons
+    """
+
+    lat_0, lat_1 = lat_array[cols], lat_array[cols + sizes]
+    long_0, long_1 = long_array[rows], long_array[rows + sizes]
+
+    # polygon points in the same order as Polygon(zip(lat_points, long_points))
+    points = np.stack(
+        [
+            np.stack([lat_0, lat_1, lat_1, lat_0, lat_0], axis=1),
+            np.stack([long_0, long_0, long_1, long_1, long_0], axis=1),
+        ],
+        axis=2,
+    ).reshape(-1, 2)
+    # one ring of 5 points in every polygon
+    ring_offsets = np.arange(0, len(points) + 1, 5)
+    polygon_offsets = np.arange(len(rows) + 1)
+
+    return shapely.from_ragged_array(
+        shapely.GeometryType.POLYGON, points, (ring_offsets, polygon_offsets)
+    )
+
+
+def get_grid(max_lat, max_long, min_lat, min_long, step_lat=0.004, step_long=0.0025):
+    """
+    Create polygon grid dataframe from min, max coordinates
+
+    :param max_lat: max latitude of city borders
+    :param max_long: max longitude of city borders
+    :param min_lat: min latitude of city borders
+    :param min_long: min longitude of city borders
+    :param step_lat: grid step on latitude
+    :param step_long: grid step on latitude
+    :return: GeoPandasDataFrame polygon grid with "row" (long index)
+             and "col" (lat index) of cells
+    """
+
+    lat_array, long_array = grid_axes(
+        max_lat, max_long, min_lat, min_long, step_lat, step_long
+    )
+
+    rows, cols = np.meshgrid(
+        np.arange(max(len(long_array) - 1, 0)),
+        np.arange(max(len(lat_array) - 1, 0)),
+        indexing="ij",
+    )
+    rows, cols = rows.ravel(), cols.ravel()
+    geometry = cell_polygons(rows, cols, lat_array, long_array)
+
+    grid_gdf = gpd.GeoDataFrame({"row": rows, "col": cols}, geometry=geometry)
 
     return grid_gdf
 
 
-def main():
+def boundary_segments(geometry):
+    """
+    :param geometry: shapely polygon or multipolygon
+    :return: numpy array of two points linestrings of geometry boundary
+    """
+
+    lines = shapely.get_parts(shapely.boundary(geometry))
+    coords, line_index = shapely.get_coordinates(lines, return_index=True)
+    same_line = line_index[:-1] == line_index[1:]
+    segments = np.stack([coords[:-1], coords[1:]], axis=1)[same_line]
+
+    return shapely.linestrings(segments)
+
+
+def boundary_cells(tree, geometry):
+    """
+    :param tree: shapely.STRtree of grid cells
+    :param geometry: shapely polygon or multipolygon
+    :return: boolean numpy array, True for cells crossed by geometry boundary
+    """
+
+    crossed = np.zeros(len(tree.geometries), dtype=bool)
+    _, cells = tree.query(boundary_segments(geometry), predicate="intersects")
+    crossed[cells] = True
+
+    return crossed
+
+
+def inside_cells(cells, geometry):
+    """
+    cells not crossed by geometry boundary are either inside or outside
+    of geometry, so one point of cell is checked
+
+    :param cells: numpy array of grid polygons
+    :param geometry: prepared shapely polygon or multipolygon
+    :return: boolean numpy array, True for cells which centers are in geometry
+    """
+
+    min_x, min_y, max_x, max_y = shapely.bounds(cells).T
+
+    return shapely.contains_xy(geometry, (min_x + max_x) / 2, (min_y + max_y) / 2)
+
+
+def water_mask(file_names):
     """
-    prepare data from 'city_app_app_offers.xlsx'
-    create polygonal grid of the city with mean prices for polygons
+    :param file_names: list of json files with water objects borders
+    :return: union of water objects, None if there are no files
+    """
+
+    if not file_names:
+        return None
+
+    water = [gpd.read_file(file_name).geometry for file_name in file_names]
+
+    return shapely.union_all(pd.concat(water).values)
+
+
+def bound_grid(grid_df, border, water=None):
+    """
+    cells of grid within city border and disjoint with water objects,
+    exact predicates are computed only for cells crossed by boundaries
+
+    :param grid_df: GeoPandasDataFrame polygon grid
+    :param border: shapely polygon or multipolygon of city border
+    :param water: shapely polygon or multipolygon of water objects or None
+    :return: GeoPandasDataFrame with cells of grid in city bounds
+    """
+
+    cells = grid_df.geometry.values
+    tree = shapely.STRtree(cells)
+    shapely.prepare(border)
+
+    crossed = boundary_cells(tree, border)
+    keep = inside_cells(cells, border) & ~crossed
+    keep[crossed] = shapely.within(cells[crossed], border)
+
+    if water is not None:
+        shapely.prepare(water)
+        keep &= ~boundary_cells(tree, water)
+        keep[keep] = ~inside_cells(cells[keep], water)
+
+    return grid_df[keep]
+
+
+def write_gpkg(gdf, file_name):
+    """
+    write GeoPackage file, shapefiles folder with the same name
+    written by previous versions is replaced
+
+    :param gdf: GeoPandasDataFrame
+    :param file_name: '.gpkg' file name
+    """
+
+    if os.path.isdir(file_name):
+        shutil.rmtree(file_name)
+    gdf.to_file(file_name, driver="GPKG")
+
+
+def remove_gpkg(file_name):
+    """
+    remove GeoPackage file or shapefiles folder with the same name
+    written by previous versions
+
+    :param file_name: '.gpkg' file name
+    """
+
+    if os.path.isdir(file_name):
+        shutil.rmtree(file_name)
+    elif os.path.exists(file_name):
+        os.remove(file_name)
+
+
+def grid_key(city, step_lat=0.004, step_long=0.0025):
+    """
+    :param city: city key
+    :param step_lat: grid step on latitude
+    :param step_long: grid step on latitude
+    :return: sha1 hex digest of city border and water objects json files
+             content and grid steps
+    """
+
+    digest = hashlib.sha1(f"{step_lat!r} {step_long!r}".encode())
+    for file_name in [f"Data_preproc/{city}_geo.json"] + CITY_WATER[city]:
+        with open(file_name, "rb") as file:
+            digest.update(hashlib.sha1(file.read()).digest())
+
+    return digest.hexdigest()
+
+
+def city_grid(city, step_lat=0.004, step_long=0.0025):
+    """
+    grid of the city in city bounds without water objects:
+    - from memory if it was built or read in this run
+    - from 'grid_city_bound.gpkg' if 'grid_city_bound.key' has the same key
+    - otherwise grid is built and saved to these files
+
+    :param city: city key
+    :param step_lat: grid step on latitude
+    :param step_long: grid step on latitude
+    :return: GeoPandasDataFrame with grid cells in city bounds
+    """
+
+    key = grid_key(city, step_lat, step_long)
+    if key in GRID_CACHE:
+        return GRID_CACHE[key]
+
+    file_name = f"Data_preproc/grid_{city}_bound.gpkg"
+    key_file = f"Data_preproc/grid_{city}_bound.key"
+    saved_key = None
+    if os.path.exists(key_file):
+        with open(key_file) as file:
+            saved_key = file.read().strip()
+
+    if saved_key == key and os.path.isfile(file_name):
+        grid_city_bound = gpd.read_file(file_name)
+    else:
+        geo_city = f"Data_preproc/{city}_geo.json"
+        city_border = gpd.read_file(geo_city)
+        borders = get_min_max_cord(geo_city, city)
+        grid_df = get_grid(*borders, step_lat=step_lat, step_long=step_long)
+        grid_df = grid_df.set_crs(epsg=4326)
+        grid_city_bound = bound_grid(
+            grid_df, city_border.at[0, "geometry"], water_mask(CITY_WATER[city])
+        ).reset_index(drop=True)
+
+        write_gpkg(grid_city_bound, file_name)
+        with open(key_file, "w") as file:
+            file.write(key)
+
+    GRID_CACHE[key] = grid_city_bound
+
+    return grid_city_bound
+
+
+def build_city_grid(city):
+    """
+    build or check 'grid_city_bound.gpkg' before apartment type jobs use it
+
+    :param city: city key
+    """
+
+    city_grid(city)
+
+
+def adaptive_file(city):
+    """
+    :param city: city key
+    :return: GeoPackage file name of adaptive grid of the city
+    """
+
+    return f"Data_preproc/grid_{city}_adaptive.gpkg"
+
+
+def adaptive_axes(city):
+    """
+    :param city: city key
+    :return: lat_array, long_array of the smallest cells of adaptive grid
+    """
+
+    geo_city = f"Data_preproc/{city}_geo.json"
+
+    return fine_axes(*grid_axes(*get_min_max_cord(geo_city, city)))
+
+
+def build_adaptive_grid(city, apps):
+    """
+    quadtree grid of the city in 'grid_city_adaptive.gpkg': root cells are
+    2**COARSE_LEVELS x 2**COARSE_LEVELS cells of fixed grid, cells with many
+    offers of all apartment types are split down to fixed grid cells split
+    2**FINE_LEVELS x 2**FINE_LEVELS times, cells out of the city are dropped,
+    city bounds are the same as bounds of fixed grid
+
+    columns: "cell_id" - hierarchical id (quadtree.quad_ids), "level",
+    "row", "col" - the first cell and "size" in the smallest cells
+
+    :param city: city key
+    :param apps: apartment types keys
+    """
+
+    lat_array, long_array = adaptive_axes(city)
+    shape = (max(len(long_array) - 1, 0), max(len(lat_array) - 1, 0))
+
+    # мелкие ячейки внутри ячеек фиксированной сетки в границах города
+    grid_city_bound = city_grid(city)
+    inside = np.zeros(shape, dtype=bool)
+    fill_cells(
+        inside,
+        grid_city_bound["row"].to_numpy() * 2**FINE_LEVELS,
+        grid_city_bound["col"].to_numpy() * 2**FINE_LEVELS,
+        2**FINE_LEVELS,
+        True,
+    )
+
+    # число объявлений всех типов квартир в мелких ячейках
+    counts = np.zeros(shape, dtype=np.int64)
+    for app in apps:
+        offers_df = offers_data_prep(find_offers_file(city, app))
+        rows, cols = locate_cells(
+            offers_df["location_long"].to_numpy(),
+            offers_df["location_lat"].to_numpy(),
+            lat_array,
+            long_array,
+        )
+        in_grid = rows >= 0
+        offers_count = offers_df["offers_count"].to_numpy()[in_grid]
+        np.add.at(counts, (rows[in_grid], cols[in_grid]), offers_count)
+
+    depth = COARSE_LEVELS + FINE_LEVELS
+    rows, cols, levels = quadtree_cells(counts, inside, depth)
+    sizes = 2 ** (depth - levels)
+    grid_gdf = gpd.GeoDataFrame(
+        {
+            "cell_id": quad_ids(rows, cols, levels, depth),
+            "level": levels,
+            "row": rows,
+            "col": cols,
+            "size": sizes,
+        },
+        geometry=cell_polygons(rows, cols, lat_array, long_array, sizes),
+        crs="EPSG:4326",
+    )
+    write_gpkg(grid_gdf, adaptive_file(city))
 
-    :return:
-    grid from nim, max coordinates in 'grid_city.shp' file
+
+def adaptive_key(city, grid_gdf):
+    """
+    :param city: city key
+    :param grid_gdf: GeoPandasDataFrame with cells of adaptive grid
+    :return: sha1 hex digest of grid_key of fixed grid and cells ids
+    """
+
+    digest = hashlib.sha1(grid_key(city).encode())
+    digest.update(" ".join(grid_gdf["cell_id"]).encode())
+
+    return digest.hexdigest()
+
+
+def adaptive_grid(city):
+    """
+    :param city: city key
+    :return: GeoPandasDataFrame with cells of adaptive grid
+             from 'grid_city_adaptive.gpkg'
+    """
+
+    return gpd.read_file(adaptive_file(city))
+
+
+def city_prices(city, app, adaptive=False):
+    """
+    mean prices of offers in grid cells of the city
+
+    :param city: city key
+    :param app: apartment type key
+    :param adaptive: cells of adaptive grid, "cell_id" is hierarchical id
+    :return: grid with mean prices in 'city_app_grid_gpd.gpkg' file
+    """
+
+    if adaptive:
+        # ячейки адаптивной сетки с иерархическими номерами
+        grid_city_bound = adaptive_grid(city).set_index("cell_id")
+        lat_array, long_array = adaptive_axes(city)
+    else:
+        # сетка в границах города без водоемов
+        grid_city_bound = city_grid(city)
+        # линии сетки
+        geo_city = f"Data_preproc/{city}_geo.json"
+        lat_array, long_array = grid_axes(*get_min_max_cord(geo_city, city))
+    # дынные из объявлений с усредненной ценой по одинковым точкам
+    city_df_unique = offers_data_prep(find_offers_file(city, app))
+    # привязываем к полигонаальной сетке цены из объявлений
+    # по номеру строки и столбца ячейки
+    city_grid_temp = join_prices_to_grid(
+        grid_city_bound, city_df_unique, lat_array, long_array
+    )
+    # статистика цен по каждому полигону
+    # сохраняем в файл
+    city_grid_prices = cell_price_stats(city_grid_temp)
+    write_gpkg(city_grid_prices, f"Data_preproc/{city}_{app}_grid_gpd.gpkg")
+
+
+def main(workers=WORKERS, adaptive=False):
+    """
+    prepare data from 'city_app_app_offers.parquet' ('.xlsx' if there is no parquet)
+    create polygonal grid of the city with mean prices for polygons,
+    cities and apartment types are processed in parallel processes
+
+    :param workers: number of processes
+    :param adaptive: mean prices in cells of adaptive grid of offers density
+                     ('grid_city_adaptive.gpkg') instead of fixed grid
+    :return: dict {job: {"error": traceback text or None, "time": seconds}}
     grid in city bounds without water objects in 'grid_city_bound.gpkg' file
+    (built again only if city borders, water objects or grid steps changed)
     grid with mean prices in 'city_app_grid_gpd.gpkg' file
     """
 
     cities = ["Mos", "SPb", "Ekb"]
     app_type = ["sec", "new"]
 
-    for city in cities:
-        # границы города JSON
-        geo_city = f"Data_preproc/{city}_geo.json"
-        city_border = gpd.read_file(geo_city)
-        # мин и макс координаты границ города
-        max_lat, max_long, min_lat, min_long = get_min_max_cord(geo_city, city)
-        # строим сетку по мин макс координатам
-        grid_df = get_grid(max_lat, max_long, min_lat, min_long)
-        # сохраняем сетку в файл
-        grid_df.to_file(f"Data_preproc/grid_{city}.shp")
-        # читаем сетку из файла
-        grid_df = gpd.read_file(f"Data_preproc/grid_{city}.shp").drop("FID", axis=1)
-        grid_df = grid_df.set_crs(epsg=4326)
+    # сетки городов из файла, если границы и шаг сетки не изменились
+    results = run_jobs(build_city_grid, [(city,) for city in cities], workers)
+    failed = {job[0] for job in failed_jobs(results)}
+    if adaptive:
+        # адаптивные сетки по плотности объявлений всех типов квартир
+        adaptive_jobs = [
+            (city, tuple(app_type)) for city in cities if city not in failed
+        ]
+        results.update(run_jobs(build_adaptive_grid, adaptive_jobs, workers))
+        failed |= {job[0] for job in failed_jobs(results)}
+    # цены в ячейках сетки для каждого города и типа квартир
+    jobs = [
+        (city, app, adaptive)
+        for city in cities
+        if city not in failed
+        for app in app_type
+    ]
+    results.update(run_jobs(city_prices, jobs, workers))
 
-        if city == "SPb":
-            # границы береговой линии финского залива
-            geo_fin_gulf = "Data_preproc/Fin_gulf_geo.json"
-            fin_gulf_border = gpd.read_file(geo_fin_gulf)
-            # строим полигональную сетку в границах города без Финского залива
-            # сохраняем в файл
-            grid_city_bound = grid_df[grid_df.within(city_border.at[0, "geometry"])]
-            grid_city_bound_fin_out = grid_city_bound[
-                grid_city_bound.disjoint(fin_gulf_border.at[0, "geometry"])
-            ]
-            grid_city_bound_fin_out.to_file(f"Data_preproc/grid_{city}_bound.gpkg")
-            # print(f"сохранили сетку в границах {city} в файл")
-        elif city == "Ekb":
-            # строим полигональную сетку в границах города без водоемов
-            # сохраняем в файл
-            grid_city_bound = grid_df[grid_df.within(city_border.at[0, "geometry"])]
-
-            for i in range(1, 6):
-                vod = f"Data_preproc/{city}_vod{i}.json"
-                vod_border = gpd.read_file(vod)
-                grid_city_bound = grid_city_bound[
-                    grid_city_bound.disjoint(vod_border.at[0, "geometry"])
-                ]
-
-            grid_city_bound.to_file(f"Data_preproc/grid_{city}_bound.gpkg")
-            # print(f"сохранили сетку в границах {city} в файл")
-        else:
-            # строим полигональную сетку в границах города
-            # сохраняем в файл
-            grid_city_bound = grid_df[
-                grid_df.within(city_border.at[0, "geometry"])
-            ]  # сетка в границах города
-            grid_city_bound.to_file(
-                f"Data_preproc/grid_{city}_bound.gpkg"
-            )  # сохраняем сетку в границах города в файл
-            # print(f"сохранили сетку в границах {city} в файл")
-
-        for app in app_type:
-            # дынные из объявлений с усредненной ценой по одинковым точкам
-            city_df_unique = offers_data_prep(
-                f"Data_from_web/{city}_{app}_app_offers.xlsx"
-            )
-            #  читаем сетку в границах города из файла
-            grid_city_bound = gpd.read_file(f"Data_preproc/grid_{city}_bound.gpkg")
-            # данные из объявлений переводим в геофрэйм
-            city_gdf_unique = gpd.GeoDataFrame(
-                city_df_unique,
-                geometry=gpd.points_from_xy(
-                    city_df_unique.location_long, city_df_unique.location_lat
-                ),
-            )
-            city_gdf_unique["geoid"] = city_gdf_unique.index.astype(str)
-            city_gdf = city_gdf_unique[["price_per_square", "geometry"]]
-            city_gdf = city_gdf.set_crs(epsg=4326)
-            # привязываем к полигонаальной сетке цены из объявлений
-            city_grid_temp = gpd.sjoin(
-                grid_city_bound, city_gdf, how="inner", op="contains"
-            )
-            city_grid_temp["geoid"] = city_grid_temp.index.astype(str)
-            city_grid_temp = city_grid_temp[["geoid", "price_per_square", "geometry"]]
-            # усредняем цену по каждому полигону
-            # сохраняем в файл
-            city_grid_prices = gdf_drop_unique(city_grid_temp)
-            city_grid_prices = city_grid_prices.set_crs(epsg=4326)
-            city_grid_prices.to_file(f"Data_preproc/{city}_{app}_grid_gpd.gpkg")
-            # print(f"сохранили сетка с усредненной ценой {city} {app} в файл")
+    return results
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     main()
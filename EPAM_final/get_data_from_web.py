@@ -3,36 +3,107 @@ Get data with apartments offers details from real estate website
 """
 
 import asyncio
+import bisect
+import logging
+import math
+import os
+import re
+import time
 from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
 import aiohttp
 import pandas as pd
 from bs4 import BeautifulSoup
 
+from checkpoint import Checkpoint
+from offers_storage import OFFERS_SCHEMA, OffersWriter, export_xlsx, offers_file
+from page_cache import PageCache
+
+OFFERS_COLUMNS = OFFERS_SCHEMA.names
+
+# streaming crawler settings
+CONCURRENCY = 20  # requests in flight
+LIMIT_PER_HOST = 10  # open connections to one host
+KEEPALIVE_TIMEOUT = 30  # seconds to keep idle connection open
+WORKERS = os.cpu_count() or 1  # parser processes
+QUEUE_SIZE = 100  # downloaded pages waiting for parser
+RETRIES = 3  # retries of failed request
+MAX_PAGES = 1000  # listing pages of one search at most
+BACKOFF = 1  # seconds before the first retry, doubled on every next one
+TIMEOUT = aiohttp.ClientTimeout(total=60)
+
+logger = logging.getLogger(__name__)
+
+
+async def fetch_html(client, url: str, retries=RETRIES, backoff=BACKOFF):
+    """
+    fetch response from http's,
+    retry on connection errors, timeouts, 429 and 5xx responses
+    with "backoff" * 2 ** attempt seconds pause
+
+    :param client: aiohttp.ClientSession
+    :param url: page url
+    :param retries: number of retries
+    :param backoff: pause before the first retry in seconds
+    :return: page html
+    """
+
+    for attempt in range(retries + 1):
+        try:
+            async with client.get(url) as resp:
+                resp.raise_for_status()
+                return await resp.text()
+        except aiohttp.ClientResponseError as error:
+            if attempt == retries or (error.status < 500 and error.status != 429):
+                raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == retries:
+                raise
+
+        await asyncio.sleep(backoff * 2**attempt)
+
+
+async def fetch_or_none(client, url: str, failed=None):
+    """
+    fetch page html, errors don't stop the crawl:
+    they are logged and saved to "failed"
+
+    :param client: aiohttp.ClientSession
+    :param url: page url
+    :param failed: dict {url: error} of failed urls
+    :return: page html or None
+    """
+
+    try:
+        return await fetch_html(client, url)
+    except Exception as error:  # pylint: disable=broad-except
+        if isinstance(error, aiohttp.ClientResponseError):
+            error = f"HTTP {error.status} {error.message}"
+        else:
+            error = repr(error)
+        logger.warning("%s: %s", url, error)
+        if failed is not None:
+            failed[url] = error
+        return None
+
 
 def get_htmls(url_list: list):
     """
-    return list of htmls from list or urls
+    return list of htmls from list or urls,
+    html is None if page was not downloaded
 
     :param url_list: list of urls
     :return: htmls of given urls
     """
 
-    async def fetch_html(client, url: str):
-        """
-        fetch response from http's
-        """
-
-        async with client.get(url) as resp:
-            return await resp.text()
-
     async def get_task(urls: list):
         """
         get html pages
         """
 
-        async with aiohttp.ClientSession() as client:
-            task = [asyncio.create_task(fetch_html(client, url)) for url in urls]
+        async with aiohttp.ClientSession(timeout=TIMEOUT) as client:
+            task = [asyncio.create_task(fetch_or_none(client, url)) for url in urls]
             await asyncio.gather(*task)
 
         return task
@@ -43,16 +114,241 @@ def get_htmls(url_list: list):
     return htmls
 
 
-def get_links(html: str) -> list:
+def create_session(
+    concurrency=CONCURRENCY,
+    limit_per_host=LIMIT_PER_HOST,
+    keepalive_timeout=KEEPALIVE_TIMEOUT,
+):
+    """
+    create one pooled http session for the whole crawl
+
+    :param concurrency: max number of open connections
+    :param limit_per_host: max number of open connections to one host
+    :param keepalive_timeout: seconds to keep idle connection alive
+    :return: aiohttp.ClientSession
+    """
+
+    connector = aiohttp.TCPConnector(
+        limit=concurrency,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=keepalive_timeout,
+    )
+
+    return aiohttp.ClientSession(connector=connector, timeout=TIMEOUT)
+
+
+async def stream_htmls(client, urls, concurrency=CONCURRENCY, failed=None):
+    """
+    download pages keeping "concurrency" requests in flight
+    and yield them as soon as they are ready (not in url order),
+    pages which were not downloaded after retries are saved to "failed"
+
+    :param client: aiohttp.ClientSession
+    :param urls: iterable of urls
+    :param concurrency: max number of requests in flight
+    :param failed: dict {url: error} of failed urls
+    :return: async generator of (url, html)
+    """
+
+    async def fetch_page(url: str):
+        """
+        fetch response from http's
+        """
+
+        return url, await fetch_or_none(client, url, failed)
+
+    urls = iter(urls)
+    pending = {
+        asyncio.ensure_future(fetch_page(url)) for url in islice(urls, concurrency)
+    }
+
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for url in islice(urls, len(done)):
+                pending.add(asyncio.ensure_future(fetch_page(url)))
+            for task in done:
+                url, html = task.result()
+                if html is not None:
+                    yield url, html
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def class_positions(html, name):
+    """
+    positions of css class name as a whole word in html
+
+    :param html: page html
+    :param name: css class name
+    :return: generator of positions
+    """
+
+    word_chars = "-_"
+    pos = html.find(name)
+    while pos != -1:
+        end = pos + len(name)
+        before = html[pos - 1] if pos else " "
+        after = html[end] if end < len(html) else " "
+        if not (before.isalnum() or before in word_chars) and not (
+            after.isalnum() or after in word_chars
+        ):
+            yield pos
+        pos = html.find(name, end)
+
+
+# css classes and precompiled patterns for fast extractors
+HEADLINE_CLASS = "offer__headline"
+HEADLINE_LINK = re.compile(r'<div class="offer__headline"><a href="([^"&]*)"')
+
+UPDATED_CLASS = "offer__updated"
+UPDATED = re.compile(r'<div class="offer__updated">([^<&]*)</div>')
+
+FULL_SQUARE_CLASS = "section_type_full-square"
+FULL_SQUARE = re.compile(
+    r'<div class="offer-detail__section-item section_type_full-square">'
+    r'<div class="offer-detail__section-item-header">[^<]*</div>'
+    r'<div class="offer-detail__section-item-body">([^<&]*)</div>'
+)
+SUBLOCALITY_CLASS = "offer-detail__sublocality"
+SUBLOCALITY = re.compile(r'<div class="offer-detail__sublocality">(.*?)</div>')
+PRICE_CLASS = "offer-detail__price-per-square-rur"
+PRICE = re.compile(r'<div class="offer-detail__price-per-square-rur">([^<&]*)</div>')
+MAP_CLASS = "offer-detail__map"
+MAP_SCRIPT = re.compile(
+    r'<div class="offer-detail__map">(?:(?!<script|<!--).)*?'
+    r"<script(?:\s[^>]*)?>([^<]+)</script>",
+    re.DOTALL | re.IGNORECASE,
+)
+REFRESH_CLASS = "offer-detail__refresh"
+REFRESH = re.compile(r'<div class="offer-detail__refresh">([^<&]*)</div>')
+TAG = re.compile(r"<[^>]*>")
+TEXT_UNSAFE = re.compile(r"&|<!|<script|<style|<div", re.IGNORECASE)
+
+# offer refresh time on website: "только что", "36 минут назад", "2 дня назад"
+RELATIVE_TIME = re.compile(r"(\d+)?\s*(минут|час|день|дн|недел|месяц)\w*\s+назад")
+TIME_UNITS = {
+    "минут": 60,
+    "час": 3600,
+    "день": 24 * 3600,
+    "дн": 24 * 3600,
+    "недел": 7 * 24 * 3600,
+    "месяц": 30 * 24 * 3600,
+}
+
+# "Вторичные квартиры в г. Санкт-Петербурге от 1,78 млн ₽ – 9 087 предложений"
+OFFERS_STAT = re.compile(r'<div class="offer__stat"><h3>(.*?)</h3>', re.DOTALL)
+OFFERS_TOTAL = re.compile(r"(\d[\d\s]*)\s+предложени")
+
+
+class FastParseError(Exception):
+    """
+    page markup differs from the expected one, fast extractor can't be used
+    """
+
+
+def fast_element(html, class_name, pattern, marker_len):
+    """
+    find first element with css class "class_name" by precompiled pattern
+
+    :param html: page html
+    :param class_name: css class name
+    :param pattern: compiled element pattern, group 1 - element content
+    :param marker_len: length of '<div class="' before class name in pattern
+    :return: element content or None if there is no such class on page
+    """
+
+    first = next(class_positions(html, class_name), None)
+    if first is None:
+        return None
+
+    match = pattern.match(html, first - marker_len)
+    if match is None:
+        raise FastParseError(class_name)
+
+    return match.group(1)
+
+
+def fast_links(html: str) -> list:
+    """
+    get offers links from 1 website page with precompiled patterns
+
+    :param html: 1 page from website with offers
+    :return: list of links from 1 page
     """
-    parse given html and
-    create list - [
-                    app1 offer link,
-                    app2 offer link,
-                    app3 offer link,
-                    ...
-                    ]
-                    from 1 website page
+
+    marker_len = len('<div class="')
+    matches = list(HEADLINE_LINK.finditer(html))
+    positions = list(class_positions(html, HEADLINE_CLASS))
+    if positions != [match.start() + marker_len for match in matches]:
+        raise FastParseError(HEADLINE_CLASS)
+
+    links = [f"https://www.realtymag.ru{match.group(1)}" for match in matches]
+
+    return links
+
+
+def fast_listing(html: str) -> list:
+    """
+    get offers links and refresh times from 1 website page
+    with precompiled patterns
+
+    :param html: 1 page from website with offers
+    :return: list of (link, refresh time) from 1 page
+    """
+
+    links = fast_links(html)
+    marker_len = len('<div class="')
+    updated = []
+    for pos in class_positions(html, UPDATED_CLASS):
+        match = UPDATED.match(html, pos - marker_len)
+        if match is None:
+            raise FastParseError(UPDATED_CLASS)
+        updated.append((pos, match.group(1)))
+
+    listing = []
+    positions = [pos for pos, _ in updated]
+    for link, headline in zip(links, class_positions(html, HEADLINE_CLASS)):
+        i = bisect.bisect(positions, headline)
+        listing.append((link, updated[i][1] if i < len(updated) else None))
+
+    return listing
+
+
+def fast_offer_texts(html: str) -> tuple:
+    """
+    get offer page elements texts with precompiled patterns
+
+    :param html: offers page html
+    :return: live square, microdistrict, price per square,
+             map script, refresh time texts
+    """
+
+    marker_len = len('<div class="')
+    live_square = fast_element(
+        html,
+        FULL_SQUARE_CLASS,
+        FULL_SQUARE,
+        len('<div class="offer-detail__section-item '),
+    )
+    microdistrict = fast_element(html, SUBLOCALITY_CLASS, SUBLOCALITY, marker_len)
+    if microdistrict is not None:
+        if TEXT_UNSAFE.search(microdistrict):
+            raise FastParseError(SUBLOCALITY_CLASS)
+        microdistrict = TAG.sub("", microdistrict)
+    price_per_square = fast_element(html, PRICE_CLASS, PRICE, marker_len)
+    location = fast_element(html, MAP_CLASS, MAP_SCRIPT, marker_len)
+    refresh_time = fast_element(html, REFRESH_CLASS, REFRESH, marker_len)
+
+    return live_square, microdistrict, price_per_square, location, refresh_time
+
+
+def soup_links(html: str) -> list:
+    """
+    get offers links from 1 website page with BeautifulSoup
 
     :param html: 1 page from website with offers
     :return: list of links from 1 page
@@ -67,20 +363,31 @@ def get_links(html: str) -> list:
     return links
 
 
-def get_offers(html: str) -> dict:
+def soup_listing(html: str) -> list:
     """
-    parse given html and
-    create dict - {
-                  "live_square": live_square
-                  "microdistrict": microdistrict,
-                  "price_per_square": price_per_square,
-                  "location_lat": location_lat,
-                  "location_long": location_long,
-                  "refresh_time": refresh_time,
-                  }
+    get offers links and refresh times from 1 website page with BeautifulSoup
+
+    :param html: 1 page from website with offers
+    :return: list of (link, refresh time) from 1 page
+    """
+
+    listing = []
+    soup = BeautifulSoup(html, features="html.parser")
+    for href in soup.find_all("div", class_="offer__headline"):
+        link = f'https://www.realtymag.ru{href.a.get("href")}'
+        updated = href.find_next("div", class_="offer__updated")
+        listing.append((link, updated.get_text() if updated else None))
+
+    return listing
+
+
+def soup_offer_texts(html: str) -> tuple:
+    """
+    get offer page elements texts with BeautifulSoup
 
     :param html: offers page html
-    :return: offers data dict
+    :return: live square, microdistrict, price per square,
+             map script, refresh time texts
     """
 
     soup = BeautifulSoup(html, features="html.parser")
@@ -92,7 +399,6 @@ def get_offers(html: str) -> dict:
         live_square = live_square_section.find(
             "div", class_="offer-detail__section-item-body"
         ).get_text()
-        live_square = float(live_square.split()[0])
     except AttributeError:
         live_square = None
 
@@ -105,26 +411,50 @@ def get_offers(html: str) -> dict:
         price_per_square = soup.find(
             "div", class_="offer-detail__price-per-square-rur"
         ).get_text()
-        price_per_square = price_per_square.rstrip("₽/м²")
-        price_per_square = float("".join(price_per_square.split()))
     except AttributeError:
         price_per_square = None
 
     try:
         location_section = soup.find("div", class_="offer-detail__map")
-        text = location_section.find_next("script").string
-        location_lat = float(text.split(",")[1])
-        location_long = float(text.split(",")[2].split(")")[0])
+        location = location_section.find_next("script").string
     except AttributeError:
-        location_lat = None
-        location_long = None
+        location = None
 
     try:
         refresh_time = soup.find("div", class_="offer-detail__refresh").get_text()
     except AttributeError:
         refresh_time = None
 
-    offer_data = {
+    return live_square, microdistrict, price_per_square, location, refresh_time
+
+
+def offer_data(live_square, microdistrict, price_per_square, location, refresh_time):
+    """
+    convert offer page elements texts to offers data dict
+
+    :param live_square: full square text
+    :param microdistrict: sublocality text
+    :param price_per_square: price per square text
+    :param location: map script text
+    :param refresh_time: refresh time text
+    :return: offers data dict
+    """
+
+    if live_square is not None:
+        live_square = float(live_square.split()[0])
+
+    if price_per_square is not None:
+        price_per_square = price_per_square.rstrip("₽/м²")
+        price_per_square = float("".join(price_per_square.split()))
+
+    if location is not None:
+        location_lat = float(location.split(",")[1])
+        location_long = float(location.split(",")[2].split(")")[0])
+    else:
+        location_lat = None
+        location_long = None
+
+    return {
         "live_square": live_square,
         "microdistrict": microdistrict,
         "price_per_square": price_per_square,
@@ -133,23 +463,158 @@ def get_offers(html: str) -> dict:
         "refresh_time": refresh_time,
     }
 
-    return offer_data
 
+def get_links(html: str) -> list:
+    """
+    parse given html and
+    create list - [
+                    app1 offer link,
+                    app2 offer link,
+                    app3 offer link,
+                    ...
+                    ]
+                    from 1 website page
+
+    precompiled patterns are used, BeautifulSoup - if page markup is unexpected
+
+    :param html: 1 page from website with offers
+    :return: list of links from 1 page
+    """
+
+    try:
+        return fast_links(html)
+    except FastParseError:
+        return soup_links(html)
+
+
+def get_listing(html: str) -> list:
+    """
+    parse given html and
+    create list - [
+                    (app1 offer link, app1 refresh time),
+                    (app2 offer link, app2 refresh time),
+                    ...
+                    ]
+                    from 1 website page
+
+    :param html: 1 page from website with offers
+    :return: list of (link, refresh time) from 1 page
+    """
+
+    try:
+        return fast_listing(html)
+    except FastParseError:
+        return soup_listing(html)
+
+
+def refresh_timestamp(refresh_time, now):
+    """
+    convert offer refresh time text to timestamp,
+    the latest possible time is taken: "2 часа назад" - now - 2 hours
+
+    :param refresh_time: refresh time text from website
+    :param now: timestamp of page download
+    :return: timestamp or None if text format is unknown
+    """
+
+    if refresh_time is None:
+        return None
+
+    refresh_time = refresh_time.strip().lower()
+    if refresh_time == "только что":
+        return now
 
-def get_list_offers_link(url, step) -> list:
+    match = RELATIVE_TIME.fullmatch(refresh_time)
+    if match is None:
+        return None
+
+    number = int(match.group(1)) if match.group(1) else 1
+    return now - number * TIME_UNITS[match.group(2)]
+
+
+def get_pages_count(html: str, per_page: int):
+    """
+    get number of listing pages from total offers number on the first page
+
+    :param html: first page from website with offers
+    :param per_page: number of offers on the first page
+    :return: number of pages or None if total offers number is not found
+    """
+
+    stat = OFFERS_STAT.search(html)
+    if stat is None or not per_page:
+        return None
+
+    total = OFFERS_TOTAL.search(TAG.sub("", stat.group(1)))
+    if total is None:
+        return None
+
+    return math.ceil(int("".join(total.group(1).split())) / per_page)
+
+
+def offer_id(link):
+    """
+    :param link: offer url
+    :return: offer id
+    """
+
+    return link.split("/")[-1]
+
+
+def soup_offers(html: str) -> dict:
+    """
+    parse given html with BeautifulSoup
+
+    :param html: offers page html
+    :return: offers data dict
+    """
+
+    return offer_data(*soup_offer_texts(html))
+
+
+def get_offers(html: str) -> dict:
+    """
+    parse given html and
+    create dict - {
+                  "live_square": live_square
+                  "microdistrict": microdistrict,
+                  "price_per_square": price_per_square,
+                  "location_lat": location_lat,
+                  "location_long": location_long,
+                  "refresh_time": refresh_time,
+                  }
+
+    precompiled patterns are used, BeautifulSoup - if page markup is unexpected
+
+    :param html: offers page html
+    :return: offers data dict
+    """
+
+    try:
+        texts = fast_offer_texts(html)
+    except FastParseError:
+        texts = soup_offer_texts(html)
+
+    return offer_data(*texts)
+
+
+def get_list_offers_link(url, step, last_page=None) -> list:
     """
     create pool of "step" website pages to get offers urls in parallel
 
     :param url: website url
     :param step: step of pool
+    :param last_page: number of the last listing page
     :return: list of offers urls from pool of "steps" pages
     """
 
-    url_list = [f"{url}&page={i}" for i in range(step, step + 20)]
+    end = step + 20 if last_page is None else min(step + 20, last_page + 1)
+    url_list = [f"{url}&page={i}" for i in range(step, end)]
     offers_links_list = []
 
     ayo_html_pages = get_htmls(url_list)
     html_pages = [html.result() for html in ayo_html_pages]
+    html_pages = [html for html in html_pages if html is not None]
 
     if __name__ == "__main__":
         with ProcessPoolExecutor() as pool:
@@ -168,31 +633,27 @@ def get_offers_data(offers_links_list):
     :return: pandas.DataFrame with offers data
     """
 
-    offers_df = pd.DataFrame(
-        columns=[
-            "offer_id",
-            "price_per_square",
-            "live_square",
-            "microdistrict",
-            "location_lat",
-            "location_long",
-            "refresh_time",
-        ]
-    )
+    offers = []
 
     ayo_html_offers = get_htmls(offers_links_list)
     html_offers = [html.result() for html in ayo_html_offers]
+    pages = [
+        (link, html)
+        for link, html in zip(offers_links_list, html_offers)
+        if html is not None
+    ]
+    offers_links_list = [link for link, _ in pages]
+    html_offers = [html for _, html in pages]
 
     if __name__ == "__main__":
         with ProcessPoolExecutor() as pool:
             for link, data_dict in zip(
                 offers_links_list, pool.map(get_offers, html_offers)
             ):
-                offer_id = link.split("/")[-1]
-                data_dict["offer_id"] = offer_id
-                offers_df = offers_df.append(data_dict, ignore_index=True)
+                data_dict["offer_id"] = offer_id(link)
+                offers.append(data_dict)
 
-    return offers_df
+    return pd.DataFrame(offers, columns=OFFERS_COLUMNS)
 
 
 def create_links_file(cities, app_type):
@@ -216,22 +677,434 @@ def create_links_file(cities, app_type):
             url = f"https://www.realtymag.ru/{city}/{app}/prodazha/?type=1&currency=RUR&price_type=all"
             offers_link_list = []
 
-            if app_key == "new" and city_key == "Ekb":
-                for step in range(1, 140, 20):
-                    offers_link_list.extend(get_list_offers_link(url, step))
-                    # print(step)
-            else:
-                for step in range(1, 240, 20):
-                    offers_link_list.extend(get_list_offers_link(url, step))
-                    # print(step)
+            # number of pages from the first page,
+            # if it is not found - until pool of pages without offers
+            first_page = get_htmls([f"{url}&page=1"])[0].result()
+            pages_count = None
+            if first_page is not None:
+                pages_count = get_pages_count(first_page, len(get_links(first_page)))
+            logger.info("%s %s: %s pages", city_key, app_key, pages_count)
+
+            step = 1
+            while step <= min(pages_count or MAX_PAGES, MAX_PAGES):
+                links = get_list_offers_link(url, step, pages_count)
+                # нет новых ссылок: страницы за последней или ошибки
+                if not set(links) - set(offers_link_list):
+                    break
+                offers_link_list.extend(links)
+                step += 20
 
             with open(f"Data_from_web/{city_key}_{app_key}_links.txt", "w") as f_out:
                 f_out.write("\n".join(offers_link_list))
 
 
-def main():
+class Throughput:
+    """
+    pages per second counter for fetch and parse stages of the pipeline
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.fetched = 0
+        self.parsed = 0
+
+    def rates(self):
+        """
+        :return: fetched pages/s, parsed pages/s
+        """
+
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return self.fetched / elapsed, self.parsed / elapsed
+
+    def __str__(self):
+        fetch_rate, parse_rate = self.rates()
+        return (
+            f"fetched {self.fetched} ({fetch_rate:.1f} pages/s), "
+            f"parsed {self.parsed} ({parse_rate:.1f} pages/s)"
+        )
+
+
+async def fetch_parse_pipeline(
+    pages,
+    parser,
+    consumer,
+    pool=None,
+    workers=WORKERS,
+    queue_size=QUEUE_SIZE,
+    counter=None,
+    failed=None,
+):
+    """
+    async fetchers put pages to bounded queue,
+    "workers" parsers take them and run "parser" in the process pool
+    while next pages are downloading
+
+    fetching stops when the queue is full (backpressure),
+    parser errors don't stop the pipeline, they are saved to "failed"
+
+    :param pages: async iterable of (url, html), e.g. stream_htmls
+    :param parser: function html -> parsed data
+    :param consumer: function (url, parsed data) called for every page
+    :param pool: concurrent.futures executor, default - thread pool of the loop
+    :param workers: number of parsers
+    :param queue_size: max number of downloaded pages waiting for parser
+    :param counter: Throughput counter
+    :param failed: dict {url: error} of failed urls
+    :return: Throughput counter
     """
-    create excel files with offers data "city_key_app_key_app_offers.xlsx"
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=queue_size)
+    counter = counter or Throughput()
+
+    async def producer():
+        try:
+            async for url, html in pages:
+                counter.fetched += 1
+                await queue.put((url, html))
+        finally:
+            for _ in range(workers):
+                await queue.put(None)
+
+    async def parse_worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            url, html = item
+            try:
+                result = await loop.run_in_executor(pool, parser, html)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.warning("%s: %r", url, error)
+                if failed is not None:
+                    failed[url] = repr(error)
+                continue
+            counter.parsed += 1
+            consumer(url, result)
+
+    await asyncio.gather(producer(), *[parse_worker() for _ in range(workers)])
+
+    return counter
+
+
+async def stream_links_file(
+    client, url, file_name, pool=None, concurrency=CONCURRENCY, failed=None
+):
+    """
+    download and parse listing pages through the pipeline and
+    write offers urls to file "file_name"
+
+    number of pages is taken from total offers number on the first page,
+    if it is not found - pages are downloaded by "concurrency" pages
+    until the page without offers or the window of pages without new links
+    (all pages failed or site returns pages it has already returned),
+    not more than MAX_PAGES pages
+
+    :param client: aiohttp.ClientSession
+    :param url: website url
+    :param file_name: links file name
+    :param pool: process pool for parsers
+    :param concurrency: max number of requests in flight
+    :param failed: dict {url: error} of failed urls
+    :return: dict {offer url: offer refresh time on listing page}
+    """
+
+    first_page = await fetch_or_none(client, f"{url}&page=1", failed)
+    if first_page is None:
+        return {}
+
+    listing = dict(get_listing(first_page))
+    pages_count = get_pages_count(first_page, len(listing))
+    counter = Throughput()
+    counter.fetched = counter.parsed = 1
+    empty_pages = []
+
+    def consumer(page_url, page_listing):
+        if not page_listing:
+            empty_pages.append(page_url)
+        listing.update(page_listing)
+
+    if pages_count is not None:
+        logger.info("%s: %s pages found", file_name, pages_count)
+        pages = [range(2, min(pages_count, MAX_PAGES) + 1)]
+    else:
+        logger.info("%s: number of pages not found", file_name)
+        pages = (
+            range(i, min(i + concurrency, MAX_PAGES + 1))
+            for i in range(2, MAX_PAGES + 1, concurrency)
+        )
+
+    for window in pages:
+        links_count = len(listing)
+        await fetch_parse_pipeline(
+            stream_htmls(
+                client, [f"{url}&page={i}" for i in window], concurrency, failed
+            ),
+            get_listing,
+            consumer,
+            pool=pool,
+            counter=counter,
+            failed=failed,
+        )
+        # страницы за последней: пустые, с ошибкой или с уже найденными ссылками
+        if empty_pages or len(listing) == links_count:
+            break
+
+    logger.info(
+        "%s: %s offers on %s pages, %s",
+        file_name,
+        len(listing),
+        counter.fetched - len(empty_pages),
+        counter,
+    )
+
+    with open(file_name, "w") as f_out:
+        f_out.write("\n".join(listing))
+
+    return listing
+
+
+async def stream_offers_data(
+    client,
+    listing,
+    writer,
+    pool=None,
+    concurrency=CONCURRENCY,
+    cache=None,
+    failed=None,
+):
+    """
+    download and parse offers pages through the pipeline,
+    parsed offers dicts are passed to "writer" as they come
+
+    with page cache only new offers and offers updated after
+    they were cached are downloaded, others are read from cache
+
+    :param client: aiohttp.ClientSession
+    :param listing: dict {offer url: offer refresh time on listing page}
+                    or offers urls list
+    :param writer: function called with every offer data dict
+    :param pool: process pool for parsers
+    :param concurrency: max number of requests in flight
+    :param cache: page_cache.PageCache
+    :param failed: dict {url: error} of failed urls
+    :return: Throughput counter
+    """
+
+    if not isinstance(listing, dict):
+        listing = dict.fromkeys(listing)
+
+    now = time.time()
+    if cache is None:
+        cached, to_fetch = [], list(listing)
+    else:
+        cached, to_fetch = [], []
+        for link, updated in listing.items():
+            if cache.fresh(offer_id(link), updated, refresh_timestamp(updated, now)):
+                cached.append(link)
+            else:
+                to_fetch.append(link)
+        logger.info("%s offers from cache, %s to fetch", len(cached), len(to_fetch))
+
+    async def pages():
+        for link in cached:
+            html = cache.get(offer_id(link))
+            if html is None:
+                to_fetch.append(link)
+            else:
+                yield link, html
+
+        async for link, html in stream_htmls(client, to_fetch, concurrency, failed):
+            if cache is not None:
+                cache.put(offer_id(link), html, listing[link])
+            yield link, html
+
+    def consumer(link, data_dict):
+        data_dict["offer_id"] = offer_id(link)
+        writer(data_dict)
+
+    return await fetch_parse_pipeline(
+        pages(), get_offers, consumer, pool=pool, failed=failed
+    )
+
+
+def write_failed(city_key, app_key, failed):
+    """
+    write urls which were not downloaded or parsed
+    to "city_key_app_key_failed.txt"
+
+    :param city_key: city key
+    :param app_key: apartment type key
+    :param failed: dict {url: error} of failed urls
+    """
+
+    with open(f"Data_from_web/{city_key}_{app_key}_failed.txt", "w") as f_out:
+        f_out.write("\n".join(f"{url}\t{error}" for url, error in failed.items()))
+    if failed:
+        logger.warning("%s %s: %s urls failed", city_key, app_key, len(failed))
+
+
+async def crawl_app(
+    client,
+    pool,
+    city_key,
+    app_key,
+    url,
+    concurrency=CONCURRENCY,
+    cache=None,
+    xlsx=False,
+):
+    """
+    crawl offers of one city and apartment type,
+    progress is saved to "city_key_app_key_checkpoint.jsonl" and
+    interrupted crawl continues from saved offers,
+    urls which were not downloaded or parsed are written to
+    "city_key_app_key_failed.txt",
+    if the first listing page failed or there are no offers on it,
+    offers file is not changed and crawl is not marked as done
+
+    :param client: aiohttp.ClientSession
+    :param pool: process pool for parsers
+    :param city_key: city key
+    :param app_key: apartment type key
+    :param url: website url
+    :param concurrency: max number of requests in flight
+    :param cache: page_cache.PageCache for incremental crawl
+    :param xlsx: export offers to "city_key_app_key_app_offers.xlsx"
+    :return: Checkpoint of city and apartment type
+    """
+
+    checkpoint = Checkpoint(f"Data_from_web/{city_key}_{app_key}_checkpoint.jsonl")
+    if checkpoint.done:
+        logger.info("%s %s: done in previous run", city_key, app_key)
+        return checkpoint
+
+    failed = {}
+    listing = checkpoint.listing
+    if listing is None:
+        listing = await stream_links_file(
+            client,
+            url,
+            f"Data_from_web/{city_key}_{app_key}_links.txt",
+            pool,
+            concurrency,
+            failed,
+        )
+        if not listing:
+            # без списка объявлений файл прошлого обхода не перезаписывается
+            logger.error("%s %s: no offers in listing", city_key, app_key)
+            write_failed(city_key, app_key, failed)
+            return checkpoint
+        checkpoint.write_listing(listing)
+
+    done_ids = {offer["offer_id"] for offer in checkpoint.offers}
+    listing = {
+        link: updated
+        for link, updated in listing.items()
+        if offer_id(link) not in done_ids
+    }
+    logger.info(
+        "%s %s: %s offers saved, %s to crawl",
+        city_key,
+        app_key,
+        len(done_ids),
+        len(listing),
+    )
+
+    with OffersWriter(offers_file(city_key, app_key)) as offers_writer:
+        for offer in checkpoint.offers:
+            offers_writer.write(offer)
+
+        def writer(offer):
+            checkpoint.write(offer)
+            offers_writer.write(offer)
+
+        counter = await stream_offers_data(
+            client, listing, writer, pool, concurrency, cache, failed
+        )
+    checkpoint.flush()
+    logger.info("%s %s offers: %s", city_key, app_key, counter)
+
+    write_failed(city_key, app_key, failed)
+
+    if xlsx:
+        export_xlsx(city_key, app_key)
+    checkpoint.finish()
+
+    if cache is not None:
+        cache.evict()
+        cache.save()
+
+    return checkpoint
+
+
+async def crawl(
+    cities,
+    app_type,
+    concurrency=CONCURRENCY,
+    limit_per_host=LIMIT_PER_HOST,
+    keepalive_timeout=KEEPALIVE_TIMEOUT,
+    workers=WORKERS,
+    cache=None,
+    xlsx=False,
+):
+    """
+    streaming crawler: one long-lived session for links and offers pages,
+    "concurrency" requests in flight without batch barriers,
+    pages are parsed in one process pool while next pages are downloading
+
+    restarted crawl skips cities and apartment types which are done and
+    continues the interrupted ones, progress files are removed
+    when the whole crawl is done
+
+    :param cities: dict {city_key: city}
+    :param app_type: dict {app_key: apartment type}
+    :param concurrency: max number of requests in flight
+    :param limit_per_host: max number of open connections to one host
+    :param keepalive_timeout: seconds to keep idle connection alive
+    :param workers: number of parser processes
+    :param cache: page_cache.PageCache for incremental crawl
+    :param xlsx: export offers to xlsx files
+    """
+
+    checkpoints = []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        async with create_session(
+            concurrency, limit_per_host, keepalive_timeout
+        ) as client:
+            for city_key, city in cities.items():
+                for app_key, app in app_type.items():
+                    url = f"https://www.realtymag.ru/{city}/{app}/prodazha/?type=1&currency=RUR&price_type=all"
+                    checkpoints.append(
+                        await crawl_app(
+                            client,
+                            pool,
+                            city_key,
+                            app_key,
+                            url,
+                            concurrency,
+                            cache,
+                            xlsx,
+                        )
+                    )
+
+    if not all(checkpoint.done for checkpoint in checkpoints):
+        logger.error("crawl is not done, run it again to continue")
+        return
+    for checkpoint in checkpoints:
+        checkpoint.remove()
+
+
+def main(streaming=True, concurrency=CONCURRENCY, incremental=False, xlsx=False):
+    """
+    create parquet files with offers data "city_key_app_key_app_offers.parquet"
+
+    :param streaming: use streaming crawler with one http session
+    :param concurrency: max number of requests in flight in streaming mode
+    :param incremental: streaming mode downloads only new and updated offers,
+                        others are read from page cache
+    :param xlsx: export offers to excel files "city_key_app_key_app_offers.xlsx"
     """
 
     cities = {
@@ -245,39 +1118,30 @@ def main():
         "new": "novostroyka",
     }
 
+    if streaming:
+        cache = PageCache() if incremental else None
+        asyncio.run(crawl(cities, app_type, concurrency, cache=cache, xlsx=xlsx))
+        return
+
     # Create file with offers urls 'city_key_app_key_links.txt'
     create_links_file(cities, app_type)
 
     for city in cities:
         for app in app_type:
 
-            offers_df = pd.DataFrame(
-                columns=[
-                    "offer_id",
-                    "price_per_square",
-                    "live_square",
-                    "microdistrict",
-                    "location_lat",
-                    "location_long",
-                    "refresh_time",
-                ]
-            )
-
             # Read urls from file
             with open(f"Data_from_web/{city}_{app}_links.txt") as file:
-
                 offers_links_list = file.read().splitlines()
 
-                for step in range(0, 5000, 50):
+            with OffersWriter(offers_file(city, app)) as writer:
+                for step in range(0, len(offers_links_list), 50):
                     sub_list = offers_links_list[step : step + 50]
-                    # print(sub_list)
-                    offers_df = offers_df.append(
-                        get_offers_data(sub_list), ignore_index=True
-                    )
-                    # print(step)
+                    writer.write_frame(get_offers_data(sub_list))
 
-            offers_df.to_excel(f"Data_from_web/{city}_{app}_app_offers.xlsx")
+            if xlsx:
+                export_xlsx(city, app)
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     main()
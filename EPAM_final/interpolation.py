@@ -0,0 +1,222 @@
+"""
+Spatial interpolation engines to predict prices in grid cells without offers
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+from sklearn.neighbors import KNeighborsRegressor
+
+CHUNK_SIZE = 100_000  # points predicted at once
+EARTH_RADIUS = 6371.0  # km
+
+
+def project(X, lat_0):
+    """
+    equirectangular projection of (longitude, latitude) degrees to km,
+    distances are correct near latitude lat_0 (city size)
+
+    :param X: numpy array (n, 2) of longitude, latitude
+    :param lat_0: latitude of projection center
+    :return: numpy array (n, 2) of x, y in km
+    """
+
+    scale = np.pi / 180 * EARTH_RADIUS
+    return np.ascontiguousarray(
+        np.stack([X[:, 0] * scale * np.cos(np.radians(lat_0)), X[:, 1] * scale], axis=1)
+    )
+
+
+def neighbors_radius(distances, k):
+    """
+    :param distances: numpy array (n, k or k + 1) of sorted neighbors distances
+    :param k: number of used neighbors
+    :return: numpy array of k-th neighbors distances, inf if (k + 1)-th neighbor
+             is at the same distance, so used neighbors depend on search order
+    """
+
+    radius = distances[:, k - 1].copy()
+    if distances.shape[1] > k:
+        tied = np.isclose(distances[:, k - 1], distances[:, k], rtol=1e-9, atol=0)
+        radius[tied] = np.inf
+
+    return radius
+
+
+class Interpolator:
+    """
+    base interpolation engine:
+    - fit(X, y) on coordinates of cells with prices
+    - predict(X) for coordinates by chunks of chunk_size points
+    - projected=True - distances in km instead of degrees,
+      projection center lat_0 is mean latitude of training points if None
+    """
+
+    def __init__(self, projected=False, chunk_size=CHUNK_SIZE, lat_0=None):
+        self.projected = projected
+        self.chunk_size = chunk_size
+        self.lat_0 = lat_0
+
+    def transform(self, X):
+        """
+        :param X: numpy array (n, 2) of longitude, latitude
+        :return: coordinates used by engine
+        """
+
+        X = np.asarray(X, dtype=np.float64)
+        if self.projected:
+            return project(X, self.lat_0)
+        return X
+
+    def fit(self, X, y):
+        """
+        :param X: numpy array (n, 2) of longitude, latitude
+        :param y: numpy array of prices
+        :return: self
+        """
+
+        if self.lat_0 is None:
+            self.lat_0 = float(np.mean(X[:, 1]))
+        self.fit_points(self.transform(X), np.asarray(y, dtype=np.float64))
+        return self
+
+    def chunked(self, func, X):
+        """
+        :param func: function of engine coordinates chunk
+        :param X: numpy array (n, 2) of longitude, latitude
+        :return: concatenated results of func for chunks of chunk_size points
+        """
+
+        X = self.transform(X)
+        chunks = [
+            func(X[start : start + self.chunk_size])
+            for start in range(0, len(X), self.chunk_size)
+        ]
+        return np.concatenate(chunks) if chunks else np.empty(0)
+
+    def predict(self, X):
+        """
+        :param X: numpy array (n, 2) of longitude, latitude
+        :return: numpy array of predicted prices
+        """
+
+        return self.chunked(self.predict_points, X)
+
+    def radius(self, X):
+        """
+        prediction of point depends only on training points in this radius
+
+        :param X: numpy array (n, 2) of longitude, latitude
+        :return: numpy array of distances to the farthest used neighbor
+                 in engine coordinates, inf if it is tied with unused one
+        """
+
+        return self.chunked(self.radius_points, X)
+
+    def fit_points(self, X, y):
+        """
+        :param X: numpy array (n, 2) of engine coordinates
+        :param y: numpy array of prices
+        """
+
+        raise NotImplementedError
+
+    def predict_points(self, X):
+        """
+        :param X: numpy array (n, 2) of engine coordinates
+        :return: numpy array of predicted prices
+        """
+
+        raise NotImplementedError
+
+    def radius_points(self, X):
+        """
+        :param X: numpy array (n, 2) of engine coordinates
+        :return: numpy array of distances to the farthest used neighbor,
+                 inf if it is tied with unused one
+        """
+
+        raise NotImplementedError
+
+
+class KNNInterpolator(Interpolator):
+    """
+    sklearn KNeighborsRegressor
+    """
+
+    def __init__(self, n_neighbors=6, weights="distance", **kwargs):
+        super().__init__(**kwargs)
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+        self.model = None
+
+    def fit_points(self, X, y):
+        self.model = KNeighborsRegressor(
+            n_neighbors=self.n_neighbors, weights=self.weights
+        ).fit(X, y)
+
+    def predict_points(self, X):
+        return self.model.predict(X)
+
+    def radius_points(self, X):
+        k = self.model.n_neighbors
+        query = min(k + 1, self.model.n_samples_fit_)
+        return neighbors_radius(self.model.kneighbors(X, query)[0], k)
+
+
+class IDWInterpolator(Interpolator):
+    """
+    inverse distance weighting of n_neighbors nearest cells found in KD-tree:
+    price = sum(price_i / d_i^power) / sum(1 / d_i^power),
+    price of cell with the same coordinates if there is one
+    """
+
+    def __init__(self, n_neighbors=12, power=2, **kwargs):
+        super().__init__(**kwargs)
+        self.n_neighbors = n_neighbors
+        self.power = power
+        self.tree = None
+        self.y = None
+
+    def fit_points(self, X, y):
+        self.tree = cKDTree(X)
+        self.y = y
+
+    def predict_points(self, X):
+        k = min(self.n_neighbors, len(self.y))
+        distances, indices = self.tree.query(X, k=k)
+        distances = distances.reshape(len(X), k)
+        neighbors_y = self.y[indices.reshape(len(X), k)]
+
+        with np.errstate(divide="ignore"):
+            weight = distances ** -float(self.power)
+        zero = distances == 0
+        exact = zero.any(axis=1)
+        weight[exact] = zero[exact]
+
+        return (weight * neighbors_y).sum(axis=1) / weight.sum(axis=1)
+
+    def radius_points(self, X):
+        k = min(self.n_neighbors, len(self.y))
+        query = min(k + 1, len(self.y))
+        distances = self.tree.query(X, k=query)[0].reshape(len(X), query)
+        return neighbors_radius(distances, k)
+
+
+# engine name: (engine class, distances in km)
+ENGINES = {
+    "knn": (KNNInterpolator, False),
+    "knn_projected": (KNNInterpolator, True),
+    "idw": (IDWInterpolator, False),
+    "idw_projected": (IDWInterpolator, True),
+}
+
+
+def make_engine(name, **params):
+    """
+    :param name: engine name from ENGINES
+    :param params: engine parameters
+    :return: interpolation engine
+    """
+
+    engine, projected = ENGINES[name]
+    return engine(projected=projected, **params)
@@ -0,0 +1,92 @@
+"""
+Run independent city and apartment type jobs in parallel processes
+"""
+
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+WORKERS = os.cpu_count() or 1
+
+logger = logging.getLogger(__name__)
+
+
+def run_job(func, job):
+    """
+    :param func: job function
+    :param job: tuple of job function arguments
+    :return: error traceback text (None if job is done), job time in seconds
+    """
+
+    start = time.perf_counter()
+    try:
+        func(*job)
+    except Exception:
+        error = traceback.format_exc()
+    else:
+        error = None
+
+    return error, time.perf_counter() - start
+
+
+def log_job(func, job, error, elapsed):
+    """
+    :param func: job function
+    :param job: tuple of job function arguments
+    :param error: error traceback text or None
+    :param elapsed: job time in seconds
+    """
+
+    name = f"{func.__name__}{job}"
+    if error is None:
+        logger.info("%s done in %.1f s", name, elapsed)
+    else:
+        logger.error("%s failed in %.1f s\n%s", name, elapsed, error)
+
+
+def run_jobs(func, jobs, workers=WORKERS):
+    """
+    run func(*job) for every job in process pool,
+    failed job does not stop the others
+
+    :param func: job function (module level to be sent to process)
+    :param jobs: list of tuples of job function arguments (hashable)
+    :param workers: number of processes, 1 - run jobs in this process
+    :return: dict {job: {"error": traceback text or None, "time": seconds}}
+    """
+
+    results = {}
+    jobs = list(jobs)
+
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            error, elapsed = run_job(func, job)
+            log_job(func, job, error, elapsed)
+            results[job] = {"error": error, "time": elapsed}
+        return results
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+        futures = {pool.submit(run_job, func, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                error, elapsed = future.result()
+            except Exception:
+                # worker process died
+                error, elapsed = traceback.format_exc(), time.perf_counter() - start
+            log_job(func, job, error, elapsed)
+            results[job] = {"error": error, "time": elapsed}
+
+    return results
+
+
+def failed_jobs(results):
+    """
+    :param results: run_jobs results
+    :return: list of failed jobs
+    """
+
+    return [job for job, result in results.items() if result["error"] is not None]
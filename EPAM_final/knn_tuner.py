@@ -0,0 +1,184 @@
+"""
+Hyperparameters search of KNN price model from one neighbors query per fold
+"""
+
+import json
+import os
+
+import numpy as np
+from sklearn.metrics import r2_score
+from sklearn.model_selection import KFold
+from sklearn.neighbors import KNeighborsRegressor, NearestNeighbors
+
+N_NEIGHBORS = range(2, 40, 2)
+WEIGHTS = ("distance", "uniform")
+N_SPLITS = 5
+CHANGE = 0.05  # relative change of training data to tune parameters again
+
+
+def neighbors_predictions(distances, neighbors_y, n_neighbors, weights):
+    """
+    predictions of KNeighborsRegressor for every number of neighbors
+    from one neighbors query with max number of neighbors
+
+    :param distances: numpy array (n, k_max) of sorted neighbors distances
+    :param neighbors_y: numpy array (n, k_max) of neighbors prices
+    :param n_neighbors: list of numbers of neighbors
+    :param weights: "uniform" or "distance"
+    :return: numpy array (n, len(n_neighbors)) of predictions
+    """
+
+    columns = np.asarray(n_neighbors) - 1
+    if weights == "uniform":
+        return np.cumsum(neighbors_y, axis=1)[:, columns] / (columns + 1)
+
+    with np.errstate(divide="ignore"):
+        weight = 1 / distances
+    # points with zero distance neighbors get mean price of these neighbors
+    zero = distances == 0
+    exact = zero.any(axis=1)
+    weight[exact] = zero[exact]
+
+    sums = np.cumsum(weight * neighbors_y, axis=1)[:, columns]
+    return sums / np.cumsum(weight, axis=1)[:, columns]
+
+
+def tied_rows(distances, k):
+    """
+    :param distances: numpy array (n, k_query) of sorted neighbors distances
+    :param k: number of neighbors, k < k_query
+    :return: boolean numpy array, True for rows where k-th and (k + 1)-th
+             neighbors are at the same distance, so k nearest neighbors
+             depend on neighbors search order
+    """
+
+    return np.isclose(distances[:, k - 1], distances[:, k], rtol=1e-9, atol=0)
+
+
+def knn_cv_scores(X, y, n_neighbors=N_NEIGHBORS, weights=WEIGHTS, n_splits=N_SPLITS):
+    """
+    mean R^2 of KNeighborsRegressor on KFold splits (the same as GridSearchCV),
+    neighbors are queried once for each fold for all parameters,
+    only test points with tied neighbors are predicted by KNeighborsRegressor
+    with the number of neighbors of candidate
+
+    :param X: numpy array (n, 2) of coordinates
+    :param y: numpy array of prices
+    :param n_neighbors: numbers of neighbors
+    :param weights: weights functions: "uniform", "distance"
+    :param n_splits: number of folds
+    :return: dict {(n_neighbors, weights): mean R^2}, nan if there are less
+             training points than neighbors in some fold
+    """
+
+    n_neighbors = list(n_neighbors)
+    scores = {(k, weight): [] for k in n_neighbors for weight in weights}
+
+    for train, test in KFold(n_splits).split(X):
+        X_train, y_train, X_test, y_test = X[train], y[train], X[test], y[test]
+        fitted = [k for k in n_neighbors if k <= len(train)]
+        k_query = min(max(n_neighbors) + 1, len(train))
+        model = NearestNeighbors(n_neighbors=k_query).fit(X_train)
+        distances, indices = model.kneighbors(X_test)
+
+        predictions = {
+            weight: neighbors_predictions(distances, y_train[indices], fitted, weight)
+            for weight in weights
+        }
+
+        for column, k in enumerate(fitted):
+            if k == k_query:
+                continue
+            ties = tied_rows(distances, k)
+            if not ties.any():
+                continue
+            model = KNeighborsRegressor(n_neighbors=k).fit(X_train, y_train)
+            tie_distances, tie_indices = model.kneighbors(X_test[ties])
+            for weight in weights:
+                predictions[weight][ties, column] = neighbors_predictions(
+                    tie_distances, y_train[tie_indices], [k], weight
+                )[:, 0]
+
+        for k, weight in scores:
+            if k in fitted:
+                y_pred = predictions[weight][:, fitted.index(k)]
+                scores[(k, weight)].append(r2_score(y_test, y_pred))
+            else:
+                scores[(k, weight)].append(np.nan)
+
+    return {
+        params: float(np.mean(fold_scores)) for params, fold_scores in scores.items()
+    }
+
+
+def best_knn_params(X, y, n_neighbors=N_NEIGHBORS, weights=WEIGHTS, n_splits=N_SPLITS):
+    """
+    best parameters in GridSearchCV order: first of the best mean scores,
+    parameters are ordered by n_neighbors, then by weights
+
+    :param X: numpy array (n, 2) of coordinates
+    :param y: numpy array of prices
+    :param n_neighbors: numbers of neighbors
+    :param weights: weights functions: "uniform", "distance"
+    :param n_splits: number of folds
+    :return: {"n_neighbors": k, "weights": weights}, mean R^2 of parameters
+    """
+
+    scores = knn_cv_scores(X, y, n_neighbors, sorted(weights), n_splits)
+    scores = {params: score for params, score in scores.items() if not np.isnan(score)}
+    if not scores:
+        raise ValueError(f"not enough training points: {len(y)}")
+
+    best = max(scores.values())
+    k, weight = next(params for params, score in scores.items() if score == best)
+
+    return {"n_neighbors": k, "weights": weight}, best
+
+
+def data_changed(saved, n_train, mean_price, change=CHANGE):
+    """
+    :param saved: saved tuning results dict
+    :param n_train: number of training points
+    :param mean_price: mean price of training points
+    :param change: relative change of training data to tune parameters again
+    :return: True if number of points or mean price changed more than change
+    """
+
+    return abs(n_train - saved["n_train"]) > change * saved["n_train"] or abs(
+        mean_price - saved["mean_price"]
+    ) > change * abs(saved["mean_price"])
+
+
+def tuned_knn_params(file_name, X, y, change=CHANGE):
+    """
+    best KNN parameters from file if training data did not change
+    noticeably since they were found, otherwise tuned and saved to file
+
+    :param file_name: json file with tuning results of city and apartment type
+    :param X: numpy array (n, 2) of coordinates
+    :param y: numpy array of prices
+    :param change: relative change of training data to tune parameters again
+    :return: {"n_neighbors": k, "weights": weights}
+    """
+
+    n_train, mean_price = len(y), float(np.mean(y)) if len(y) else 0.0
+
+    if os.path.exists(file_name):
+        with open(file_name) as file:
+            saved = json.load(file)
+        if not data_changed(saved, n_train, mean_price, change):
+            return saved["params"]
+
+    params, score = best_knn_params(X, y)
+    with open(file_name, "w") as file:
+        json.dump(
+            {
+                "params": params,
+                "score": score,
+                "n_train": n_train,
+                "mean_price": mean_price,
+            },
+            file,
+        )
+
+    return params
@@ -2,10 +2,34 @@
 plot prices heatmap
 """
 
+import json
+import logging
 import math
+import os
+import shutil
 
 import folium
 import geopandas as gpd
+import numpy as np
+import pandas as pd
+from branca.colormap import StepColormap
+from branca.element import MacroElement
+from branca.utilities import color_brewer
+from folium.map import Layer
+from jinja2 import Template
+
+from jobs import WORKERS, run_jobs
+from price_lookup import observed_raster
+from price_raster import raster_file, raster_gdf, read_raster
+from price_tiles import (
+    MAX_ZOOM,
+    MIN_ZOOM,
+    grid_bounds,
+    render_tiles,
+    tile_jobs,
+    tiles_dir,
+)
+from smoothing import smooth_file
 
 
 def bins_thresholds(prices) -> list:
@@ -37,13 +61,394 @@ def bins_thresholds(prices) -> list:
     return bins
 
 
-def plot():
+def density_bins(density) -> list:
+    """
+    generate colors bin edges of offers density: deciles rounded
+    to tenths as density of layer, densities below 0.05 are not drawn
+
+    :param density: numpy array of offers per km²
+    :return: bins list
+    """
+
+    density = density[density >= 0.05]
+    bins = np.unique(np.round(np.quantile(density, np.linspace(0, 1, 11)), 1))
+    if len(bins) < 4:
+        bins = np.round(np.linspace(density.min(), density.max(), 4), 1)
+
+    return bins.tolist()
+
+
+def cells_delta(rows, cols, n_cols):
+    """
+    :param rows: numpy array of cells rows in row by row order
+    :param cols: numpy array of cells columns
+    :param n_cols: number of grid columns
+    :return: list of differences of consecutive cells numbers row * n_cols + col,
+             the first one is the number of the first cell
+    """
+
+    return np.diff(rows * n_cols + cols, prepend=0).tolist()
+
+
+def quantize_prices(prices):
+    """
+    :param prices: numpy array of prices in thousands ₽, NaN - no price
+    :return: list of prices in hundreds ₽, 0 - no price
+    """
+
+    return np.nan_to_num(np.round(prices * 10)).astype(int).tolist()
+
+
+def compact_json(data):
+    """
+    :param data: json data
+    :return: json text without spaces
+    """
+
+    return json.dumps(data, separators=(",", ":"))
+
+
+class GridCells(MacroElement):
+    """
+    bounds of grid cells written to map once for all grid layers:
+    grid origin, steps and cells numbers encoded by differences,
+    cells coordinates are exact multiples of grid steps,
+    cells of adaptive grid have sizes in grid steps
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function () {
+            var grid = {{ this.grid }};
+            var number = 0;
+            return grid.delta.map(function (delta, i) {
+                number += delta;
+                var size = grid.sizes ? grid.sizes[i] : 1;
+                var x = grid.origin[0] + (number % grid.cols) * grid.steps[0];
+                var y = grid.origin[1] + Math.floor(number / grid.cols) * grid.steps[1];
+                return [[y, x], [y + size * grid.steps[1], x + size * grid.steps[0]]];
+            });
+        })();
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, header, rows, cols, sizes=None):
+        """
+        :param header: price raster header dict
+        :param rows: numpy array of cells rows in row by row order
+        :param cols: numpy array of cells columns
+        :param sizes: numpy array of cells sizes in raster cells, None - all are 1
+        """
+
+        super().__init__()
+        self._name = "GridCells"
+        n_cols = header["shape"][1]
+        grid = {
+            "origin": header["origin"],
+            "steps": header["steps"],
+            "cols": n_cols,
+            "delta": cells_delta(rows, cols, n_cols),
+        }
+        if sizes is not None:
+            grid["sizes"] = np.asarray(sizes).tolist()
+        self.grid = compact_json(grid)
+
+
+class GridPricesLayer(Layer):
+    """
+    layer of colored grid cells drawn on canvas,
+    layer has only prices of GridCells cells;
+    with tiles: PNG tiles on zoom levels below min_zoom, cells from min_zoom
     """
-    plot prices heatmap
 
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function () {
+            var prices = {{ this.prices }};
+            var bins = {{ this.bins }};
+            var colors = {{ this.colors }};
+            var renderer = L.canvas();
+            var layer = L.layerGroup();
+            var cellsLayer = layer;
+            {% if this.tiles %}
+            var map = {{ this._parent.get_name() }};
+            cellsLayer = L.layerGroup();
+            L.tileLayer({{ this.tiles }}, {
+                minZoom: {{ this.tiles_zoom[0] }},
+                maxZoom: {{ this.tiles_zoom[1] }},
+                bounds: {{ this.bounds }},
+                opacity: {{ this.fill_opacity }}
+            }).addTo(layer);
+            function showCells() {
+                if (map.getZoom() > {{ this.tiles_zoom[1] }}) {
+                    layer.addLayer(cellsLayer);
+                } else {
+                    layer.removeLayer(cellsLayer);
+                }
+            }
+            map.on("zoomend", showCells);
+            showCells();
+            {% endif %}
+            {{ this.cells.get_name() }}.forEach(function (bounds, i) {
+                if (!prices[i]) {
+                    return;
+                }
+                var price = prices[i] / 10;
+                var color = 0;
+                while (color < colors.length - 1 && price >= bins[color + 1]) {
+                    color++;
+                }
+                L.rectangle(bounds, {
+                    renderer: renderer,
+                    stroke: false,
+                    fillColor: colors[color],
+                    fillOpacity: {{ this.fill_opacity }}
+                }).addTo(cellsLayer);
+            });
+            {% if this.visible %}
+            layer.addTo({{ this._parent.get_name() }});
+            {% endif %}
+            return layer;
+        })();
+        {% endmacro %}
+        """
+    )
+
+    def __init__(
+        self,
+        cells,
+        prices,
+        bins,
+        name,
+        show=True,
+        fill_opacity=0.5,
+        tiles=None,
+        tiles_zoom=(MIN_ZOOM, MAX_ZOOM),
+        bounds=None,
+    ):
+        """
+        :param cells: GridCells of map
+        :param prices: numpy array of cells prices in thousands ₽, NaN - no price
+        :param bins: colors bin edges
+        :param name: layer name
+        :param show: show layer on opening
+        :param fill_opacity: cells opacity
+        :param tiles: url of tiles '.../{z}/{x}/{y}.png', None - only cells
+        :param tiles_zoom: min and max zoom levels of tiles
+        :param bounds: min longitude, min latitude, max longitude, max latitude
+                       of tiles
+        """
+
+        super().__init__(name=name, overlay=True, control=True, show=False)
+        self._name = "GridPricesLayer"
+        self.cells = cells
+        self.prices = compact_json(quantize_prices(prices))
+        self.bins = compact_json(list(bins))
+        self.colors = compact_json(color_brewer("YlOrRd", n=len(bins) - 1))
+        self.visible = show
+        self.fill_opacity = fill_opacity
+        self.tiles = compact_json(tiles) if tiles else None
+        self.tiles_zoom = tiles_zoom
+        if bounds is not None:
+            lon_min, lat_min, lon_max, lat_max = (float(value) for value in bounds)
+            self.bounds = compact_json([[lat_min, lon_min], [lat_max, lon_max]])
+
+
+def add_choropleth_layers(heatmap, city, app_key, app):
+    """
+    add "real" and "predict" choropleth layers with polygons of cells to map
+
+    :param heatmap: folium.Map
+    :param city: city key
+    :param app_key: apartment type key
+    :param app: apartment type name
+    """
+
+    data_type = {
+        "real": f"Data_preproc/{city}_{app_key}_grid_gpd.gpkg",
+        "predict": f"Data_predict/{city}_{app_key}_predict.gpkg",
+    }
+
+    for data_key, value in data_type.items():
+
+        if data_key == "predict" and os.path.isfile(raster_file(city, app_key)):
+            # ячейки растра предсказаний без чтения полигонов из файла
+            prices = raster_gdf(*read_raster(raster_file(city, app_key)))
+        else:
+            prices = gpd.read_file(value)
+        # shapefiles of previous versions have 10 characters column names
+        prices = prices.rename(columns={"price_per_": "price_per_square"})
+        prices["price_per_square"] = prices["price_per_square"] / 1000
+
+        bins = bins_thresholds(prices["price_per_square"])
+        layer_show = data_key == "real"
+
+        folium.Choropleth(
+            geo_data=prices,
+            name=f"{app}_{data_key}",
+            data=prices,
+            columns=["geoid", "price_per_square"],
+            key_on="feature.id",
+            fill_color="YlOrRd",
+            bins=bins,
+            fill_opacity=0.5,
+            line_weight=0,
+            line_opacity=0,
+            smooth_factor=0.5,
+            legend_name=f"{data_key}: thousands ₽/m²",
+            show=layer_show,
+        ).add_to(heatmap)
+
+
+def add_compact_layers(heatmap, city, app_key, app, tiles=False):
+    """
+    add "real" and "predict" layers sharing cells bounds to map,
+    predictions are read from 'city_app_predict.raster',
+    hidden "smooth" and "density" layers are added if there are
+    smoothed prices and offers density rasters (smoothing)
+
+    :param heatmap: folium.Map
+    :param city: city key
+    :param app_key: apartment type key
+    :param app: apartment type name
+    :param tiles: "predict" layer shows rendered tiles below MAX_ZOOM + 1 zoom
+    """
+
+    predicted, header = read_raster(raster_file(city, app_key))
+    observed = observed_raster(f"Data_preproc/{city}_{app_key}_grid_gpd.gpkg", header)
+    data_type = {
+        "real": (observed / 1000, "thousands ₽/m²"),
+        "predict": (predicted / 1000, "thousands ₽/m²"),
+    }
+    for surface, scale, units in (
+        ("smooth", 1000, "thousands ₽/m²"),
+        ("density", 1, "offers/km²"),
+    ):
+        if os.path.isfile(smooth_file(city, app_key, surface)):
+            values = read_raster(smooth_file(city, app_key, surface))[0]
+            data_type[surface] = (values / scale, units)
+
+    # общие для слоев ячейки: с предсказанной или реальной ценой
+    has_price = ~np.isnan(predicted) | ~np.isnan(observed)
+    if "grid" in header:
+        # ячейки адаптивной сетки, цены слоев в их центрах
+        grid_cells = gpd.read_file(header["grid"], ignore_geometry=True)
+        rows, cols, sizes = (
+            grid_cells[key].to_numpy() for key in ("row", "col", "size")
+        )
+        inside = has_price[rows, cols]
+        rows, cols, sizes = rows[inside], cols[inside], sizes[inside]
+        cells = GridCells(header, rows, cols, sizes)
+        centers = (rows + sizes // 2, cols + sizes // 2)
+    else:
+        rows, cols = np.nonzero(has_price)
+        cells = GridCells(header, rows, cols)
+        centers = (rows, cols)
+    cells.add_to(heatmap)
+
+    for data_key, (prices, units) in data_type.items():
+
+        prices = prices[centers]
+        if data_key == "density":
+            bins = density_bins(prices[~np.isnan(prices)])
+        else:
+            bins = bins_thresholds(pd.Series(prices).dropna())
+        tiles_url, bounds = None, None
+        if tiles and data_key == "predict":
+            # путь к плиткам относительно html файла в 'Output'
+            tiles_url = os.path.relpath(tiles_dir(city, app_key), "Output")
+            tiles_url = tiles_url.replace(os.sep, "/") + "/{z}/{x}/{y}.png"
+            bounds = grid_bounds(predicted, header)
+
+        GridPricesLayer(
+            cells,
+            prices,
+            bins,
+            name=f"{app}_{data_key}",
+            show=data_key == "real",
+            tiles=tiles_url,
+            bounds=bounds,
+        ).add_to(heatmap)
+        StepColormap(
+            color_brewer("YlOrRd", n=len(bins) - 1),
+            index=bins,
+            vmin=bins[0],
+            vmax=bins[-1],
+            caption=f"{data_key}: {units}",
+        ).add_to(heatmap)
+
+
+def predict_bins(city, app_key):
+    """
+    :param city: city key
+    :param app_key: apartment type key
+    :return: colors bin edges of predicted prices in thousands ₽,
+             the same as bins of "predict" layer: one price of every cell
+             of grid, cells of adaptive grid are not weighted by their area
+    """
+
+    predicted, header = read_raster(raster_file(city, app_key))
+    if "grid" in header:
+        # цены ячеек адаптивной сетки в их центрах, как в слое "predict"
+        grid_cells = gpd.read_file(header["grid"], ignore_geometry=True)
+        sizes = grid_cells["size"].to_numpy()
+        predicted = predicted[
+            grid_cells["row"].to_numpy() + sizes // 2,
+            grid_cells["col"].to_numpy() + sizes // 2,
+        ]
+    values = predicted / 1000
+
+    return bins_thresholds(pd.Series(values[~np.isnan(values)]))
+
+
+def plot_map(city, loc, app_key, app, compact=False, tiles=False):
+    """
+    plot prices heatmap of city and apartment type
+
+    :param city: city key
+    :param loc: (latitude, longitude) of map center
+    :param app_key: apartment type key
+    :param app: apartment type name
+    :param compact: cells bounds are written once for both layers,
+                    layers have only prices of cells (needs prediction raster)
+    :param tiles: compact map with "predict" layer of rendered tiles
     :return: html file with choropleth map with prices
     """
 
+    heatmap = folium.Map(
+        location=loc,
+        width="70%",
+        height="70%",
+        left="15%",
+        top="15%",
+        zoom_start=10,
+        control_scale=True,
+        tiles="cartodbpositron",
+    )
+
+    if compact or tiles:
+        add_compact_layers(heatmap, city, app_key, app, tiles)
+    else:
+        add_choropleth_layers(heatmap, city, app_key, app)
+
+    folium.LayerControl(collapsed=False).add_to(heatmap)
+    heatmap.save(f"Output/{city}_{app_key}.html")
+
+
+def plot(workers=WORKERS, compact=False, tiles=False):
+    """
+    plot prices heatmaps of cities and apartment types in parallel processes
+
+    :param workers: number of processes
+    :param compact: write cells bounds once for both layers of map
+    :param tiles: render tiles of predictions to 'Output/tiles' before maps,
+                  compact maps show them below MAX_ZOOM + 1 zoom
+    :return: dict {job: {"error": traceback text or None, "time": seconds}}
+    """
+
     cities = {
         "Mos": [55.755819, 37.617644],
         "SPb": [59.939099, 30.315877],
@@ -55,54 +460,26 @@ def plot():
         # "new": "New",
     }
 
-    for city, loc in cities.items():
-
-        for app_key, app in app_type.items():
-
-            heatmap = folium.Map(
-                location=loc,
-                width="70%",
-                height="70%",
-                left="15%",
-                top="15%",
-                zoom_start=10,
-                control_scale=True,
-                tiles="cartodbpositron",
-            )
-
-            data_type = {
-                "real": f"Data_preproc/{city}_{app_key}_grid_gpd.gpkg",
-                "predict": f"Data_predict/{city}_{app_key}_predict.gpkg",
-            }
-
-            for data_key, value in data_type.items():
-
-                prices = gpd.read_file(value)
-                prices["price_per_"] = prices["price_per_"] / 1000
-                prices = prices.rename(columns={"price_per_": "price_per_square"})
+    results = {}
+    if tiles:
+        # плитки всех городов рендерятся параллельно до построения карт
+        jobs = []
+        for city in cities:
+            for app_key in app_type:
+                shutil.rmtree(tiles_dir(city, app_key), ignore_errors=True)
+                jobs += tile_jobs(city, app_key, predict_bins(city, app_key))
+        results.update(run_jobs(render_tiles, jobs, workers))
 
-                bins = bins_thresholds(prices["price_per_square"])
-                layer_show = data_key == "real"
-
-                folium.Choropleth(
-                    geo_data=prices,
-                    name=f"{app}_{data_key}",
-                    data=prices,
-                    columns=["geoid", "price_per_square"],
-                    key_on="feature.id",
-                    fill_color="YlOrRd",
-                    bins=bins,
-                    fill_opacity=0.5,
-                    line_weight=0,
-                    line_opacity=0,
-                    smooth_factor=0.5,
-                    legend_name=f"{data_key}: thousands ₽/m²",
-                    show=layer_show,
-                ).add_to(heatmap)
+    jobs = [
+        (city, tuple(loc), app_key, app, compact, tiles)
+        for city, loc in cities.items()
+        for app_key, app in app_type.items()
+    ]
+    results.update(run_jobs(plot_map, jobs, workers))
 
-            folium.LayerControl(collapsed=False).add_to(heatmap)
-            heatmap.save(f"Output/{city}_{app_key}.html")
+    return results
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     plot()
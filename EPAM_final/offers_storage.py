@@ -0,0 +1,175 @@
+"""
+Columnar storage of offers data: typed record batches in parquet files
+"""
+
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+OFFERS_DIR = "Data_from_web"
+BATCH_SIZE = 1000  # offers in one record batch
+
+OFFERS_SCHEMA = pa.schema(
+    [
+        ("offer_id", pa.string()),
+        ("price_per_square", pa.float64()),
+        ("live_square", pa.float64()),
+        ("microdistrict", pa.string()),
+        ("location_lat", pa.float64()),
+        ("location_long", pa.float64()),
+        ("refresh_time", pa.string()),
+    ]
+)
+
+
+def offers_file(city, app, ext="parquet"):
+    """
+    :param city: city key
+    :param app: apartment type key
+    :param ext: file extension: "parquet" or "xlsx"
+    :return: offers file name
+    """
+
+    return f"{OFFERS_DIR}/{city}_{app}_app_offers.{ext}"
+
+
+class OffersWriter:
+    """
+    write offers dicts to parquet file by record batches as they come,
+    file is written to "file_name.tmp" and renamed when writer is closed
+    """
+
+    def __init__(self, file_name, batch_size=BATCH_SIZE):
+        self.file_name = file_name
+        self.temp_file = f"{file_name}.tmp"
+        self.batch_size = batch_size
+        self.buffer = []
+        self.writer = pq.ParquetWriter(self.temp_file, OFFERS_SCHEMA)
+
+    def write(self, offer):
+        """
+        :param offer: offer data dict
+        """
+
+        self.buffer.append(offer)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def write_frame(self, offers_df):
+        """
+        :param offers_df: pandas.DataFrame with offers data
+        """
+
+        self.flush()
+        table = pa.Table.from_pandas(
+            offers_df[OFFERS_SCHEMA.names], schema=OFFERS_SCHEMA, preserve_index=False
+        )
+        self.writer.write_table(table)
+
+    def flush(self):
+        """
+        write buffered offers as one record batch
+        """
+
+        if self.buffer:
+            batch = pa.RecordBatch.from_pylist(self.buffer, schema=OFFERS_SCHEMA)
+            self.writer.write_batch(batch)
+            self.buffer = []
+
+    def close(self):
+        """
+        write the rest of offers and finish the file
+        """
+
+        self.flush()
+        self.writer.close()
+        os.replace(self.temp_file, self.file_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.writer.close()
+            os.remove(self.temp_file)
+
+
+def write_offers(offers, file_name):
+    """
+    :param offers: iterable of offers dicts
+    :param file_name: parquet file name
+    """
+
+    with OffersWriter(file_name) as writer:
+        for offer in offers:
+            writer.write(offer)
+
+
+def read_offers_file(file_name, columns=None):
+    """
+    read only needed columns of offers file (parquet or xlsx)
+
+    :param file_name: offers file name
+    :param columns: list of columns, None - all columns
+    :return: pandas.DataFrame with offers data
+    """
+
+    if file_name.endswith(".parquet"):
+        return pq.read_table(file_name, columns=columns).to_pandas()
+
+    return pd.read_excel(file_name, usecols=columns)
+
+
+def find_offers_file(city, app):
+    """
+    :param city: city key
+    :param app: apartment type key
+    :return: parquet offers file name, xlsx file if there is no parquet one
+    """
+
+    file_name = offers_file(city, app)
+    if os.path.exists(file_name):
+        return file_name
+
+    return offers_file(city, app, "xlsx")
+
+
+def read_offers(city, app, columns=None):
+    """
+    :param city: city key
+    :param app: apartment type key
+    :param columns: list of columns, None - all columns
+    :return: pandas.DataFrame with offers data
+    """
+
+    return read_offers_file(find_offers_file(city, app), columns)
+
+
+def export_xlsx(city, app):
+    """
+    write parquet offers file to "city_app_app_offers.xlsx"
+
+    :param city: city key
+    :param app: apartment type key
+    """
+
+    read_offers_file(offers_file(city, app)).to_excel(offers_file(city, app, "xlsx"))
+
+
+def import_xlsx(city, app):
+    """
+    convert "city_app_app_offers.xlsx" from previous crawls to parquet file
+
+    :param city: city key
+    :param app: apartment type key
+    """
+
+    offers_df = read_offers_file(offers_file(city, app, "xlsx"), OFFERS_SCHEMA.names)
+    offers_df["offer_id"] = offers_df["offer_id"].astype(str)
+
+    with OffersWriter(offers_file(city, app)) as writer:
+        writer.write_frame(offers_df)
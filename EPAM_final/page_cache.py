@@ -0,0 +1,174 @@
+"""
+Compressed on-disk cache of offers pages for incremental crawl
+"""
+
+import hashlib
+import json
+import os
+import time
+import zlib
+from collections import Counter
+
+CACHE_DIR = "Data_from_web/cache"
+TTL = 7 * 24 * 3600  # seconds, older pages are fetched again
+MAX_SIZE = 2 * 1024**3  # bytes of compressed pages on disk
+
+
+class PageCache:
+    """
+    content-addressed cache of pages html:
+    - pages are stored zlib-compressed in "objects/xx/sha1" files
+    - "index.json" maps key (offer_id) to page hash, fetch time
+      and listing page version (refresh time text) of the offer
+    """
+
+    def __init__(self, path=CACHE_DIR, ttl=TTL, max_size=MAX_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.index_file = os.path.join(path, "index.json")
+
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as file:
+                self.index = json.load(file)
+        else:
+            self.index = {}
+
+    def object_path(self, digest):
+        """
+        :param digest: page sha1 hex digest
+        :return: compressed page file name
+        """
+
+        return os.path.join(self.path, "objects", digest[:2], digest)
+
+    def expired(self, entry, now):
+        """
+        :param entry: index entry
+        :param now: current timestamp
+        :return: True if page is older than ttl
+        """
+
+        return now - entry["fetched"] > self.ttl
+
+    def fresh(self, key, version=None, modified=None, now=None):
+        """
+        check cached page can be used instead of fetching it again
+
+        :param key: page key (offer_id)
+        :param version: listing page version of the page (refresh time text)
+        :param modified: timestamp of the last page update if known
+        :param now: current timestamp
+        :return: True if page is cached, not expired and not updated
+                 after it was fetched (if "modified" is None - listing
+                 version is the same as cached one)
+        """
+
+        now = time.time() if now is None else now
+        entry = self.index.get(key)
+        if entry is None or self.expired(entry, now):
+            return False
+        if modified is not None:
+            return modified <= entry["fetched"]
+
+        return version == entry["version"]
+
+    def get(self, key):
+        """
+        :param key: page key (offer_id)
+        :return: cached page html or None
+        """
+
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+
+        try:
+            with open(self.object_path(entry["hash"]), "rb") as file:
+                return zlib.decompress(file.read()).decode("utf-8")
+        except FileNotFoundError:
+            del self.index[key]
+            return None
+
+    def put(self, key, html, version=None, now=None):
+        """
+        save page to cache
+
+        :param key: page key (offer_id)
+        :param html: page html
+        :param version: listing page version of the page (refresh time text)
+        :param now: fetch timestamp
+        """
+
+        data = html.encode("utf-8")
+        digest = hashlib.sha1(data).hexdigest()
+        file_name = self.object_path(digest)
+
+        if not os.path.exists(file_name):
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+            with open(file_name, "wb") as file:
+                file.write(zlib.compress(data))
+
+        self.index[key] = {
+            "hash": digest,
+            "size": os.path.getsize(file_name),
+            "fetched": time.time() if now is None else now,
+            "version": version,
+        }
+
+    def evict(self, now=None):
+        """
+        remove expired pages, then the oldest pages
+        while cache size is bigger than max_size
+
+        :param now: current timestamp
+        :return: number of removed index entries
+        """
+
+        now = time.time() if now is None else now
+        removed = [key for key, entry in self.index.items() if self.expired(entry, now)]
+        for key in removed:
+            del self.index[key]
+
+        # pages with the same content are stored once
+        sizes = {entry["hash"]: entry["size"] for entry in self.index.values()}
+        links = Counter(entry["hash"] for entry in self.index.values())
+        total = sum(sizes.values())
+        for key, entry in sorted(self.index.items(), key=lambda x: x[1]["fetched"]):
+            if total <= self.max_size:
+                break
+            del self.index[key]
+            removed.append(key)
+            links[entry["hash"]] -= 1
+            if not links[entry["hash"]]:
+                total -= sizes[entry["hash"]]
+
+        self.remove_orphans()
+
+        return len(removed)
+
+    def remove_orphans(self):
+        """
+        remove compressed pages which are not in index
+        """
+
+        used = {entry["hash"] for entry in self.index.values()}
+        objects = os.path.join(self.path, "objects")
+        if not os.path.exists(objects):
+            return
+
+        for folder in os.listdir(objects):
+            for digest in os.listdir(os.path.join(objects, folder)):
+                if digest not in used:
+                    os.remove(os.path.join(objects, folder, digest))
+
+    def save(self):
+        """
+        write index to disk
+        """
+
+        os.makedirs(self.path, exist_ok=True)
+        temp_file = f"{self.index_file}.tmp"
+        with open(temp_file, "w") as file:
+            json.dump(self.index, file)
+        os.replace(temp_file, self.index_file)
@@ -2,37 +2,277 @@
 Make predictions for city grid polygons without price
 """
 
+import json
+import logging
+import os
+
 import geopandas as gpd
 import numpy as np
-from sklearn.model_selection import GridSearchCV
-from sklearn.neighbors import KNeighborsRegressor
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from data_preproc import (
+    adaptive_axes,
+    adaptive_file,
+    adaptive_grid,
+    adaptive_key,
+    build_city_grid,
+    centroid_coordinates,
+    city_grid,
+    get_min_max_cord,
+    grid_axes,
+    grid_key,
+    remove_gpkg,
+    write_gpkg,
+)
+from interpolation import ENGINES, make_engine, project
+from jobs import WORKERS, failed_jobs, run_jobs
+from knn_tuner import tuned_knn_params
+from price_raster import (
+    cells_raster,
+    raster_file,
+    raster_header,
+    read_raster,
+    write_raster,
+)
+from quadtree import fill_cells
+from smoothing import BANDWIDTH, smooth_prices
+
+
+def model_params(city, app, engine, X_train, y_train, lat_0):
+    """
+    :param city: city key
+    :param app: apartment type key
+    :param engine: interpolation engine name from interpolation.ENGINES
+    :param X_train: numpy array (n, 2) of training coordinates
+    :param y_train: numpy array of training prices
+    :param lat_0: latitude of projection center of projected engines
+    :return: tuned parameters of KNN engines, default ones for others
+    """
+
+    if not engine.startswith("knn"):
+        return {}
+
+    # параметры модели из файла, если данные для обучения почти не изменились
+    X_tune = project(X_train, lat_0) if ENGINES[engine][1] else X_train
+
+    return tuned_knn_params(f"Data_predict/{city}_{app}_{engine}.json", X_tune, y_train)
+
+
+def changed_cells(state, cell_ids, y_train):
+    """
+    :param state: prediction state of the last run
+    :param cell_ids: numpy array of training cells ids (grid positions)
+    :param y_train: numpy array of training prices
+    :return: numpy array of ids of added, removed cells and cells with new price
+    """
+
+    old = pd.Series(state["train_price"], index=state["train_cell_id"])
+    new = pd.Series(y_train, index=cell_ids)
+    prices = pd.concat([old, new], axis=1)
+
+    return prices.index[prices[0].ne(prices[1])].to_numpy()
+
+
+def affected_cells(mod, points, radius, changed_points):
+    """
+    prediction of the cell can change only if changed training cell is
+    in the radius of the farthest neighbor used for the last prediction:
+    removed and changed cells are there, added cells are closer than
+    the farthest old neighbor if they replace it
+
+    :param mod: fitted interpolation engine
+    :param points: numpy array (n, 2) of grid cells coordinates
+    :param radius: numpy array of the last run neighbors radius of cells
+    :param changed_points: numpy array (m, 2) of changed training cells coordinates
+    :return: numpy array of grid positions of cells to predict again
+    """
+
+    if not len(changed_points):
+        return np.empty(0, dtype=int)
+
+    distances = cKDTree(mod.transform(changed_points)).query(mod.transform(points))[0]
 
+    return np.flatnonzero(distances <= radius * (1 + 1e-9))
 
-def point_to_coord(gdf):
+
+def load_state(file_name):
+    """
+    :param file_name: '.npz' prediction state file
+    :return: dict with prediction state arrays, None if there is no file
     """
-    modified column GeoSeries 'centroids' to numpy.array 'coordinates'
 
-    :param gdf: input GeoPandasDataFrame
-    :return: GeoPandasDataFrame
+    if not os.path.exists(file_name):
+        return None
+    with np.load(file_name) as state:
+        return {name: state[name] for name in state.files}
+
+
+def write_predict_gpkg(grid_cells, prices, file_name):
+    """
+    :param grid_cells: GeoPandasDataFrame with grid cells polygons
+    :param prices: numpy array of predicted prices of grid cells
+    :param file_name: '.gpkg' file name
     """
 
-    new_gdf = gpd.GeoDataFrame(columns=["centroid"])
-    new_gdf["centroid"] = gdf
-    coordinates = []
+    city_grid_predict = grid_cells.copy()
+    city_grid_predict["price_per_square"] = prices
+    city_grid_predict["geoid"] = city_grid_predict.index.astype(str)
+    write_gpkg(city_grid_predict[["geoid", "price_per_square", "geometry"]], file_name)
 
-    for row in new_gdf["centroid"]:
-        coordinates.append(np.array(row.coords[0]))
-    new_gdf["coordinates"] = coordinates
 
-    return new_gdf
+def predict_prices(
+    city,
+    app,
+    engine="knn",
+    incremental=False,
+    gpkg=False,
+    bandwidth=BANDWIDTH,
+    adaptive=False,
+):
+    """
+    - make predictions for city grid polygons
+    - adaptive=True: predictions for cells of adaptive grid, raster has
+      the smallest cells of adaptive grid, every cell fills its block
+    - save them to 'city_app_predict.raster' (price_raster),
+      to GeoPandasDataFrame 'city_app_predict.gpkg' if gpkg=True,
+      'city_app_predict.gpkg' of previous runs is removed if gpkg=False
+    - save smoothed prices and offers density surfaces (smoothing)
+    - save prediction state: training cells prices, predictions
+      and neighbors radius of grid cells
+    - incremental=True: if grid and model parameters are the same as in the last
+      run, only cells with changed training cells in their neighbors radius
+      are predicted again and updated in the saved files
 
+    :param city: city key
+    :param app: apartment type key
+    :param engine: interpolation engine name from interpolation.ENGINES,
+                   parameters of KNN engines are tuned
+    :param incremental: predict only cells affected by changed prices
+    :param gpkg: save polygons with predictions to 'city_app_predict.gpkg' too
+    :param bandwidth: standard deviation of Gaussian kernel of surfaces in km
+    :param adaptive: cells of adaptive grid 'grid_city_adaptive.gpkg'
+    """
 
-def predictions():
+    predict_file = f"Data_predict/{city}_{app}_predict.gpkg"
+    raster_name = raster_file(city, app)
+    state_file = f"Data_predict/{city}_{app}_state.npz"
+
+    # подготавливаем датафрейм с данными для обучения модели
+    city_grid_prices = gpd.read_file(f"Data_preproc/{city}_{app}_grid_gpd.gpkg")
+    city_grid_prices = city_grid_prices.rename(
+        columns={"price_per_": "price_per_square"}
+    )
+    city_grid_train = city_grid_prices[city_grid_prices["price_per_square"] > 50000]
+    X_train = centroid_coordinates(city_grid_train)
+    y_train = city_grid_train["price_per_square"].to_numpy(dtype=np.float64)
+    cell_ids = None
+    if "cell_id" in city_grid_train:
+        # иерархические номера ячеек адаптивной сетки сохраняются строками
+        cell_ids = city_grid_train["cell_id"].to_numpy()
+        if cell_ids.dtype == object:
+            cell_ids = cell_ids.astype(str)
+
+    # состояние прошлого запуска подходит, если сетка и модель те же
+    grid_cells = adaptive_grid(city) if adaptive else None
+    key = adaptive_key(city, grid_cells) if adaptive else grid_key(city)
+    state = load_state(state_file) if incremental else None
+    if (
+        state is None
+        or cell_ids is None
+        or "cells" not in state
+        or not os.path.isfile(raster_name)
+        or (gpkg and not os.path.isfile(predict_file))
+        or str(state["key"]) != key
+        or str(state["engine"]) != engine
+    ):
+        state = None
+        if grid_cells is None:
+            grid_cells = city_grid(city)
+        points = centroid_coordinates(grid_cells)
+        cells = grid_cells[["row", "col", "size"] if adaptive else ["row", "col"]]
+        cells = cells.to_numpy()
+    else:
+        points, cells = state["points"], state["cells"]
+    # размеры ячеек адаптивной сетки в ячейках растра
+    sizes = cells[:, 2] if cells.shape[1] > 2 else np.ones(len(cells), dtype=int)
+
+    # обучаем модель по координатам центров полигонов
+    lat_0 = points[:, 1].mean()
+    mod_parameters = model_params(city, app, engine, X_train, y_train, lat_0)
+    mod = make_engine(engine, lat_0=lat_0, **mod_parameters).fit(X_train, y_train)
+
+    if state is not None and str(state["params"]) == json.dumps(mod_parameters):
+        # предсказываем заново только ячейки рядом с изменившимися ценами
+        prices, radius = state["prices"], state["radius"]
+        changed = changed_cells(state, cell_ids, y_train)
+        if adaptive:
+            # позиции ячеек адаптивной сетки по иерархическим номерам
+            changed = pd.Index(grid_cells["cell_id"]).get_indexer(changed)
+        rows = affected_cells(mod, points, radius, points[changed])
+        prices[rows] = mod.predict(points[rows])
+        radius[rows] = mod.radius(points[rows])
+        values, _ = read_raster(raster_name, "r+")
+        fill_cells(values, cells[rows, 0], cells[rows, 1], sizes[rows], prices[rows])
+        values.flush()
+        if gpkg:
+            # файл полигонов переписывается целиком, сетка та же, что в прошлый раз
+            if grid_cells is None:
+                grid_cells = city_grid(city)
+            write_predict_gpkg(grid_cells, prices, predict_file)
+    else:
+        prices, radius = mod.predict(points), mod.radius(points)
+        # сохраняем предсказания в растр
+        if adaptive:
+            header = raster_header(*adaptive_axes(city))
+            header["grid"] = adaptive_file(city)
+        else:
+            geo_city = f"Data_preproc/{city}_geo.json"
+            header = raster_header(*grid_axes(*get_min_max_cord(geo_city, city)))
+        values = cells_raster(cells[:, 0], cells[:, 1], prices, header, sizes)
+        write_raster(raster_name, values, header)
+        if gpkg:
+            write_predict_gpkg(grid_cells, prices, predict_file)
+    if not gpkg and os.path.exists(predict_file):
+        # полигоны прошлого запуска не обновляются, растр - единственный источник
+        remove_gpkg(predict_file)
+
+    if cell_ids is not None:
+        np.savez(
+            state_file,
+            key=key,
+            engine=engine,
+            params=json.dumps(mod_parameters),
+            points=points,
+            cells=cells,
+            prices=prices,
+            radius=radius,
+            train_cell_id=cell_ids,
+            train_price=y_train,
+        )
+
+    smooth_prices(city, app, bandwidth)
+
+
+def predictions(
+    workers=WORKERS,
+    engine="knn",
+    incremental=False,
+    gpkg=False,
+    bandwidth=BANDWIDTH,
+    adaptive=False,
+):
     """
-    - make predictions
-    - save them to GeoPandasDataFrame
+    make predictions for cities and apartment types in parallel processes
 
-    :return: GeoPandasDataFrame with predictions
+    :param workers: number of processes
+    :param engine: interpolation engine name from interpolation.ENGINES
+    :param incremental: predict only cells affected by changed prices
+    :param gpkg: save polygons with predictions to '.gpkg' files too
+    :param bandwidth: standard deviation of Gaussian kernel of surfaces in km
+    :param adaptive: predictions for cells of adaptive grids built by
+                     data_preproc.main(adaptive=True)
+    :return: dict {job: {"error": traceback text or None, "time": seconds}}
     """
 
     cities = {
@@ -46,58 +286,20 @@ def predictions():
         "new": "novostroyka",
     }
 
-    for city in cities:
-        for app in app_type:
-            # подготавливаем датафрейм с данными для обучения модели
-            city_grid_prices = gpd.read_file(f"Data_preproc/{city}_{app}_grid_gpd.gpkg")
-            city_grid_prices = city_grid_prices.rename(
-                columns={"price_per_": "price_per_square"}
-            )
-            # добавляем столбец 'centroid' и 'coordinates'
-            city_grid_prices["centroid"] = city_grid_prices["geometry"].centroid
-            city_grid_prices = city_grid_prices.merge(
-                point_to_coord(city_grid_prices["centroid"]), on="centroid"
-            )
-            city_grid_train = city_grid_prices[
-                city_grid_prices["price_per_square"] > 50000
-            ]
-            # подготавливаем датафрейм с полигонами для предсказаний цены
-            city_grid = gpd.read_file(f"Data_preproc/grid_{city}_bound.gpkg").drop(
-                "FID", axis=1
-            )
-            # city_grid['price_per_square'] = np.zeros(city_grid.shape[0])
-            # добавляем столбец 'centroid' и 'coordinates'
-            city_grid["centroid"] = city_grid["geometry"].centroid
-            city_grid_predict = city_grid.merge(
-                point_to_coord(city_grid["centroid"]), on="centroid"
-            )
-            # обучаем модель
-            X_train, y_train = (
-                city_grid_train["coordinates"].values.tolist(),
-                city_grid_train["price_per_square"].values.tolist(),
-            )
-            mod = KNeighborsRegressor()
-            mod_parameters = {
-                "n_neighbors": range(2, 40, 2),
-                "weights": ["distance", "uniform"],
-            }
-            GSCV = GridSearchCV(mod, param_grid=mod_parameters, n_jobs=-1)
-            GSCV.fit(X_train, y_train)
-            city_grid_predict["price_per_square"] = GSCV.predict(
-                city_grid_predict["coordinates"].values.tolist()
-            )
-
-            # print(GSCV.best_params_)
-            # print(GSCV.best_score_)
-            # print(city_grid_prices["price_per_square"].describe())
-            # print(city_grid_predict["price_per_square"].describe())
-            # сохраняем предсказани я в файл
-            city_grid_predict["geoid"] = city_grid_predict.index.astype(str)
-            city_grid_to_viz = city_grid_predict[
-                ["geoid", "price_per_square", "geometry"]
-            ]
-            city_grid_to_viz.to_file(f"Data_predict/{city}_{app}_predict.gpkg")
+    # сетки городов строятся до запуска параллельных предсказаний
+    results = run_jobs(build_city_grid, [(city,) for city in cities], workers)
+    failed = {job[0] for job in failed_jobs(results)}
+    jobs = [
+        (city, app, engine, incremental, gpkg, bandwidth, adaptive)
+        for city in cities
+        if city not in failed
+        for app in app_type
+    ]
+    results.update(run_jobs(predict_prices, jobs, workers))
+
+    return results
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     predictions()
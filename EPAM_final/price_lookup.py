@@ -0,0 +1,107 @@
+"""
+Batch lookup of predicted and observed prices of points on city grid
+"""
+
+import geopandas as gpd
+import numpy as np
+
+from data_preproc import centroid_coordinates, locate_cells
+from price_raster import cells_raster, raster_axes, raster_file, read_raster
+
+
+def observed_cells(file_name, header):
+    """
+    :param file_name: '.gpkg' file with mean prices of offers in grid cells
+    :param header: price raster header dict
+    :return: GeoPandasDataFrame with prices statistics of cells
+             and "row", "col" of cells in raster, "size" of cells
+             of adaptive grid (header "grid") in raster cells,
+             row = -1 for cells out of raster grid
+    """
+
+    prices = gpd.read_file(file_name)
+    # shapefiles of previous versions have 10 characters column names
+    prices = prices.rename(
+        columns={"price_per_": "price_per_square", "price_coun": "price_count"}
+    )
+    if "grid" in header:
+        # ячейки адаптивной сетки по иерархическим номерам
+        cells = gpd.read_file(header["grid"], ignore_geometry=True)
+        cells = cells.set_index("cell_id")[["row", "col", "size"]]
+        cells = cells.reindex(prices["cell_id"]).fillna(-1).astype(int)
+        for column in cells:
+            prices[column] = cells[column].to_numpy()
+    else:
+        x, y = centroid_coordinates(prices).T
+        prices["row"], prices["col"] = locate_cells(x, y, *raster_axes(header))
+        prices["size"] = 1
+
+    return prices
+
+
+def observed_raster(file_name, header):
+    """
+    :param file_name: '.gpkg' file with mean prices of offers in grid cells
+    :param header: price raster header dict
+    :return: numpy array (rows, cols) of mean prices, NaN - no offers in cell
+    """
+
+    prices = observed_cells(file_name, header)
+    prices = prices[prices["row"] >= 0]
+
+    return cells_raster(
+        prices["row"].to_numpy(),
+        prices["col"].to_numpy(),
+        prices["price_per_square"].to_numpy(),
+        header,
+        prices["size"].to_numpy(),
+    )
+
+
+class PriceLookup:
+    """
+    predicted and observed prices of city and apartment type grid:
+    - files are read once when lookup is created
+    - lookup(lat, long) finds grid cells of points from grid origin and steps
+    - memory=True: raster is copied to memory instead of memory map,
+      so lookup does not see later changes of the file
+    """
+
+    def __init__(self, city, app, memory=False):
+        self.city = city
+        self.app = app
+        self.predicted, header = read_raster(raster_file(city, app))
+        if memory:
+            self.predicted = np.array(self.predicted)
+        self.lat_array, self.long_array = raster_axes(header)
+        self.observed = observed_raster(
+            f"Data_preproc/{city}_{app}_grid_gpd.gpkg", header
+        )
+
+    def cells(self, lat, long):
+        """
+        :param lat: numpy array of points latitudes
+        :param long: numpy array of points longitudes
+        :return: rows, cols numpy arrays of grid cells, -1 for points out of grid
+        """
+
+        return locate_cells(long, lat, self.lat_array, self.long_array)
+
+    def lookup(self, lat, long):
+        """
+        :param lat: numpy array of points latitudes
+        :param long: numpy array of points longitudes
+        :return: predicted, observed prices per square numpy arrays
+                 (NaN if there is no price), boolean numpy array out:
+                 True for points out of city grid
+        """
+
+        rows, cols = self.cells(lat, long)
+        predicted = self.predicted[rows, cols].astype(np.float64)
+        observed = self.observed[rows, cols].astype(np.float64)
+        # ячейки вне сетки и вне границ города без предсказаний
+        out = (rows < 0) | np.isnan(predicted)
+        predicted[out] = np.nan
+        observed[out] = np.nan
+
+        return predicted, observed, out
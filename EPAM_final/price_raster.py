@@ -0,0 +1,174 @@
+"""
+Dense raster of predicted prices: float32 values of grid cells read by memory mapping,
+polygons of cells are created only for GeoPackage export
+"""
+
+import json
+import os
+import struct
+
+import geopandas as gpd
+import numpy as np
+
+from data_preproc import cell_polygons, write_gpkg
+from quadtree import fill_cells
+
+MAGIC = b"PRICERST"
+ALIGN = 64  # bytes, values start is aligned to it
+DTYPE = np.dtype("<f4")
+
+
+def raster_file(city, app):
+    """
+    :param city: city key
+    :param app: apartment type key
+    :return: raster file name
+    """
+
+    return f"Data_predict/{city}_{app}_predict.raster"
+
+
+def raster_header(lat_array, long_array):
+    """
+    :param lat_array: grid lines x (numpy.linspace)
+    :param long_array: grid lines y (numpy.linspace)
+    :return: header dict: grid lines linspace parameters, origin,
+             steps and shape (rows, cols) of raster
+    """
+
+    return {
+        "lat_start": float(lat_array[0]),
+        "lat_stop": float(lat_array[-1]),
+        "lat_num": len(lat_array),
+        "long_start": float(long_array[0]),
+        "long_stop": float(long_array[-1]),
+        "long_num": len(long_array),
+        "origin": [float(lat_array[0]), float(long_array[0])],
+        "steps": [
+            float((lat_array[-1] - lat_array[0]) / max(len(lat_array) - 1, 1)),
+            float((long_array[-1] - long_array[0]) / max(len(long_array) - 1, 1)),
+        ],
+        "shape": [max(len(long_array) - 1, 0), max(len(lat_array) - 1, 0)],
+    }
+
+
+def raster_axes(header):
+    """
+    :param header: raster header dict
+    :return: lat_array, long_array - the same grid lines as data_preproc.grid_axes
+    """
+
+    lat_array = np.linspace(
+        header["lat_start"], header["lat_stop"], num=header["lat_num"]
+    )
+    long_array = np.linspace(
+        header["long_start"], header["long_stop"], num=header["long_num"]
+    )
+
+    return lat_array, long_array
+
+
+def write_raster(file_name, values, header):
+    """
+    file: MAGIC, header length (uint32), json header,
+    padding to ALIGN bytes, float32 values row by row;
+    it is written to "file_name.tmp" and renamed, so readers never see a part of it
+
+    :param file_name: raster file name
+    :param values: numpy array (rows, cols) of prices, NaN - no cell
+    :param header: raster header dict
+    """
+
+    data = json.dumps(header).encode()
+    offset = -(-(len(MAGIC) + 4 + len(data)) // ALIGN) * ALIGN
+
+    with open(f"{file_name}.tmp", "wb") as file:
+        file.write(MAGIC + struct.pack("<I", len(data)) + data)
+        file.write(b"\0" * (offset - file.tell()))
+        file.write(np.ascontiguousarray(values, dtype=DTYPE).tobytes())
+    os.replace(f"{file_name}.tmp", file_name)
+
+
+def read_raster(file_name, mode="r"):
+    """
+    :param file_name: raster file name
+    :param mode: numpy.memmap mode: "r" - read only, "r+" - change values in file
+    :return: numpy.memmap (rows, cols) of prices, raster header dict
+    """
+
+    with open(file_name, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{file_name} is not a price raster")
+        (length,) = struct.unpack("<I", file.read(4))
+        header = json.loads(file.read(length))
+
+    offset = -(-(len(MAGIC) + 4 + length) // ALIGN) * ALIGN
+    values = np.memmap(
+        file_name, dtype=DTYPE, mode=mode, offset=offset, shape=tuple(header["shape"])
+    )
+
+    return values, header
+
+
+def cells_raster(rows, cols, prices, header, sizes=1):
+    """
+    :param rows: numpy array of cells rows
+    :param cols: numpy array of cells columns
+    :param prices: numpy array of cells prices
+    :param header: raster header dict
+    :param sizes: numpy array of sizes of adaptive grid cells in raster cells
+                  or one size of all cells
+    :return: numpy array (rows, cols) float32, NaN out of cells
+    """
+
+    values = np.full(header["shape"], np.nan, dtype=DTYPE)
+    fill_cells(values, rows, cols, sizes, prices)
+
+    return values
+
+
+def raster_gdf(values, header):
+    """
+    create polygons of raster cells with prices, raster of adaptive grid
+    (header "grid" - adaptive grid file) has polygons of adaptive grid cells
+
+    :param values: numpy array (rows, cols) of prices, NaN - no cell
+    :param header: raster header dict
+    :return: GeoPandasDataFrame with "geoid", "price_per_square", "row", "col"
+             of cells in rows order, the same as in bounded grid
+    """
+
+    if "grid" in header:
+        raster_df = gpd.read_file(header["grid"])
+        raster_df.insert(
+            0,
+            "price_per_square",
+            np.asarray(values[raster_df["row"], raster_df["col"]], dtype=np.float64),
+        )
+        raster_df = raster_df[raster_df["price_per_square"].notna()]
+        raster_df = raster_df.reset_index(drop=True)
+    else:
+        rows, cols = np.nonzero(~np.isnan(values))
+        geometry = cell_polygons(rows, cols, *raster_axes(header))
+        raster_df = gpd.GeoDataFrame(
+            {
+                "price_per_square": np.asarray(values[rows, cols], dtype=np.float64),
+                "row": rows,
+                "col": cols,
+            },
+            geometry=geometry,
+            crs="EPSG:4326",
+        )
+    raster_df.insert(0, "geoid", raster_df.index.astype(str))
+
+    return raster_df
+
+
+def export_gpkg(raster_name, file_name):
+    """
+    :param raster_name: raster file name
+    :param file_name: '.gpkg' file name
+    """
+
+    values, header = read_raster(raster_name)
+    write_gpkg(raster_gdf(values, header), file_name)
@@ -0,0 +1,425 @@
+"""
+Local HTTP service of prices per square: point, bbox and district queries
+answered from grids in memory, grids are reloaded when prediction files change
+
+run from EPAM_final directory: python price_service.py
+"""
+
+import asyncio
+import bisect
+import logging
+import math
+import os
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+from offers_storage import find_offers_file, read_offers
+from price_lookup import PriceLookup
+from price_raster import raster_file
+
+CITIES = ("Mos", "SPb", "Ekb")
+APPS = ("sec", "new")
+RELOAD_INTERVAL = 5  # seconds between checks of grid files
+PORT = 8080
+
+logger = logging.getLogger(__name__)
+
+
+def grid_files(city, app):
+    """
+    :param city: city key
+    :param app: apartment type key
+    :return: files of predicted and observed prices of grid
+    """
+
+    return raster_file(city, app), f"Data_preproc/{city}_{app}_grid_gpd.gpkg"
+
+
+def files_version(file_names):
+    """
+    :param file_names: list of file names
+    :return: tuple of files modification times, None if some file does not exist
+    """
+
+    try:
+        return tuple(os.stat(file_name).st_mtime_ns for file_name in file_names)
+    except FileNotFoundError:
+        return None
+
+
+def summed_area(values):
+    """
+    :param values: numpy array (rows, cols) of prices, NaN - no price
+    :return: numpy arrays (rows + 1, cols + 1) of sums of prices and numbers
+             of prices in cells [0, row) x [0, col)
+    """
+
+    known = ~np.isnan(values)
+    tables = []
+    for table in (np.where(known, values, 0.0), known.astype(np.float64)):
+        table = np.pad(table.astype(np.float64), ((1, 0), (1, 0)))
+        tables.append(table.cumsum(axis=0).cumsum(axis=1))
+
+    return tables
+
+
+def district_cells(city, app, lookup):
+    """
+    cells of districts are cells with offers of this microdistrict
+
+    :param city: city key
+    :param app: apartment type key
+    :param lookup: PriceLookup of city and apartment type
+    :return: dict {district name: (rows, cols) numpy arrays of grid cells}
+    """
+
+    if not os.path.exists(find_offers_file(city, app)):
+        return {}
+
+    offers_df = read_offers(
+        city, app, ["microdistrict", "location_lat", "location_long"]
+    ).dropna()
+    names = offers_df["microdistrict"].astype(str).str.replace("район", "").str.strip()
+    rows, cols = lookup.cells(
+        offers_df["location_lat"].to_numpy(), offers_df["location_long"].to_numpy()
+    )
+    inside = rows >= 0
+    cells_df = pd.DataFrame(
+        {"name": names.to_numpy()[inside], "row": rows[inside], "col": cols[inside]}
+    ).drop_duplicates()
+
+    return {
+        name: (district_df["row"].to_numpy(), district_df["col"].to_numpy())
+        for name, district_df in cells_df.groupby("name")
+    }
+
+
+def range_sum(tables, row_start, row_stop, col_start, col_stop):
+    """
+    :param tables: summed area tables of sums and numbers of prices
+    :param row_start: first row of cells
+    :param row_stop: row after the last one
+    :param col_start: first column of cells
+    :param col_stop: column after the last one
+    :return: sum of prices, number of prices in cells
+    """
+
+    total, count = (
+        table[row_stop, col_stop]
+        - table[row_start, col_stop]
+        - table[row_stop, col_start]
+        + table[row_start, col_start]
+        for table in tables
+    )
+
+    return total, int(round(count))
+
+
+def mean_or_none(total, count):
+    """
+    :param total: sum of prices
+    :param count: number of prices
+    :return: mean price, None if there are no prices
+    """
+
+    return float(total / count) if count else None
+
+
+def cells_stats(predicted, observed):
+    """
+    :param predicted: numpy array of predicted prices of cells
+    :param observed: numpy array of observed prices of cells
+    :return: dict with numbers of cells with prices and mean prices
+    """
+
+    n_predicted = int(np.count_nonzero(~np.isnan(predicted)))
+    n_observed = int(np.count_nonzero(~np.isnan(observed)))
+
+    return {
+        "cells": n_predicted,
+        "predicted": mean_or_none(np.nansum(predicted), n_predicted),
+        "observed_cells": n_observed,
+        "observed": mean_or_none(np.nansum(observed), n_observed),
+    }
+
+
+class GridIndex:
+    """
+    prices of city and apartment type grid in memory:
+    - point(lat, long) - prices of cell with point
+    - bbox(...) - mean prices of cells intersecting box from summed area tables
+      in constant time, so results are not cached
+    - district(name) - mean prices of cells of district, computed when loaded
+    """
+
+    def __init__(self, city, app):
+        self.city = city
+        self.app = app
+        self.lookup = PriceLookup(city, app, memory=True)
+        # линии сетки списками для поиска ячейки одной точки без numpy
+        self.row_lines = self.lookup.long_array.tolist()
+        self.col_lines = self.lookup.lat_array.tolist()
+        self.predicted_tables = summed_area(self.lookup.predicted)
+        self.observed_tables = summed_area(self.lookup.observed)
+        self.districts = {
+            name: cells_stats(
+                self.lookup.predicted[rows, cols], self.lookup.observed[rows, cols]
+            )
+            for name, (rows, cols) in district_cells(city, app, self.lookup).items()
+        }
+
+    def point(self, lat, long):
+        """
+        :param lat: point latitude
+        :param long: point longitude
+        :return: dict with predicted and observed prices (None if there is no price)
+                 and out=True for point out of city grid
+        """
+
+        row = axis_cell(self.row_lines, lat)
+        col = axis_cell(self.col_lines, long)
+        if row < 0 or col < 0 or math.isnan(self.lookup.predicted[row, col]):
+            return {"predicted": None, "observed": None, "out": True}
+
+        observed = float(self.lookup.observed[row, col])
+        return {
+            "predicted": float(self.lookup.predicted[row, col]),
+            "observed": None if math.isnan(observed) else observed,
+            "out": False,
+        }
+
+    def bbox(self, lat_min, long_min, lat_max, long_max):
+        """
+        :param lat_min: min latitude of box
+        :param long_min: min longitude of box
+        :param lat_max: max latitude of box
+        :param long_max: max longitude of box
+        :return: dict with numbers of cells with prices and mean prices
+                 of cells intersecting box
+        """
+
+        # строки сетки - по широте, столбцы - по долготе
+        row_start, row_stop = axis_range(self.lookup.long_array, lat_min, lat_max)
+        col_start, col_stop = axis_range(self.lookup.lat_array, long_min, long_max)
+
+        return self.range_stats(row_start, row_stop, col_start, col_stop)
+
+    def range_stats(self, row_start, row_stop, col_start, col_stop):
+        """
+        :param row_start: first row of cells
+        :param row_stop: row after the last one
+        :param col_start: first column of cells
+        :param col_stop: column after the last one
+        :return: dict with numbers of cells with prices and mean prices of cells
+        """
+
+        cells = row_start, row_stop, col_start, col_stop
+        predicted, n_predicted = range_sum(self.predicted_tables, *cells)
+        observed, n_observed = range_sum(self.observed_tables, *cells)
+
+        return {
+            "cells": n_predicted,
+            "predicted": mean_or_none(predicted, n_predicted),
+            "observed_cells": n_observed,
+            "observed": mean_or_none(observed, n_observed),
+        }
+
+    def district(self, name):
+        """
+        :param name: district name
+        :return: dict with numbers of cells with prices and mean prices
+                 of cells of district, None if there is no such district
+        """
+
+        return self.districts.get(name)
+
+
+def axis_cell(lines, value):
+    """
+    :param lines: list of grid lines
+    :param value: coordinate of point
+    :return: index of the grid interval [lines[i], lines[i + 1]) with value,
+             -1 if value is out of grid (the same as data_preproc.axis_index)
+    """
+
+    index = bisect.bisect_right(lines, value) - 1
+    if index >= len(lines) - 1:
+        return -1
+
+    return index
+
+
+def axis_range(axis, start, stop):
+    """
+    :param axis: evenly spaced grid lines
+    :param start: min coordinate of box
+    :param stop: max coordinate of box
+    :return: first and after the last intervals [axis[i], axis[i + 1])
+             intersecting [start, stop],
+             empty range (0, 0) if there are no such intervals
+    """
+
+    n_cells = len(axis) - 1
+    first = max(int(np.searchsorted(axis, start, side="right")) - 1, 0)
+    stop = min(int(np.searchsorted(axis, stop, side="right")), n_cells)
+    if first >= stop:
+        return 0, 0
+
+    return first, stop
+
+
+class PriceService:
+    """
+    grids of cities and apartment types in memory:
+    - grids with both files of prices are loaded at start
+    - reload() loads grids with new or changed files in thread
+      and replaces old ones, requests use old grids until then
+    """
+
+    def __init__(self, cities=CITIES, apps=APPS):
+        self.jobs = [(city, app) for city in cities for app in apps]
+        self.indexes = {}
+        self.versions = {}
+
+    def load(self, city, app, version):
+        """
+        :param city: city key
+        :param app: apartment type key
+        :param version: files modification times
+        """
+
+        try:
+            index = GridIndex(city, app)
+        except Exception:
+            # файл мог быть записан не до конца, пробуем при следующей проверке
+            logger.exception("grid %s %s is not loaded", city, app)
+            return
+        self.indexes[(city, app)] = index
+        self.versions[(city, app)] = version
+        logger.info("grid %s %s is loaded", city, app)
+
+    def changed(self):
+        """
+        :return: list of (city, app, version) of grids with new or changed files
+        """
+
+        changed = []
+        for city, app in self.jobs:
+            version = files_version(grid_files(city, app))
+            if version is not None and version != self.versions.get((city, app)):
+                changed.append((city, app, version))
+
+        return changed
+
+    async def reload(self):
+        """
+        load grids with new or changed files without blocking requests
+        """
+
+        loop = asyncio.get_running_loop()
+        for city, app, version in self.changed():
+            await loop.run_in_executor(None, self.load, city, app, version)
+
+    async def watch(self, interval=RELOAD_INTERVAL):
+        """
+        :param interval: seconds between checks of grid files
+        """
+
+        while True:
+            await asyncio.sleep(interval)
+            await self.reload()
+
+    def index(self, query):
+        """
+        :param query: request query with "city" and "app"
+        :return: GridIndex of city and apartment type
+        """
+
+        index = self.indexes.get((query.get("city"), query.get("app")))
+        if index is None:
+            raise web.HTTPNotFound(reason="no grid of city and apartment type")
+
+        return index
+
+
+def float_params(query, names):
+    """
+    :param query: request query
+    :param names: names of float parameters
+    :return: list of finite float values of parameters
+    """
+
+    try:
+        values = [float(query[name]) for name in names]
+    except (KeyError, ValueError):
+        raise web.HTTPBadRequest(reason=f"float parameters required: {names}")
+    if not all(math.isfinite(value) for value in values):
+        raise web.HTTPBadRequest(reason=f"finite parameters required: {names}")
+
+    return values
+
+
+def make_app(service, interval=RELOAD_INTERVAL):
+    """
+    :param service: PriceService
+    :param interval: seconds between checks of grid files, None - no reload
+    :return: aiohttp.web.Application with routes:
+             /price?city=&app=&lat=&long=
+             /bbox?city=&app=&lat_min=&long_min=&lat_max=&long_max=
+             /district?city=&app=&name=
+    """
+
+    async def price(request):
+        index = service.index(request.query)
+        lat, long = float_params(request.query, ["lat", "long"])
+        return web.json_response(index.point(lat, long))
+
+    async def bbox(request):
+        index = service.index(request.query)
+        box = float_params(
+            request.query, ["lat_min", "long_min", "lat_max", "long_max"]
+        )
+        return web.json_response(index.bbox(*box))
+
+    async def district(request):
+        index = service.index(request.query)
+        stats = index.district(request.query.get("name", "").strip())
+        if stats is None:
+            raise web.HTTPNotFound(reason="no such district")
+        return web.json_response(stats)
+
+    async def watch_files(app):
+        await service.reload()
+        task = None
+        if interval is not None:
+            task = asyncio.create_task(service.watch(interval))
+        yield
+        if task is not None:
+            task.cancel()
+
+    app = web.Application()
+    app.add_routes(
+        [
+            web.get("/price", price),
+            web.get("/bbox", bbox),
+            web.get("/district", district),
+        ]
+    )
+    app.cleanup_ctx.append(watch_files)
+
+    return app
+
+
+def main(port=PORT):
+    """
+    :param port: port of service on localhost
+    """
+
+    web.run_app(make_app(PriceService()), host="127.0.0.1", port=port)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,218 @@
+"""
+Pyramid of z/x/y PNG tiles (Web Mercator) of predicted prices rasters
+"""
+
+import math
+import os
+
+import numpy as np
+from branca.utilities import color_brewer
+from PIL import Image
+
+from data_preproc import axis_index
+from price_raster import raster_axes, raster_file, read_raster
+
+TILE_SIZE = 256  # pixels
+MIN_ZOOM = 8
+MAX_ZOOM = 14  # cells are drawn as vectors on higher zoom levels
+COLUMNS_PER_JOB = 8  # tiles columns rendered by one job
+TILES_DIR = "Output/tiles"
+
+
+def tiles_dir(city, app):
+    """
+    :param city: city key
+    :param app: apartment type key
+    :return: directory of tiles of city and apartment type, tiles are
+             in 'z/x/y.png' files
+    """
+
+    return f"{TILES_DIR}/{city}_{app}"
+
+
+def tile_longitudes(x, zoom, size=TILE_SIZE):
+    """
+    :param x: tile column
+    :param zoom: zoom level
+    :param size: tile size in pixels
+    :return: numpy array of longitudes of pixels centers of tile columns
+    """
+
+    pixels = x * size + np.arange(size) + 0.5
+    return pixels / (size * 2**zoom) * 360 - 180
+
+
+def tile_latitudes(y, zoom, size=TILE_SIZE):
+    """
+    :param y: tile row
+    :param zoom: zoom level
+    :param size: tile size in pixels
+    :return: numpy array of latitudes of pixels centers of tile rows
+    """
+
+    pixels = y * size + np.arange(size) + 0.5
+    return np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * pixels / (size * 2**zoom)))))
+
+
+def tile_index(lon, lat, zoom):
+    """
+    :param lon: longitude
+    :param lat: latitude
+    :param zoom: zoom level
+    :return: column and row of tile with point
+    """
+
+    n_tiles = 2**zoom
+    x = int((lon + 180) / 360 * n_tiles)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n_tiles)
+
+    return min(max(x, 0), n_tiles - 1), min(max(y, 0), n_tiles - 1)
+
+
+def grid_bounds(values, header):
+    """
+    :param values: numpy array (rows, cols) of prices, NaN - no cell
+    :param header: price raster header dict
+    :return: min longitude, min latitude, max longitude, max latitude
+             of raster cells with prices
+    """
+
+    lat_array, long_array = raster_axes(header)
+    rows = np.flatnonzero(~np.isnan(values).all(axis=1))
+    cols = np.flatnonzero(~np.isnan(values).all(axis=0))
+
+    return (
+        lat_array[cols[0]],
+        long_array[rows[0]],
+        lat_array[cols[-1] + 1],
+        long_array[rows[-1] + 1],
+    )
+
+
+def color_table(bins, colors="YlOrRd"):
+    """
+    :param bins: colors bin edges
+    :param colors: ColorBrewer scheme name
+    :return: numpy array (len(bins), 3) uint8 RGB colors of bins,
+             the last one is for cells without price
+    """
+
+    hex_colors = color_brewer(colors, n=len(bins) - 1)
+    table = np.zeros((len(hex_colors) + 1, 3), dtype=np.uint8)
+    for index, color in enumerate(hex_colors):
+        table[index] = [int(color[i : i + 2], 16) for i in (1, 3, 5)]
+
+    return table
+
+
+def colorize(values, bins):
+    """
+    the same colors as folium.Choropleth with the same bins
+
+    :param values: numpy array of prices, NaN - no price
+    :param bins: colors bin edges
+    :return: uint8 numpy array of colors indexes in color_table of bins,
+             len(bins) - 1 for NaN
+    """
+
+    index = np.searchsorted(np.asarray(bins[1:-1]), values, side="right")
+    index[np.isnan(values)] = len(bins) - 1
+
+    return index.astype(np.uint8)
+
+
+def tile_image(index, table):
+    """
+    :param index: numpy array (TILE_SIZE, TILE_SIZE) of colors indexes
+    :param table: color_table of bins
+    :return: PIL.Image with palette of table colors, the last one is transparent
+    """
+
+    image = Image.fromarray(index, "P")
+    image.putpalette(table.ravel().tolist())
+    image.info["transparency"] = len(table) - 1
+
+    return image
+
+
+def render_tile(values, lat_array, long_array, zoom, x, y, bins):
+    """
+    :param values: numpy array (rows, cols) of prices, NaN - no cell
+    :param lat_array: grid lines x (longitude)
+    :param long_array: grid lines y (latitude)
+    :param zoom: zoom level
+    :param x: tile column
+    :param y: tile row
+    :param bins: colors bin edges
+    :return: numpy array (TILE_SIZE, TILE_SIZE) of colors indexes,
+             None if there are no cells with prices in tile
+    """
+
+    # ячейка пикселя: столбец по долготе столбца пикселей, строка по широте строки
+    cols = axis_index(tile_longitudes(x, zoom), lat_array)
+    rows = axis_index(tile_latitudes(y, zoom), long_array)
+    if (cols < 0).all() or (rows < 0).all():
+        return None
+
+    tile = values[rows[:, None], cols[None, :]]
+    tile[(rows < 0)[:, None] | (cols < 0)[None, :]] = np.nan
+    if np.isnan(tile).all():
+        return None
+
+    return colorize(tile, bins)
+
+
+def render_tiles(city, app, zoom, x_start, x_stop, bins):
+    """
+    render tiles of columns [x_start, x_stop) with cells of city grid
+    to 'z/x/y.png' files, tiles without cells are skipped
+
+    :param city: city key
+    :param app: apartment type key
+    :param zoom: zoom level
+    :param x_start: first tile column
+    :param x_stop: column after the last one
+    :param bins: colors bin edges in thousands ₽
+    """
+
+    values, header = read_raster(raster_file(city, app))
+    values = values / 1000
+    lat_array, long_array = raster_axes(header)
+    lon_min, lat_min, lon_max, lat_max = grid_bounds(values, header)
+    # строки плиток идут с севера на юг
+    y_start = tile_index(lon_min, lat_max, zoom)[1]
+    y_stop = tile_index(lon_max, lat_min, zoom)[1] + 1
+    table = color_table(bins)
+
+    for x in range(x_start, x_stop):
+        for y in range(y_start, y_stop):
+            tile = render_tile(values, lat_array, long_array, zoom, x, y, bins)
+            if tile is None:
+                continue
+            directory = f"{tiles_dir(city, app)}/{zoom}/{x}"
+            os.makedirs(directory, exist_ok=True)
+            tile_image(tile, table).save(f"{directory}/{y}.png")
+
+
+def tile_jobs(city, app, bins, zooms=range(MIN_ZOOM, MAX_ZOOM + 1)):
+    """
+    :param city: city key
+    :param app: apartment type key
+    :param bins: colors bin edges in thousands ₽
+    :param zooms: zoom levels
+    :return: list of render_tiles jobs: COLUMNS_PER_JOB tiles columns
+             of grid bounds for every zoom level
+    """
+
+    values, header = read_raster(raster_file(city, app))
+    lon_min, lat_min, lon_max, lat_max = grid_bounds(values, header)
+
+    jobs = []
+    for zoom in zooms:
+        x_first = tile_index(lon_min, lat_max, zoom)[0]
+        x_last = tile_index(lon_max, lat_min, zoom)[0]
+        for x_start in range(x_first, x_last + 1, COLUMNS_PER_JOB):
+            x_stop = min(x_start + COLUMNS_PER_JOB, x_last + 1)
+            jobs.append((city, app, zoom, x_start, x_stop, tuple(bins)))
+
+    return jobs
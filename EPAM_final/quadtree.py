@@ -0,0 +1,131 @@
+"""
+Adaptive multi-resolution grid: quadtree of cells of a regular fine grid,
+cells are split where there are many offers and stay coarse where data is sparse
+"""
+
+import numpy as np
+
+SPLIT_COUNT = 10  # offers in cell above which it is split into 4 cells
+COARSE_LEVELS = 3  # root cell is 2**3 x 2**3 cells of fixed grid
+FINE_LEVELS = 1  # the smallest cell is fixed grid cell split 2**1 x 2**1 times
+
+
+def fine_axes(lat_array, long_array, fine_levels=FINE_LEVELS):
+    """
+    :param lat_array: grid lines x of fixed grid
+    :param long_array: grid lines y of fixed grid
+    :param fine_levels: number of splits of fixed grid cells
+    :return: lat_array, long_array of fine grid, every fixed grid line
+             is a fine grid line too
+    """
+
+    parts = 2**fine_levels
+
+    return tuple(
+        np.linspace(axis[0], axis[-1], num=max(len(axis) - 1, 0) * parts + 1)
+        for axis in (lat_array, long_array)
+    )
+
+
+def fill_cells(array, rows, cols, sizes, values):
+    """
+    set values of square blocks of cells: array[row: row + size, col: col + size]
+
+    :param array: numpy array (rows, cols)
+    :param rows: numpy array of blocks first rows
+    :param cols: numpy array of blocks first columns
+    :param sizes: numpy array of blocks sizes in cells or one size of all blocks
+    :param values: numpy array of blocks values or one value of all blocks
+    """
+
+    rows, cols = np.asarray(rows), np.asarray(cols)
+    sizes = np.broadcast_to(sizes, rows.shape)
+    values = np.broadcast_to(values, rows.shape)
+
+    # блоки одного размера заполняются сдвигами по строкам и столбцам
+    for size in np.unique(sizes):
+        same = sizes == size
+        for row in range(size):
+            for col in range(size):
+                array[rows[same] + row, cols[same] + col] = values[same]
+
+
+def block_sums(array, size):
+    """
+    :param array: numpy array (rows, cols), rows and cols are multiples of size
+    :param size: block size
+    :return: numpy array (rows / size, cols / size) of sums of blocks
+    """
+
+    rows, cols = array.shape
+
+    return array.reshape(rows // size, size, cols // size, size).sum(axis=(1, 3))
+
+
+def quadtree_cells(counts, inside, depth, split_count=SPLIT_COUNT):
+    """
+    leaves of quadtrees of root cells 2**depth x 2**depth fine cells:
+    cell is split if it has more than split_count offers or if a part of it
+    is out of the city, cells out of the city are dropped
+
+    :param counts: numpy array (rows, cols) of numbers of offers in fine cells
+    :param inside: boolean numpy array (rows, cols), True for fine cells in city
+    :param depth: number of levels under root cells
+    :param split_count: offers in cell above which it is split
+    :return: rows, cols of the first fine cells of leaves, leaves levels
+             (0 - root cell, depth - fine cell), leaves are in row by row order
+    """
+
+    root = 2**depth
+    padding = [(0, -size % root) for size in counts.shape]
+    counts = np.pad(counts, padding)
+    inside = np.pad(inside, padding).astype(np.int64)
+
+    leaves = []
+    active = np.ones([size // root for size in counts.shape], dtype=bool)
+    for level in range(depth + 1):
+        size = root >> level
+        n_inside = block_sums(inside, size)
+        split = active & (n_inside > 0)
+        if level < depth:
+            split &= (block_sums(counts, size) > split_count) | (n_inside < size**2)
+        else:
+            split[:] = False
+        leaf_rows, leaf_cols = np.nonzero(active & (n_inside > 0) & ~split)
+        leaves.append(
+            (leaf_rows * size, leaf_cols * size, np.full(len(leaf_rows), level))
+        )
+        # четыре ячейки следующего уровня у каждой разделенной ячейки
+        active = split.repeat(2, axis=0).repeat(2, axis=1)
+
+    rows, cols, levels = (np.concatenate(parts) for parts in zip(*leaves))
+    order = np.lexsort((cols, rows))
+
+    return rows[order], cols[order], levels[order]
+
+
+def quad_ids(rows, cols, levels, depth):
+    """
+    hierarchical ids of cells "root row_root col" + "-" + quadrants of levels:
+    quadrant is 2 * (upper half) + (right half), id of parent cell is
+    prefix of id of its cells, ids do not change if grid lines are the same
+
+    :param rows: numpy array of cells first fine rows
+    :param cols: numpy array of cells first fine columns
+    :param levels: numpy array of cells levels
+    :param depth: number of levels under root cells
+    :return: list of cells ids
+    """
+
+    ids = []
+    for row, col, level in zip(rows.tolist(), cols.tolist(), levels.tolist()):
+        cell_id = f"{row >> depth}_{col >> depth}"
+        if level:
+            quadrants = (
+                str(2 * (row >> shift & 1) + (col >> shift & 1))
+                for shift in range(depth - 1, depth - level - 1, -1)
+            )
+            cell_id += "-" + "".join(quadrants)
+        ids.append(cell_id)
+
+    return ids
@@ -0,0 +1,225 @@
+"""
+Smoothed prices and offers density surfaces of grid: Gaussian kernel
+regression of observed cells prices computed by separable 1D Gaussian filters,
+on fine grids filters run on coarse grid and surfaces are interpolated back
+"""
+
+import numpy as np
+from scipy.ndimage import gaussian_filter1d
+
+from interpolation import EARTH_RADIUS
+from price_lookup import observed_cells
+from price_raster import DTYPE, raster_axes, raster_file, read_raster, write_raster
+
+BANDWIDTH = 0.5  # km, standard deviation of Gaussian kernel
+TRUNCATE = 3.0  # kernel radius in standard deviations
+MIN_WEIGHT = 1e-3  # min kernel weight of offers to have smoothed price
+COARSE_SIGMA = 2.5  # min kernel standard deviation in cells of coarse grid
+
+
+def smooth_file(city, app, surface):
+    """
+    :param city: city key
+    :param app: apartment type key
+    :param surface: "smooth" - smoothed prices, "density" - offers per km²
+    :return: raster file name of surface
+    """
+
+    return f"Data_predict/{city}_{app}_{surface}.raster"
+
+
+def cell_size(header):
+    """
+    :param header: price raster header dict
+    :return: height and width of grid cell in km in the middle of grid
+    """
+
+    _, long_array = raster_axes(header)
+    lat_0 = (long_array[0] + long_array[-1]) / 2
+    scale = np.pi / 180 * EARTH_RADIUS
+    step_x, step_y = header["steps"]
+
+    return step_y * scale, step_x * scale * np.cos(np.radians(lat_0))
+
+
+def coarse_factor(sigma_rows, sigma_cols, coarse_sigma=COARSE_SIGMA):
+    """
+    :param sigma_rows: kernel standard deviation along rows in cells
+    :param sigma_cols: kernel standard deviation along columns in cells
+    :param coarse_sigma: min kernel standard deviation in cells of coarse grid
+    :return: number of grid cells in side of coarse grid cell, 1 - grid itself
+    """
+
+    return max(1, int(min(sigma_rows, sigma_cols) // coarse_sigma))
+
+
+def coarse_sums(rows, cols, values, shape, factor):
+    """
+    linear binning: values of cell are split between 2 x 2 nearest
+    centers of coarse cells by bilinear weights, sums of values are kept
+
+    :param rows: numpy array of cells rows
+    :param cols: numpy array of cells columns
+    :param values: numpy array (n, cells) of values of cells
+    :param shape: (rows, cols) of grid
+    :param factor: number of grid cells in side of coarse grid cell
+    :return: numpy array (n, rows / factor, cols / factor) of sums of values
+             in centers of coarse grid cells
+    """
+
+    coarse_shape = tuple(-(-size // factor) for size in shape)
+    values = np.asarray(values, dtype=np.float64)
+
+    # положение ячейки между центрами крупных ячеек по строкам и столбцам
+    neighbors = []
+    for cells, size in zip((rows, cols), coarse_shape):
+        position = (np.asarray(cells) + 0.5) / factor - 0.5
+        first = np.floor(position)
+        fraction = position - first
+        first = first.astype(np.intp)
+        neighbors.append(
+            [
+                (np.clip(first, 0, size - 1), 1 - fraction),
+                (np.clip(first + 1, 0, size - 1), fraction),
+            ]
+        )
+
+    sums = np.zeros((len(values), np.prod(coarse_shape)))
+    for row, row_weight in neighbors[0]:
+        for col, col_weight in neighbors[1]:
+            cells = np.ravel_multi_index((row, col), coarse_shape)
+            for array, weighted in zip(sums, values * (row_weight * col_weight)):
+                array += np.bincount(cells, weighted, len(array))
+
+    return sums.reshape(len(values), *coarse_shape)
+
+
+def gaussian_blur(arrays, sigma_rows, sigma_cols, truncate=TRUNCATE):
+    """
+    convolution of arrays with Gaussian kernel (sum of weights is 1)
+    by 1D filters along rows and along columns, zeros out of arrays
+
+    :param arrays: numpy array (n, rows, cols) of arrays
+    :param sigma_rows: kernel standard deviation along rows in cells
+    :param sigma_cols: kernel standard deviation along columns in cells
+    :param truncate: kernel radius in standard deviations
+    :return: numpy array (n, rows, cols) of convolutions
+    """
+
+    blurred = gaussian_filter1d(
+        arrays, sigma_rows, axis=1, mode="constant", truncate=truncate
+    )
+
+    return gaussian_filter1d(
+        blurred, sigma_cols, axis=2, mode="constant", truncate=truncate
+    )
+
+
+def upsample(arrays, factor, shape):
+    """
+    linear interpolation of coarse grid arrays between centers of coarse cells
+    to centers of grid cells, values of edge coarse cells out of their centers
+
+    :param arrays: numpy array (n, rows / factor, cols / factor) of coarse arrays
+    :param factor: number of grid cells in side of coarse grid cell
+    :param shape: (rows, cols) of grid
+    :return: numpy array (n, rows, cols) of arrays
+    """
+
+    # ячейка i между центрами крупных ячеек (i + shift) // factor и следующей
+    shift = (factor + 1) // 2
+    for axis, size in zip((1, 2), shape):
+        padding = [(1, 1) if i == axis else (0, 0) for i in range(3)]
+        repeated = np.repeat(np.pad(arrays, padding, mode="edge"), factor, axis=axis)
+        lower = [slice(None)] * 3
+        lower[axis] = slice(shift, shift + size)
+        upper = [slice(None)] * 3
+        upper[axis] = slice(shift + factor, shift + factor + size)
+        lower, upper = repeated[tuple(lower)], repeated[tuple(upper)]
+        cells = np.arange(size)
+        fractions = (cells + 0.5) / factor + 0.5 - (cells + shift) // factor
+        fractions = fractions.astype(arrays.dtype)
+        arrays = upper - lower
+        arrays *= fractions[:, None] if axis == 1 else fractions
+        arrays += lower
+
+    return arrays
+
+
+def smooth_surfaces(rows, cols, prices, counts, header, bandwidth=BANDWIDTH):
+    """
+    smoothed price = sum(K * count * price) / sum(K * count),
+    density = sum(K * count) / cell area, K - Gaussian kernel with sum 1,
+    if kernel is wider than COARSE_SIGMA coarse cells the surfaces are
+    computed on coarse grid and interpolated to grid cells
+
+    :param rows: numpy array of rows of cells with offers
+    :param cols: numpy array of columns of cells with offers
+    :param prices: numpy array of mean prices of cells
+    :param counts: numpy array of numbers of offers in cells
+    :param header: price raster header dict
+    :param bandwidth: standard deviation of Gaussian kernel in km
+    :return: numpy arrays (rows, cols) of grid of smoothed prices (NaN if offers
+             are too far) and offers density per km²
+    """
+
+    shape = tuple(header["shape"])
+    height, width = cell_size(header)
+    sigma_rows, sigma_cols = bandwidth / height, bandwidth / width
+    factor = coarse_factor(sigma_rows, sigma_cols)
+
+    counts = np.asarray(counts, dtype=np.float64)
+    weighted = coarse_sums(rows, cols, (counts * prices, counts), shape, factor)
+    price_sum, weight = gaussian_blur(
+        weighted, sigma_rows / factor, sigma_cols / factor
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        smoothed = price_sum / weight
+    # вес одного объявления дальше 3.7 стандартных отклонений
+    peak = factor**2 / (2 * np.pi * sigma_rows * sigma_cols)
+    smoothed[weight <= MIN_WEIGHT * peak] = np.nan
+    density = weight / (factor**2 * height * width)
+    if factor > 1:
+        # значения растра float32, интерполяция сразу в нем
+        surfaces = np.stack([smoothed, density]).astype(DTYPE)
+        smoothed, density = upsample(surfaces, factor, shape)
+
+    return smoothed, density
+
+
+def smooth_prices(city, app, bandwidth=BANDWIDTH):
+    """
+    write smoothed prices and offers density of cells of city grid
+    to 'city_app_smooth.raster' and 'city_app_density.raster'
+    with the same grid as 'city_app_predict.raster'
+
+    :param city: city key
+    :param app: apartment type key
+    :param bandwidth: standard deviation of Gaussian kernel in km
+    """
+
+    predicted, header = read_raster(raster_file(city, app))
+    cells = observed_cells(f"Data_preproc/{city}_{app}_grid_gpd.gpkg", header)
+    cells = cells[cells["row"] >= 0]
+    # предложения ячейки адаптивной сетки в ее центре
+    rows = (cells["row"] + cells["size"] // 2).to_numpy()
+    cols = (cells["col"] + cells["size"] // 2).to_numpy()
+    counts = np.ones(len(cells))
+    if "price_count" in cells:
+        counts = cells["price_count"].to_numpy(dtype=np.float64)
+
+    smoothed, density = smooth_surfaces(
+        rows,
+        cols,
+        cells["price_per_square"].to_numpy(dtype=np.float64),
+        counts,
+        header,
+        bandwidth,
+    )
+
+    # поверхности только в ячейках сетки города
+    outside = np.isnan(predicted)
+    for surface, values in (("smooth", smoothed), ("density", density)):
+        values[outside] = np.nan
+        write_raster(smooth_file(city, app, surface), values, header)
@@ -0,0 +1,53 @@
+"""
+grid shared by tests of predicted and observed prices
+"""
+
+import geopandas as gpd
+import numpy as np
+import pytest
+
+from data_preproc import get_grid, grid_axes, write_gpkg
+from price_raster import cells_raster, raster_header, write_raster
+
+
+@pytest.fixture
+def grid_lines():
+    """
+    3 x 3 grid: longitude from 0 to 3, latitude from 0 to 2
+    """
+
+    return grid_axes(3.0, 2.0, 0.0, 0.0, 0.75, 0.5)
+
+
+@pytest.fixture
+def grid_header(grid_lines):
+    return raster_header(*grid_lines)
+
+
+@pytest.fixture
+def grid_dir(tmp_path, monkeypatch, grid_header):
+    """
+    working directory with files of 3 x 3 grid of "city" "sec":
+    predictions 100 + position of all cells but (2, 2),
+    observed price 50 of cell (1, 0)
+    """
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "Data_predict").mkdir()
+    (tmp_path / "Data_preproc").mkdir()
+
+    rows, cols = np.divmod(np.arange(8), 3)
+    write_raster(
+        "Data_predict/city_sec_predict.raster",
+        cells_raster(rows, cols, 100.0 + np.arange(8), grid_header),
+        grid_header,
+    )
+
+    grid_df = get_grid(3.0, 2.0, 0.0, 0.0, 0.75, 0.5)
+    observed = grid_df[(grid_df["row"] == 1) & (grid_df["col"] == 0)]
+    observed = gpd.GeoDataFrame(
+        {"price_per_square": [50.0]}, geometry=observed.geometry.values, crs="EPSG:4326"
+    )
+    write_gpkg(observed, "Data_preproc/city_sec_grid_gpd.gpkg")
+
+    return tmp_path
@@ -0,0 +1,36 @@
+"""
+test crawl progress file
+"""
+
+from checkpoint import Checkpoint
+
+
+def test_checkpoint_resume(tmp_path):
+    """
+    test saved progress is read by restarted crawl, broken last line skipped
+    """
+
+    file_name = tmp_path / "Mos_sec_checkpoint.jsonl"
+    checkpoint = Checkpoint(file_name, batch_size=2)
+    checkpoint.write_listing({"https://www.realtymag.ru/kvartira/prodazha/1": None})
+    for i in range(3):
+        checkpoint.write({"offer_id": str(i), "price_per_square": 1000.0 * i})
+
+    # third offer is in buffer, crawl stopped while writing
+    with open(file_name, "a") as file:
+        file.write('{"type": "offer", "da')
+
+    restarted = Checkpoint(file_name)
+    assert restarted.listing == {"https://www.realtymag.ru/kvartira/prodazha/1": None}
+    assert [offer["offer_id"] for offer in restarted.offers] == ["0", "1"]
+    assert not restarted.done
+
+    restarted.write({"offer_id": "2", "price_per_square": 2000.0})
+    restarted.finish()
+
+    finished = Checkpoint(file_name)
+    assert [offer["offer_id"] for offer in finished.offers] == ["0", "1", "2"]
+    assert finished.done
+
+    finished.remove()
+    assert not file_name.exists()
@@ -1,4 +1,28 @@
-from data_preproc import get_min_max_cord
+import json
+import os
+
+import geopandas as gpd
+import pandas as pd
+import pytest
+from shapely.geometry import Point, box
+
+import data_preproc
+from data_preproc import (
+    adaptive_grid,
+    bound_grid,
+    build_adaptive_grid,
+    cell_price_stats,
+    city_grid,
+    city_prices,
+    get_grid,
+    get_min_max_cord,
+    grid_axes,
+    group_offers_by_location,
+    join_prices_to_grid,
+    locate_cells,
+    remove_gpkg,
+    write_gpkg,
+)
 
 
 def test_get_min_max_coordinates():
@@ -11,3 +35,250 @@ def test_get_min_max_coordinates():
         60.0073423,
         56.7578451,
     )
+
+
+def test_group_offers_by_location():
+    """
+    offers with the same coordinates replaced with one with mean price
+    """
+
+    offers_df = pd.DataFrame(
+        {
+            "price_per_square": [100.0, 200.0, 300.0, 400.0],
+            "location_long": [30.1, 30.2, 30.1, 30.20001],
+            "location_lat": [59.1, 59.2, 59.1, 59.2],
+        }
+    )
+
+    exact = group_offers_by_location(offers_df)
+    assert exact["coordinates"].tolist() == [
+        "30.1, 59.1",
+        "30.2, 59.2",
+        "30.20001, 59.2",
+    ]
+    assert exact["price_per_square"].tolist() == [200.0, 200.0, 400.0]
+    assert exact["offers_count"].tolist() == [2, 1, 1]
+
+    near = group_offers_by_location(offers_df, tolerance=0.001)
+    assert near["price_per_square"].tolist() == [200.0, 300.0]
+    assert near["location_long"].tolist() == [30.1, 30.2]
+
+
+def test_group_offers_grid_snapping():
+    """
+    tolerance snaps coordinates to grid: close points on both sides
+    of rounding edge are different locations
+    """
+
+    offers_df = pd.DataFrame(
+        {
+            "price_per_square": [100.0, 200.0],
+            "location_long": [30.0015 - 1e-9, 30.0015 + 1e-9],
+            "location_lat": [59.1, 59.1],
+        }
+    )
+
+    assert len(group_offers_by_location(offers_df, tolerance=0.001)) == 2
+
+
+def test_cell_price_stats():
+    """
+    prices of offers in one grid cell aggregated by grid index
+    """
+
+    cells = [box(0, 0, 1, 1), box(1, 0, 2, 1)]
+    joined = gpd.GeoDataFrame(
+        {"price_per_square": [100.0, 300.0, 200.0, 50.0]},
+        geometry=[cells[1], cells[1], cells[0], cells[1]],
+        index=[7, 7, 3, 7],
+        crs="EPSG:4326",
+    )
+
+    stats = cell_price_stats(joined)
+
+    assert stats["cell_id"].tolist() == [7, 3]
+    assert stats["geoid"].tolist() == ["0", "1"]
+    assert stats["price_per_square"].tolist() == [150.0, 200.0]
+    assert stats["price_count"].tolist() == [3, 1]
+    assert stats["price_median"].tolist() == [100.0, 200.0]
+    assert stats["price_min"].tolist() == [50.0, 200.0]
+    assert stats["price_max"].tolist() == [300.0, 200.0]
+    assert stats.geometry.tolist() == cells[::-1]
+    assert stats.crs == joined.crs
+
+    # цены адресов, число объявлений - сумма по адресам
+    joined["offers_count"] = [2, 1, 4, 3]
+    assert cell_price_stats(joined)["price_count"].tolist() == [6, 4]
+
+
+def test_get_grid():
+    """
+    grid cells between neighbour linspace points with row and column of cell
+    """
+
+    grid_df = get_grid(3.0, 3.0, 0.0, 1.0, step_lat=1.0, step_long=1.0)
+
+    assert len(grid_df) == 2
+    assert grid_df["row"].tolist() == [0, 0]
+    assert grid_df["col"].tolist() == [0, 1]
+    assert list(grid_df.geometry[0].exterior.coords) == [
+        (0.0, 1.0),
+        (1.5, 1.0),
+        (1.5, 3.0),
+        (0.0, 3.0),
+        (0.0, 1.0),
+    ]
+    assert grid_df.geometry[1].equals(box(1.5, 1.0, 3.0, 3.0))
+
+
+def test_locate_cells():
+    """
+    row and column of cells from grid lines, points out of grid get -1
+    """
+
+    lat_array, long_array = grid_axes(3.0, 2.0, 0.0, 0.0, 0.75, 0.5)
+
+    rows, cols = locate_cells(
+        [0.5, 1.0, 2.5, 3.0, -0.1, 2.0],
+        [0.1, 1.0, long_array[2], 1.0, 1.0, 2.0],
+        lat_array,
+        long_array,
+    )
+
+    assert lat_array.tolist() == [0.0, 1.0, 2.0, 3.0]
+    assert rows.tolist() == [0, 1, 2, -1, -1, -1]
+    assert cols.tolist() == [0, 1, 2, -1, -1, -1]
+
+
+def test_join_prices_to_grid():
+    """
+    offers prices attached to bounded grid cells in grid order
+    """
+
+    lat_array, long_array = grid_axes(3.0, 3.0, 0.0, 1.0, 1.0, 1.0)
+    grid_df = get_grid(3.0, 3.0, 0.0, 1.0, step_lat=1.0, step_long=1.0)
+    grid_bound = grid_df.iloc[[1]].reset_index(drop=True)
+    offers_df = pd.DataFrame(
+        {
+            "price_per_square": [100.0, 200.0, 300.0, 400.0],
+            "location_long": [2.0, 0.5, 2.5, 4.0],
+            "location_lat": [1.5, 1.5, 2.0, 2.0],
+        }
+    )
+
+    joined = join_prices_to_grid(grid_bound, offers_df, lat_array, long_array)
+
+    assert joined.index.tolist() == [0, 0]
+    assert joined["price_per_square"].tolist() == [100.0, 300.0]
+    assert joined.geometry.tolist() == [grid_bound.geometry[0]] * 2
+
+
+def test_bound_grid():
+    """
+    cells within border and disjoint with water, same as exact predicates
+    """
+
+    grid_df = get_grid(10.0, 10.0, 0.0, 0.0, step_lat=0.5, step_long=0.5)
+    border = Point(5, 5).buffer(4.3)
+    water = box(2.2, 2.2, 4.0, 8.0).union(Point(7, 5).buffer(0.8))
+
+    bounded = bound_grid(grid_df, border, water)
+
+    expected = grid_df[grid_df.within(border)]
+    expected = expected[expected.disjoint(water)]
+    assert 0 < len(bounded) < len(grid_df[grid_df.within(border)])
+    assert bounded.index.equals(expected.index)
+
+
+def test_city_grid(tmp_path, monkeypatch):
+    """
+    bounded grid is built once, then read from file while border is the same
+    """
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(data_preproc, "CITY_WATER", {"Ekb": []})
+    monkeypatch.setattr(data_preproc, "GRID_CACHE", {})
+    os.mkdir("Data_preproc")
+    border = {"type": "Polygon", "coordinates": [[[0, 0], [4, 0], [4, 4], [0, 0]]]}
+    with open("Data_preproc/Ekb_geo.json", "w") as file:
+        json.dump(border, file)
+
+    built = city_grid("Ekb", 0.5, 0.5)
+    assert city_grid("Ekb", 0.5, 0.5) is built
+
+    def no_grid(*args, **kwargs):
+        raise AssertionError("grid is built again")
+
+    monkeypatch.setattr(data_preproc, "get_grid", no_grid)
+    monkeypatch.setattr(data_preproc, "GRID_CACHE", {})
+    saved = city_grid("Ekb", 0.5, 0.5)
+    assert saved.geometry.geom_equals(built.geometry).all()
+    assert saved["row"].tolist() == built["row"].tolist()
+
+    monkeypatch.setattr(data_preproc, "GRID_CACHE", {})
+    with pytest.raises(AssertionError):
+        city_grid("Ekb", 0.25, 0.25)
+
+
+def test_adaptive_grid(tmp_path, monkeypatch):
+    """
+    cells with many offers are split to the smallest cells, cells cover
+    fixed grid cells of the city once, offers prices are joined to them
+    """
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(data_preproc, "CITY_WATER", {"Ekb": []})
+    monkeypatch.setattr(data_preproc, "GRID_CACHE", {})
+    os.mkdir("Data_preproc")
+    border = {
+        "type": "Polygon",
+        "coordinates": [[[0, 0], [0.1, 0], [0.1, 0.06], [0, 0.06], [0, 0]]],
+    }
+    with open("Data_preproc/Ekb_geo.json", "w") as file:
+        json.dump(border, file)
+    offers_df = pd.DataFrame(
+        {
+            "price_per_square": [100.0] * 20 + [200.0, 300.0],
+            "location_long": [0.011] * 20 + [0.05, 0.09],
+            "location_lat": [0.011] * 20 + [0.03, 0.05],
+        }
+    )
+    monkeypatch.setattr(data_preproc, "find_offers_file", lambda city, app: app)
+    monkeypatch.setattr(
+        data_preproc,
+        "offers_data_prep",
+        lambda file_name: group_offers_by_location(offers_df),
+    )
+
+    build_adaptive_grid("Ekb", ("sec",))
+    grid = adaptive_grid("Ekb")
+
+    assert (grid["size"] ** 2).sum() == 4 * len(city_grid("Ekb"))
+    assert grid["cell_id"].is_unique
+    dense = grid[grid.contains(Point(0.011, 0.011))]
+    assert dense["size"].tolist() == [1]
+    assert grid["size"].max() == 16
+
+    city_prices("Ekb", "sec", adaptive=True)
+    prices = gpd.read_file("Data_preproc/Ekb_sec_grid_gpd.gpkg")
+
+    assert prices["price_count"].sum() == len(offers_df)
+    assert set(prices["cell_id"]) <= set(grid["cell_id"])
+    assert dense["cell_id"].iloc[0] in prices["cell_id"].tolist()
+
+
+def test_remove_gpkg(tmp_path):
+    """
+    GeoPackage file and shapefiles folder of previous versions are removed
+    """
+
+    file_name = str(tmp_path / "city_sec_predict.gpkg")
+    write_gpkg(gpd.GeoDataFrame(geometry=[box(0, 0, 1, 1)]), file_name)
+    remove_gpkg(file_name)
+    assert not os.path.exists(file_name)
+
+    (tmp_path / "city_sec_predict.gpkg").mkdir()
+    (tmp_path / "city_sec_predict.gpkg" / "city_sec_predict.shp").write_text("")
+    remove_gpkg(file_name)
+    remove_gpkg(file_name)
+    assert not os.path.exists(file_name)
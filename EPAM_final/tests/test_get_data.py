@@ -2,7 +2,89 @@
 test html parsers
 """
 
-from get_data_from_web import get_links, get_offers
+import asyncio
+from functools import partial
+
+import aiohttp
+import pytest
+
+import get_data_from_web
+from checkpoint import Checkpoint
+from get_data_from_web import (
+    crawl_app,
+    fetch_html,
+    fetch_or_none,
+    fetch_parse_pipeline,
+    get_links,
+    get_listing,
+    get_offers,
+    get_pages_count,
+    refresh_timestamp,
+    soup_links,
+    soup_listing,
+    soup_offers,
+    stream_htmls,
+    stream_links_file,
+)
+from offers_storage import offers_file, read_offers, write_offers
+
+OFFER_DICT = {
+    "live_square": 41.7,
+    "microdistrict": "Фрунзенский район",
+    "price_per_square": 136691.0,
+    "location_lat": 59.8689334,
+    "location_long": 30.385426799999998,
+    "refresh_time": "46 минут назад",
+}
+
+
+class FakeResponse:
+    """
+    fake aiohttp response: returns url as page text after "delay" seconds,
+    fails with "errors" statuses first
+    """
+
+    def __init__(self, client, url):
+        self.client = client
+        self.url = url
+        errors = client.errors.get(url, [])
+        self.status = errors.pop(0) if errors else 200
+
+    def raise_for_status(self):
+        if self.status != 200:
+            raise aiohttp.ClientResponseError(None, (), status=self.status)
+
+    async def __aenter__(self):
+        self.client.in_flight += 1
+        self.client.max_in_flight = max(
+            self.client.max_in_flight, self.client.in_flight
+        )
+        return self
+
+    async def __aexit__(self, *args):
+        self.client.in_flight -= 1
+
+    async def text(self):
+        await asyncio.sleep(self.client.delays.get(self.url, 0.001))
+        return self.client.pages.get(self.url, self.url)
+
+
+class FakeClient:
+    """
+    fake aiohttp.ClientSession
+    """
+
+    def __init__(self, delays=None, errors=None, pages=None):
+        self.delays = delays or {}
+        self.errors = errors or {}
+        self.pages = pages or {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+
+    def get(self, url):
+        self.requests += 1
+        return FakeResponse(self, url)
 
 
 def test_get_links():
@@ -42,15 +124,196 @@ def test_get_offers():
     """
     test function return offers data dict
     """
-    offer_dict = {
-        "live_square": 41.7,
-        "microdistrict": "Фрунзенский район",
-        "price_per_square": 136691.0,
-        "location_lat": 59.8689334,
-        "location_long": 30.385426799999998,
-        "refresh_time": "46 минут назад",
-    }
 
     with open("tests/offer_data_page.htm", encoding="utf-8") as file:
         html = file.read()
-        assert get_offers(html) == offer_dict
+        assert get_offers(html) == OFFER_DICT
+        assert soup_offers(html) == OFFER_DICT
+
+
+def test_parsers_unexpected_markup():
+    """
+    test fast parsers give the same result as BeautifulSoup on changed markup
+    """
+
+    with open("tests/offers_page.htm", encoding="utf-8") as file:
+        html = file.read().replace(
+            '<div class="offer__headline"><a href',
+            '<div class="offer__headline"><a class="x" href',
+            1,
+        )
+        assert get_links(html) == soup_links(html)
+
+    with open("tests/offer_data_page.htm", encoding="utf-8") as file:
+        html = file.read()
+
+    changed_pages = [
+        html.replace("Фрунзенский район</a>", "Фрунзенский &amp; район</a>"),
+        html.replace('<div class="offer-detail__refresh">', "<div>"),
+        html.replace('page.initMap("map",', '<!-- --> page.initMap("map",'),
+    ]
+    for page in changed_pages:
+        assert get_offers(page) == soup_offers(page)
+
+
+def test_stream_htmls():
+    """
+    test pages are yielded as they are ready with bounded requests in flight
+    """
+
+    urls = [f"url_{i}" for i in range(30)]
+    client = FakeClient(delays={"url_0": 0.05})
+
+    async def collect():
+        return [url async for url, _ in stream_htmls(client, urls, concurrency=5)]
+
+    result = asyncio.run(collect())
+
+    assert sorted(result) == sorted(urls)
+    assert result[-1] == "url_0"
+    assert client.max_in_flight == 5
+
+
+def test_fetch_parse_pipeline():
+    """
+    test every fetched page is parsed and passed to consumer
+    """
+
+    urls = [f"url_{i}" for i in range(30)]
+    parsed = {}
+
+    counter = asyncio.run(
+        fetch_parse_pipeline(
+            stream_htmls(FakeClient(), urls, concurrency=5),
+            str.upper,
+            parsed.__setitem__,
+            workers=3,
+            queue_size=2,
+        )
+    )
+
+    assert parsed == {url: url.upper() for url in urls}
+    assert counter.fetched == counter.parsed == 30
+
+
+def test_get_listing():
+    """
+    test function return offers links with refresh times
+    """
+
+    with open("tests/offers_page.htm", encoding="utf-8") as file:
+        html = file.read()
+
+    listing = get_listing(html)
+
+    assert [link for link, _ in listing] == get_links(html)
+    assert listing[0][1] == "36 минут назад"
+    assert listing == soup_listing(html)
+
+
+def test_refresh_timestamp():
+    """
+    test refresh time text to timestamp conversion
+    """
+
+    now = 1_000_000
+
+    assert refresh_timestamp("36 минут назад", now) == now - 36 * 60
+    assert refresh_timestamp("минуту назад", now) == now - 60
+    assert refresh_timestamp("2 часа назад", now) == now - 2 * 3600
+    assert refresh_timestamp("5 дней назад", now) == now - 5 * 24 * 3600
+    assert refresh_timestamp("только что", now) == now
+    assert refresh_timestamp("12 июля", now) is None
+
+
+def test_fetch_retries():
+    """
+    test 5xx responses are retried, 404 is not retried, errors are saved
+    """
+
+    client = FakeClient(
+        errors={"url_1": [503, 503], "url_2": [404], "url_3": [500] * 5}
+    )
+    failed = {}
+
+    async def fetch():
+        html = await fetch_html(client, "url_1", retries=2, backoff=0)
+        not_found = await fetch_or_none(client, "url_2", failed)
+        return html, not_found
+
+    assert asyncio.run(fetch()) == ("url_1", None)
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(fetch_html(client, "url_3", retries=2, backoff=0))
+    assert client.errors["url_3"] == [500, 500]
+    assert list(failed) == ["url_2"]
+
+
+def test_get_pages_count():
+    """
+    test number of listing pages from total offers number
+    """
+
+    with open("tests/offers_page.htm", encoding="utf-8") as file:
+        html = file.read()
+
+    assert get_pages_count(html, 20) == 455
+    assert get_pages_count(html.replace("offer__stat", "offer__x"), 20) is None
+
+
+@pytest.mark.parametrize("past_end", ["first_page", "not_found"])
+def test_stream_links_file_stops(tmp_path, monkeypatch, past_end):
+    """
+    without number of pages crawl stops after the window of pages without
+    new links: site returns the first page or errors instead of empty page
+    """
+
+    monkeypatch.setattr(
+        get_data_from_web,
+        "get_listing",
+        lambda html: [(link, "") for link in html.split() if link.startswith("l")],
+    )
+    monkeypatch.setattr(get_data_from_web, "MAX_PAGES", 100)
+    pages = {"u&page=1": "l1 l2", "u&page=2": "l3", "u&page=3": "l4"}
+    errors = {}
+    for i in range(4, 101):
+        if past_end == "first_page":
+            pages[f"u&page={i}"] = pages["u&page=1"]
+        else:
+            errors[f"u&page={i}"] = [404]
+    client = FakeClient(pages=pages, errors=errors)
+
+    listing = asyncio.run(
+        stream_links_file(client, "u", str(tmp_path / "links.txt"), concurrency=5)
+    )
+
+    assert sorted(listing) == ["l1", "l2", "l3", "l4"]
+    assert client.requests == 1 + 2 * 5
+
+
+@pytest.mark.parametrize("first_page", ["failed", "empty"])
+def test_crawl_app_no_listing(tmp_path, monkeypatch, first_page):
+    """
+    offers of previous crawl are kept and crawl is not done
+    if the first listing page failed or has no offers
+    """
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(
+        get_data_from_web, "fetch_html", partial(fetch_html, retries=3, backoff=0)
+    )
+    (tmp_path / "Data_from_web").mkdir()
+    write_offers([OFFER_DICT], offers_file("Mos", "sec"))
+    errors = [503] * 4 if first_page == "failed" else []
+    client = FakeClient(errors={"u&page=1": errors}, pages={"u&page=1": ""})
+
+    checkpoint = asyncio.run(crawl_app(client, None, "Mos", "sec", "u"))
+
+    assert not checkpoint.done
+    assert not Checkpoint("Data_from_web/Mos_sec_checkpoint.jsonl").done
+    assert len(read_offers("Mos", "sec")) == 1
+    with open("Data_from_web/Mos_sec_failed.txt") as file:
+        failed = file.read()
+    if first_page == "failed":
+        assert failed.startswith("u&page=1\tHTTP 503")
+    else:
+        assert failed == ""
@@ -0,0 +1,79 @@
+"""
+test spatial interpolation engines
+"""
+
+import numpy as np
+import pytest
+from sklearn.neighbors import KNeighborsRegressor
+
+from interpolation import ENGINES, make_engine, project
+
+
+def city_prices(n_points=200, seed=0):
+    """
+    random prices in Saint Petersburg
+    """
+
+    rng = np.random.default_rng(seed)
+    X = np.stack([30.1 + 0.4 * rng.random(n_points), 59.8 + 0.2 * rng.random(n_points)])
+    y = 150000 + 100000 * rng.random(n_points)
+
+    return X.T, y
+
+
+def test_project():
+    """
+    one degree of latitude is about 111 km, of longitude - less by cos(latitude)
+    """
+
+    X = project(np.array([[30.0, 60.0], [31.0, 61.0]]), 60.0)
+
+    assert X[1, 1] - X[0, 1] == pytest.approx(111.19, abs=0.01)
+    assert X[1, 0] - X[0, 0] == pytest.approx(111.19 / 2, abs=0.01)
+
+
+def test_knn_engine():
+    """
+    KNN engine predicts the same prices as KNeighborsRegressor by chunks
+    """
+
+    X, y = city_prices()
+    X_predict, _ = city_prices(seed=1)
+
+    engine = make_engine("knn", n_neighbors=4, chunk_size=7).fit(X, y)
+    model = KNeighborsRegressor(n_neighbors=4, weights="distance").fit(X, y)
+
+    assert np.allclose(engine.predict(X_predict), model.predict(X_predict))
+
+
+@pytest.mark.parametrize("name", ENGINES)
+def test_engines(name):
+    """
+    prices of training cells are kept, others are between min and max prices
+    """
+
+    X, y = city_prices()
+    X_predict, _ = city_prices(seed=1)
+
+    engine = make_engine(name, chunk_size=50).fit(X, y)
+    y_predict = engine.predict(X_predict)
+
+    assert np.allclose(engine.predict(X), y)
+    assert len(y_predict) == len(X_predict)
+    assert y.min() <= y_predict.min() and y_predict.max() <= y.max()
+
+
+@pytest.mark.parametrize("name", ["knn", "idw"])
+def test_radius(name):
+    """
+    radius of the farthest used neighbor, inf if it is tied with unused one
+    """
+
+    X = np.array([[0.0, 0.0], [1.0, 0.0], [0.0, 1.0], [3.0, 3.0]])
+    y = np.array([1.0, 2.0, 3.0, 4.0])
+
+    engine = make_engine(name, n_neighbors=2).fit(X, y)
+    radius = engine.radius(np.array([[0.0, 0.0], [0.2, 0.1]]))
+
+    assert np.isinf(radius[0])
+    assert radius[1] == pytest.approx(np.hypot(0.8, 0.1))
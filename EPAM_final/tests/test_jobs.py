@@ -0,0 +1,34 @@
+"""
+test parallel city and apartment type jobs
+"""
+
+import pytest
+
+from jobs import failed_jobs, run_jobs
+
+
+def city_job(city, app):
+    """
+    job which fails for "Ekb" city
+    """
+
+    if city == "Ekb":
+        raise ValueError(f"no data for {city} {app}")
+    return city, app
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_run_jobs(workers):
+    """
+    every job has time and error, failed job does not stop the others
+    """
+
+    jobs = [(city, app) for city in ["Mos", "Ekb", "SPb"] for app in ["sec", "new"]]
+
+    results = run_jobs(city_job, jobs, workers)
+
+    assert sorted(results) == sorted(jobs)
+    assert sorted(failed_jobs(results)) == [("Ekb", "new"), ("Ekb", "sec")]
+    assert "ValueError: no data for Ekb sec" in results[("Ekb", "sec")]["error"]
+    assert results[("Mos", "sec")]["error"] is None
+    assert all(result["time"] >= 0 for result in results.values())
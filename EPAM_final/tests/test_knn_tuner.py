@@ -0,0 +1,64 @@
+"""
+test fast hyperparameters search of KNN price model
+"""
+
+import numpy as np
+import pytest
+from sklearn.model_selection import GridSearchCV
+from sklearn.neighbors import KNeighborsRegressor
+
+import knn_tuner
+from knn_tuner import best_knn_params, knn_cv_scores, tuned_knn_params
+
+
+def grid_prices(n_points=150, seed=0):
+    """
+    prices in centers of regular grid cells, many neighbors are tied
+    """
+
+    rng = np.random.default_rng(seed)
+    cells = rng.choice(400, n_points, replace=False)
+    X = np.stack([cells % 20 * 0.004, cells // 20 * 0.0025], axis=1)
+    y = 200000 + 1e7 * X[:, 0] + rng.normal(0, 20000, n_points)
+
+    return X, y
+
+
+def test_knn_cv_scores_as_grid_search():
+    """
+    scores and best parameters are the same as GridSearchCV ones
+    """
+
+    X, y = grid_prices()
+    parameters = {"n_neighbors": range(2, 40, 2), "weights": ["distance", "uniform"]}
+    search = GridSearchCV(KNeighborsRegressor(), param_grid=parameters).fit(X, y)
+
+    scores = knn_cv_scores(X, y)
+    params, score = best_knn_params(X, y)
+
+    for candidate, mean_score in zip(
+        search.cv_results_["params"], search.cv_results_["mean_test_score"]
+    ):
+        assert scores[
+            (candidate["n_neighbors"], candidate["weights"])
+        ] == pytest.approx(mean_score, abs=1e-9)
+    assert params == search.best_params_
+    assert score == pytest.approx(search.best_score_, abs=1e-9)
+
+
+def test_tuned_knn_params(tmp_path, monkeypatch):
+    """
+    parameters are tuned again only if training data changed noticeably
+    """
+
+    X, y = grid_prices()
+    file_name = tmp_path / "Mos_sec_knn.json"
+    params = tuned_knn_params(file_name, X, y)
+
+    def no_tuning(*args):
+        raise AssertionError("parameters are tuned again")
+
+    monkeypatch.setattr(knn_tuner, "best_knn_params", no_tuning)
+    assert tuned_knn_params(file_name, X[:-2], y[:-2]) == params
+    with pytest.raises(AssertionError):
+        tuned_knn_params(file_name, X[:100], y[:100])
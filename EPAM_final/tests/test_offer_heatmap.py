@@ -0,0 +1,153 @@
+"""
+test compact heatmap layers
+"""
+
+import folium
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from data_preproc import cell_polygons, write_gpkg
+from offer_heatmap import (
+    GridCells,
+    GridPricesLayer,
+    bins_thresholds,
+    cells_delta,
+    density_bins,
+    predict_bins,
+    quantize_prices,
+)
+from price_raster import cells_raster, raster_axes, raster_header, write_raster
+from price_tiles import MAX_ZOOM
+
+
+def test_cells_delta():
+    """
+    cells numbers are restored by cumulative sum of differences
+    """
+
+    rows, cols = np.array([0, 0, 1, 3]), np.array([2, 4, 0, 1])
+
+    delta = cells_delta(rows, cols, 5)
+
+    assert delta == [2, 2, 1, 11]
+    assert np.cumsum(delta).tolist() == (rows * 5 + cols).tolist()
+
+
+def test_density_bins():
+    """
+    increasing bins of densities drawn by layer, at least 3 colors
+    """
+
+    bins = density_bins(np.array([0.0, 0.01, 0.1, 0.5, 2.0, 7.3, 20.0]))
+
+    assert bins[0] == 0.1 and bins[-1] == 20.0
+    assert np.all(np.diff(bins) > 0)
+    assert density_bins(np.array([0.2, 0.2, 0.2, 0.5])) == [0.2, 0.3, 0.4, 0.5]
+
+
+def test_quantize_prices():
+    assert quantize_prices(np.array([123.456, np.nan, 80.0])) == [1235, 0, 800]
+
+
+def test_compact_layers(grid_header):
+    """
+    cells bounds are written once, layers refer to them and have only prices
+    """
+
+    rows, cols = np.divmod(np.arange(8), 3)
+    heatmap = folium.Map(location=(1.0, 1.5))
+    cells = GridCells(grid_header, rows, cols)
+    cells.add_to(heatmap)
+    for name, prices, show in (
+        ("real", np.array([100.0] + [np.nan] * 7), True),
+        ("predict", 100.0 + np.arange(8), False),
+    ):
+        bins = bins_thresholds(pd.Series(prices).dropna())
+        GridPricesLayer(cells, prices, bins, name=name, show=show).add_to(heatmap)
+    folium.LayerControl().add_to(heatmap)
+
+    html = heatmap.get_root().render()
+
+    assert html.count('"delta":[0,1,1,1,1,1,1,1]') == 1
+    assert html.count(f"{cells.get_name()}.forEach") == 2
+    assert "[1000,0,0,0,0,0,0,0]" in html
+    assert "[1000,1010,1020,1030,1040,1050,1060,1070]" in html
+    assert html.count(f"layer.addTo({heatmap.get_name()});") == 1
+    assert '"real"' in html and '"predict"' in html
+
+
+def test_adaptive_cells(grid_header):
+    """
+    cells of adaptive grid have sizes in raster cells
+    """
+
+    heatmap = folium.Map(location=(1.0, 1.5))
+    GridCells(grid_header, np.array([0, 2]), np.array([0, 0]), np.array([2, 1])).add_to(
+        heatmap
+    )
+
+    html = heatmap.get_root().render()
+
+    assert '"delta":[0,6],"sizes":[2,1]' in html
+    assert "size * grid.steps[1]" in html
+
+
+def test_tiles_layer(grid_header):
+    """
+    layer with tiles shows tiles up to MAX_ZOOM and cells on higher zoom levels
+    """
+
+    heatmap = folium.Map(location=(1.0, 1.5))
+    cells = GridCells(grid_header, np.array([0]), np.array([0]))
+    cells.add_to(heatmap)
+    GridPricesLayer(
+        cells,
+        np.array([100.0]),
+        [90, 100, 110, 120],
+        name="predict",
+        tiles="tiles/city_sec/{z}/{x}/{y}.png",
+        bounds=(0.0, 0.0, 3.0, 2.0),
+    ).add_to(heatmap)
+
+    html = heatmap.get_root().render()
+
+    assert 'L.tileLayer("tiles/city_sec/{z}/{x}/{y}.png"' in html
+    assert f"maxZoom: {MAX_ZOOM}," in html
+    assert "bounds: [[0.0,0.0],[2.0,3.0]]" in html
+    assert f"map.getZoom() > {MAX_ZOOM}" in html
+
+
+def test_predict_bins_adaptive(tmp_path, monkeypatch):
+    """
+    bins of adaptive grid are computed from one price of every cell
+    as bins of "predict" layer, not from raster cells filled by it
+    """
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "Data_predict").mkdir()
+    header = raster_header(np.linspace(0.0, 4.0, 5), np.linspace(0.0, 4.0, 5))
+    rows, cols = np.array([0, 0, 0, 1, 1]), np.array([0, 2, 3, 2, 3])
+    sizes = np.array([2, 1, 1, 1, 1])
+    write_gpkg(
+        gpd.GeoDataFrame(
+            {
+                "cell_id": ["0", "1", "2", "3", "4"],
+                "row": rows,
+                "col": cols,
+                "size": sizes,
+            },
+            geometry=cell_polygons(rows, cols, *raster_axes(header), sizes),
+            crs="EPSG:4326",
+        ),
+        "grid.gpkg",
+    )
+    header["grid"] = "grid.gpkg"
+    prices = np.array([100000.0, 200000.0, 210000.0, 220000.0, 230000.0])
+    values = cells_raster(rows, cols, prices, header, sizes)
+    write_raster("Data_predict/city_sec_predict.raster", values, header)
+
+    bins = predict_bins("city", "sec")
+
+    assert bins == bins_thresholds(pd.Series(prices / 1000))
+    assert bins != bins_thresholds(pd.Series(values[~np.isnan(values)] / 1000))
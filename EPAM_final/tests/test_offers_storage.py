@@ -0,0 +1,39 @@
+"""
+test parquet offers storage
+"""
+
+import offers_storage
+from offers_storage import OffersWriter, read_offers, write_offers
+
+
+def test_offers_writer(tmp_path, monkeypatch):
+    """
+    test offers are written by batches and read by columns
+    """
+
+    monkeypatch.setattr(offers_storage, "OFFERS_DIR", str(tmp_path))
+    offers = [
+        {
+            "offer_id": str(i),
+            "price_per_square": 100000.0 + i,
+            "live_square": None,
+            "microdistrict": "Фрунзенский район",
+            "location_lat": 59.86,
+            "location_long": 30.38,
+            "refresh_time": None,
+        }
+        for i in range(25)
+    ]
+
+    with OffersWriter(offers_storage.offers_file("SPb", "sec"), batch_size=10) as w:
+        for offer in offers:
+            w.write(offer)
+        assert not (tmp_path / "SPb_sec_app_offers.parquet").exists()
+
+    offers_df = read_offers("SPb", "sec", ["offer_id", "price_per_square"])
+
+    assert list(offers_df.columns) == ["offer_id", "price_per_square"]
+    assert offers_df["price_per_square"].tolist() == [100000.0 + i for i in range(25)]
+
+    write_offers(offers[:3], offers_storage.offers_file("SPb", "new"))
+    assert read_offers("SPb", "new")["live_square"].isna().all()
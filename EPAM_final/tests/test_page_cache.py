@@ -0,0 +1,43 @@
+"""
+test compressed page cache
+"""
+
+from page_cache import PageCache
+
+
+def test_page_cache_fresh(tmp_path):
+    """
+    test cached page is used until it is updated on website or expired
+    """
+
+    cache = PageCache(tmp_path, ttl=100)
+    cache.put("1", "<html>offer</html>", version="36 минут назад", now=1000)
+
+    assert cache.get("1") == "<html>offer</html>"
+    assert cache.fresh("1", modified=900, now=1010)
+    assert not cache.fresh("1", modified=1005, now=1010)
+    assert cache.fresh("1", version="36 минут назад", now=1010)
+    assert not cache.fresh("1", version="12 июля", now=1010)
+    assert not cache.fresh("1", modified=900, now=1200)
+    assert not cache.fresh("2", now=1010)
+
+    cache.save()
+    assert PageCache(tmp_path).get("1") == "<html>offer</html>"
+
+
+def test_page_cache_evict(tmp_path):
+    """
+    test expired and the oldest pages are removed, the same pages stored once
+    """
+
+    cache = PageCache(tmp_path, ttl=100)
+    cache.put("1", "page 1", now=800)
+    cache.put("2", "page 2", now=950)
+    cache.put("3", "page 3", now=960)
+    cache.put("4", "page 3", now=970)
+    cache.max_size = cache.index["3"]["size"]
+
+    assert cache.evict(now=1000) == 2
+    assert sorted(cache.index) == ["3", "4"]
+    assert cache.get("2") is None
+    assert len(list((tmp_path / "objects").glob("*/*"))) == 1
@@ -0,0 +1,83 @@
+"""
+test predictions of prices for city grid polygons
+"""
+
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import box
+
+from data_preproc import centroid_coordinates
+from interpolation import make_engine
+from predictions import affected_cells, changed_cells, write_predict_gpkg
+
+
+def test_centroid_coordinates():
+    """
+    centroids of polygons as contiguous float64 (n, 2) array
+    """
+
+    gdf = gpd.GeoDataFrame(geometry=[box(0, 0, 2, 2), box(30.0, 59.0, 30.5, 60.0)])
+
+    coordinates = centroid_coordinates(gdf)
+
+    assert coordinates.dtype == "float64"
+    assert coordinates.flags["C_CONTIGUOUS"]
+    assert coordinates.tolist() == [[1.0, 1.0], [30.25, 59.5]]
+
+
+@pytest.mark.parametrize("name", ["knn", "idw_projected"])
+def test_incremental_predictions(name):
+    """
+    predictions of affected cells after changes of training cells
+    are the same as predictions of all cells
+    """
+
+    rng = np.random.default_rng(0)
+    cols, rows = np.meshgrid(np.arange(40), np.arange(30))
+    points = np.stack([30 + cols.ravel() * 0.004, 59.9 + rows.ravel() * 0.0025], axis=1)
+    cell_ids = np.sort(rng.choice(len(points), 300, replace=False))
+    y_train = rng.uniform(100000, 300000, len(cell_ids))
+    lat_0 = points[:, 1].mean()
+
+    mod = make_engine(name, lat_0=lat_0).fit(points[cell_ids], y_train)
+    state = {
+        "train_cell_id": cell_ids,
+        "train_price": y_train,
+        "prices": mod.predict(points),
+        "radius": mod.radius(points),
+    }
+
+    # first cell is removed, 2 cells are added, price of one cell changed
+    added = rng.choice(np.setdiff1d(np.arange(len(points)), cell_ids), 2)
+    new_ids = np.concatenate([cell_ids[1:], added])
+    new_y = np.concatenate([y_train[1:], [150000, 250000]])
+    new_y[100] *= 1.1
+
+    changed = changed_cells(state, new_ids, new_y)
+    mod = make_engine(name, lat_0=lat_0).fit(points[new_ids], new_y)
+    rows = affected_cells(mod, points, state["radius"], points[changed])
+    prices = state["prices"].copy()
+    prices[rows] = mod.predict(points[rows])
+
+    assert 0 < len(rows) < len(points)
+    assert np.allclose(prices, mod.predict(points), rtol=1e-12)
+
+
+def test_write_predict_gpkg(tmp_path):
+    """
+    predictions are written with grid index ids whatever rows were dropped
+    """
+
+    grid_cells = gpd.GeoDataFrame(
+        {"row": [0, 2]}, geometry=[box(0, 0, 1, 1), box(0, 2, 1, 3)], index=[0, 5]
+    )
+    file_name = str(tmp_path / "city_sec_predict.gpkg")
+
+    write_predict_gpkg(grid_cells, np.array([100.0, 200.0]), file_name)
+    write_predict_gpkg(grid_cells, np.array([100.0, 300.0]), file_name)
+
+    gdf = gpd.read_file(file_name)
+    assert gdf.columns.tolist() == ["geoid", "price_per_square", "geometry"]
+    assert gdf["geoid"].tolist() == ["0", "5"]
+    assert gdf["price_per_square"].tolist() == [100.0, 300.0]
@@ -0,0 +1,38 @@
+"""
+test batch lookup of prices on city grid
+"""
+
+import numpy as np
+import pytest
+
+from price_lookup import PriceLookup
+
+
+@pytest.fixture
+def lookup(grid_dir):
+    return PriceLookup("city", "sec")
+
+
+def test_lookup(lookup):
+    """
+    prices of cells with points, NaN and out=True out of grid and city
+    """
+
+    lat = np.array([0.1, 1.0, 1.9, 1.9, 2.5, -0.1])
+    long = np.array([0.1, 0.5, 1.5, 2.5, 1.0, 1.0])
+
+    predicted, observed, out = lookup.lookup(lat, long)
+
+    np.testing.assert_array_equal(
+        predicted, [100.0, 103.0, 107.0, np.nan, np.nan, np.nan]
+    )
+    np.testing.assert_array_equal(
+        observed, [np.nan, 50.0, np.nan, np.nan, np.nan, np.nan]
+    )
+    assert out.tolist() == [False, False, False, True, True, True]
+
+
+def test_lookup_empty(lookup):
+    predicted, observed, out = lookup.lookup(np.empty(0), np.empty(0))
+
+    assert len(predicted) == len(observed) == len(out) == 0
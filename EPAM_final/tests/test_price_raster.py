@@ -0,0 +1,118 @@
+"""
+test dense raster of predicted prices
+"""
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from data_preproc import cell_polygons, get_grid, write_gpkg
+from price_raster import (
+    cells_raster,
+    raster_axes,
+    raster_gdf,
+    raster_header,
+    read_raster,
+    write_raster,
+)
+
+
+def test_raster_header(grid_header, grid_lines):
+    """
+    raster has cells of grid and the same grid lines
+    """
+
+    lat_array, long_array = grid_lines
+
+    assert grid_header["shape"] == [len(long_array) - 1, len(lat_array) - 1]
+    assert grid_header["steps"] == pytest.approx([1.0, 2 / 3])
+    for axis, array in zip(raster_axes(grid_header), (lat_array, long_array)):
+        np.testing.assert_array_equal(axis, array)
+
+
+def test_write_read_raster(tmp_path, grid_header):
+    """
+    values are read as memory map, slices do not copy them
+    """
+
+    file_name = str(tmp_path / "city_sec_predict.raster")
+    values = cells_raster(
+        np.array([0, 1, 2]), np.array([0, 2, 2]), np.array([1.0, 2.0, 3.0]), grid_header
+    )
+    write_raster(file_name, values, grid_header)
+
+    raster, saved_header = read_raster(file_name)
+
+    assert isinstance(raster, np.memmap)
+    assert saved_header == grid_header
+    np.testing.assert_array_equal(raster, values)
+    assert np.shares_memory(raster[1:, 2:], raster)
+    assert np.isnan(raster[0, 1])
+
+
+def test_read_raster_update(tmp_path, grid_header):
+    """
+    values changed in "r+" mode are saved to file
+    """
+
+    file_name = str(tmp_path / "city_sec_predict.raster")
+    write_raster(file_name, cells_raster([0], [0], [1.0], grid_header), grid_header)
+
+    raster, _ = read_raster(file_name, "r+")
+    raster[0, 0] = 5.0
+    raster.flush()
+    del raster
+
+    assert read_raster(file_name)[0][0, 0] == 5.0
+
+
+def test_read_raster_not_raster(tmp_path):
+    file_name = tmp_path / "some.raster"
+    file_name.write_bytes(b"not a raster")
+
+    with pytest.raises(ValueError):
+        read_raster(str(file_name))
+
+
+def test_raster_gdf(grid_header):
+    """
+    polygons of raster cells are the same as polygons of grid cells
+    """
+
+    values = cells_raster(
+        np.array([0, 1, 2]), np.array([0, 2, 2]), np.array([1.0, 2.0, 3.0]), grid_header
+    )
+
+    raster_df = raster_gdf(values, grid_header)
+    grid_df = get_grid(3.0, 2.0, 0.0, 0.0, 0.75, 0.5).set_index(["row", "col"])
+    grid_cells = grid_df.loc[list(zip(raster_df["row"], raster_df["col"]))]
+
+    assert raster_df["price_per_square"].tolist() == [1.0, 2.0, 3.0]
+    assert shapely.equals(raster_df.geometry.values, grid_cells.geometry.values).all()
+
+
+def test_adaptive_raster_gdf(tmp_path):
+    """
+    cells of adaptive grid fill their blocks of raster cells,
+    polygons are cells of adaptive grid with prices
+    """
+
+    header = raster_header(np.linspace(0.0, 4.0, 5), np.linspace(0.0, 4.0, 5))
+    rows, cols, sizes = np.array([0, 0, 2]), np.array([0, 2, 3]), np.array([2, 2, 1])
+    grid_df = gpd.GeoDataFrame(
+        {"cell_id": ["0_0-0", "0_0-1", "0_0-32"], "row": rows, "col": cols},
+        geometry=cell_polygons(rows, cols, *raster_axes(header), sizes),
+        crs="EPSG:4326",
+    )
+    write_gpkg(grid_df, str(tmp_path / "grid.gpkg"))
+    header["grid"] = str(tmp_path / "grid.gpkg")
+
+    values = cells_raster(rows[:2], cols[:2], np.array([1.0, 2.0]), header, 2)
+
+    assert values[:2].tolist() == [[1.0, 1.0, 2.0, 2.0]] * 2
+    assert np.isnan(values[2:]).all()
+    raster_df = raster_gdf(values, header)
+    assert raster_df["cell_id"].tolist() == ["0_0-0", "0_0-1"]
+    assert raster_df["price_per_square"].tolist() == [1.0, 2.0]
+    assert raster_df.geometry[1].bounds == (2.0, 0.0, 4.0, 2.0)
@@ -0,0 +1,181 @@
+"""
+test local HTTP service of prices
+"""
+
+import asyncio
+import os
+
+import numpy as np
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from data_preproc import axis_index
+from offers_storage import write_offers
+from price_raster import cells_raster, write_raster
+from price_service import GridIndex, PriceService, axis_cell, axis_range, make_app
+
+
+@pytest.fixture
+def grid_dir(grid_dir):
+    """
+    grid with offers of microdistricts
+    """
+
+    (grid_dir / "Data_from_web").mkdir()
+
+    offers = [
+        ("Центральный район", 0.1, 0.1),
+        ("Центральный", 0.2, 0.2),
+        ("Центральный", 1.0, 1.5),
+        ("Северный", 1.9, 2.9),
+        ("Северный", 5.0, 5.0),
+    ]
+    write_offers(
+        (
+            {
+                "offer_id": str(number),
+                "microdistrict": name,
+                "location_lat": lat,
+                "location_long": long,
+            }
+            for number, (name, lat, long) in enumerate(offers)
+        ),
+        "Data_from_web/city_sec_app_offers.parquet",
+    )
+
+    return grid_dir
+
+
+def test_axis_cell():
+    """
+    the same cells as vectorized data_preproc.axis_index
+    """
+
+    axis = np.linspace(30.0, 30.4, 101)
+    values = np.concatenate([axis, np.random.default_rng(0).uniform(29.9, 30.5, 1000)])
+
+    cells = [axis_cell(axis.tolist(), value) for value in values]
+
+    assert cells == axis_index(values, axis).tolist()
+
+
+def test_axis_range():
+    axis = np.array([0.0, 1.0, 2.0, 3.0])
+
+    assert axis_range(axis, 0.5, 1.5) == (0, 2)
+    assert axis_range(axis, 1.0, 2.0) == (1, 3)
+    assert axis_range(axis, -5.0, 10.0) == (0, 3)
+    assert axis_range(axis, 4.0, 5.0) == (0, 0)
+
+
+def test_grid_index_bbox(grid_dir):
+    """
+    mean prices of cells intersecting box are the same as mean of cells
+    """
+
+    index = GridIndex("city", "sec")
+
+    assert index.bbox(0.1, 0.1, 0.9, 1.9) == {
+        "cells": 4,
+        "predicted": pytest.approx(np.mean([100, 101, 103, 104])),
+        "observed_cells": 1,
+        "observed": 50.0,
+    }
+    assert index.bbox(1.5, 2.5, 5.0, 5.0)["cells"] == 0
+    assert index.bbox(1.5, 2.5, 5.0, 5.0)["predicted"] is None
+    assert index.bbox(-1.0, -1.0, 5.0, 5.0)["cells"] == 8
+    assert index.point(1.9, 2.9) == {"predicted": None, "observed": None, "out": True}
+
+    assert index.bbox(0.1, 0.1, 0.8, 1.8) == index.bbox(0.1, 0.1, 0.9, 1.9)
+
+
+def test_grid_index_district(grid_dir):
+    """
+    district cells are cells with its offers, "район" is removed from names
+    """
+
+    index = GridIndex("city", "sec")
+
+    assert index.district("Центральный") == {
+        "cells": 2,
+        "predicted": pytest.approx(np.mean([100, 104])),
+        "observed_cells": 0,
+        "observed": None,
+    }
+    assert index.district("Северный")["cells"] == 0
+    assert index.district("Южный") is None
+
+
+def test_price_service(grid_dir):
+    """
+    point, bbox and district queries, errors of parameters and grid
+    """
+
+    service = PriceService(cities=("city", "Mos"), apps=("sec",))
+
+    async def requests():
+        async with TestClient(TestServer(make_app(service, None))) as client:
+            point = await client.get(
+                "/price", params={"city": "city", "app": "sec", "lat": 1.0, "long": 0.1}
+            )
+            box = await client.get(
+                "/bbox",
+                params={
+                    "city": "city",
+                    "app": "sec",
+                    "lat_min": 0.0,
+                    "long_min": 0.0,
+                    "lat_max": 2.0,
+                    "long_max": 3.0,
+                },
+            )
+            district = await client.get(
+                "/district", params={"city": "city", "app": "sec", "name": "Северный"}
+            )
+            no_grid = await client.get(
+                "/price", params={"city": "Mos", "app": "sec", "lat": 0, "long": 0}
+            )
+            bad = await client.get(
+                "/price", params={"city": "city", "app": "sec", "lat": "nan"}
+            )
+            return (
+                await point.json(),
+                await box.json(),
+                district.status,
+                no_grid.status,
+                bad.status,
+            )
+
+    point, box, district, no_grid, bad = asyncio.run(requests())
+
+    assert point == {"predicted": 103.0, "observed": 50.0, "out": False}
+    assert box["cells"] == 8
+    assert district == 200
+    assert no_grid == 404
+    assert bad == 400
+
+
+def test_price_service_reload(grid_dir, grid_header):
+    """
+    grid is loaded again when prediction file is changed
+    """
+
+    service = PriceService(cities=("city",), apps=("sec",))
+
+    asyncio.run(service.reload())
+    old = service.indexes[("city", "sec")]
+    asyncio.run(service.reload())
+    assert service.indexes[("city", "sec")] is old
+
+    rows, cols = np.divmod(np.arange(8), 3)
+    write_raster(
+        "Data_predict/city_sec_predict.raster",
+        cells_raster(rows, cols, 200.0 + np.arange(8), grid_header),
+        grid_header,
+    )
+    version = os.stat("Data_predict/city_sec_predict.raster").st_mtime_ns
+    os.utime("Data_predict/city_sec_predict.raster", ns=(version, version + 10**9))
+    asyncio.run(service.reload())
+
+    assert service.indexes[("city", "sec")] is not old
+    assert service.indexes[("city", "sec")].point(0.1, 0.1)["predicted"] == 200.0
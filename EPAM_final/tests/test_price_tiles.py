@@ -0,0 +1,112 @@
+"""
+test PNG tiles of predicted prices
+"""
+
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from price_raster import cells_raster, raster_axes, raster_header, write_raster
+from price_tiles import (
+    color_table,
+    colorize,
+    grid_bounds,
+    render_tile,
+    render_tiles,
+    tile_image,
+    tile_index,
+    tile_jobs,
+    tile_latitudes,
+    tile_longitudes,
+    tiles_dir,
+)
+
+BINS = [100, 110, 120, 130]
+
+
+@pytest.fixture
+def header():
+    """
+    grid 0.4 x 0.2 degrees in Saint Petersburg, 4 x 4 cells
+    """
+
+    return raster_header(np.linspace(30.0, 30.4, 5), np.linspace(59.8, 60.0, 5))
+
+
+def test_tile_index():
+    """
+    pixels of tile are in this tile
+    """
+
+    x, y = tile_index(30.3, 59.93, 10)
+
+    assert tile_index(tile_longitudes(x, 10)[0], tile_latitudes(y, 10)[0], 10) == (x, y)
+    assert tile_index(tile_longitudes(x, 10)[-1], tile_latitudes(y, 10)[-1], 10) == (
+        x,
+        y,
+    )
+    assert np.all(np.diff(tile_latitudes(y, 10)) < 0)
+
+
+def test_colorize():
+    """
+    the same bins as numpy.digitize of folium.Choropleth, NaN - transparent
+    """
+
+    values = np.array([100, 105, 110, 125, 130, np.nan])
+
+    index = colorize(values, BINS)
+
+    assert index.tolist() == [0, 0, 1, 2, 2, 3]
+
+    image = tile_image(index.reshape(2, 3), color_table(BINS)).convert("RGBA")
+    alpha = np.asarray(image)[..., 3]
+    assert alpha.tolist() == [[255, 255, 255], [255, 255, 0]]
+
+
+def test_render_tile(header):
+    values = cells_raster([0, 2], [0, 3], [100.0, 125.0], header)
+    lat_array, long_array = raster_axes(header)
+
+    x, y = tile_index(30.2, 59.9, 8)
+    tile = render_tile(values, lat_array, long_array, 8, x, y, BINS)
+
+    assert tile.shape == (256, 256)
+    assert set(np.unique(tile)) == {0, 2, 3}
+
+    x, y = tile_index(37.6, 55.75, 8)
+    assert render_tile(values, lat_array, long_array, 8, x, y, BINS) is None
+
+
+def test_render_tiles(tmp_path, monkeypatch, header):
+    """
+    tiles are written only where there are cells with prices
+    """
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "Data_predict").mkdir()
+    values = cells_raster([0, 2], [0, 3], [100000.0, 125000.0], header)
+    write_raster("Data_predict/city_sec_predict.raster", values, header)
+
+    assert grid_bounds(values, header) == pytest.approx((30.0, 59.8, 30.4, 59.95))
+
+    jobs = tile_jobs("city", "sec", BINS, zooms=[8, 12])
+    for job in jobs:
+        render_tiles(*job)
+
+    files = sorted(
+        os.path.relpath(os.path.join(root, name), tiles_dir("city", "sec"))
+        for root, _, names in os.walk(tiles_dir("city", "sec"))
+        for name in names
+    )
+    x, y = tile_index(30.2, 59.9, 8)
+    assert f"8/{x}/{y}.png" in files
+    assert all(name.startswith(("8/", "12/")) for name in files)
+    # на 12 уровне плитки только в углах сетки с двумя ячейками
+    assert 0 < sum(name.startswith("12/") for name in files) < 4 * 3
+    assert Image.open(os.path.join(tiles_dir("city", "sec"), files[0])).size == (
+        256,
+        256,
+    )
@@ -0,0 +1,94 @@
+"""
+test quadtree cells of adaptive grid
+"""
+
+import numpy as np
+
+from quadtree import fill_cells, fine_axes, quad_ids, quadtree_cells
+
+
+def test_fine_axes():
+    """
+    fixed grid lines are fine grid lines
+    """
+
+    lat_array, long_array = np.linspace(0.0, 3.0, 4), np.linspace(1.0, 2.0, 3)
+
+    fine_lat, fine_long = fine_axes(lat_array, long_array, 1)
+
+    assert fine_lat.tolist() == [0.0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0]
+    assert fine_long.tolist() == [1.0, 1.25, 1.5, 1.75, 2.0]
+
+
+def test_fill_cells():
+    array = np.zeros((4, 4), dtype=int)
+
+    fill_cells(array, np.array([0, 0, 3]), np.array([0, 2, 3]), np.array([2, 1, 1]), 7)
+
+    assert array.tolist() == [[7, 7, 7, 0], [7, 7, 0, 0], [0, 0, 0, 0], [0, 0, 0, 7]]
+
+
+def test_quadtree_cells():
+    """
+    cells with many offers and crossed by city bound are split,
+    cells out of city are dropped, leaves cover city cells once
+    """
+
+    counts = np.zeros((6, 6), dtype=int)
+    counts[0, 0], counts[1, 1] = 20, 3
+    inside = np.ones((6, 6), dtype=bool)
+    inside[5, 5] = False
+
+    rows, cols, levels = quadtree_cells(counts, inside, depth=2, split_count=10)
+
+    assert list(zip(rows.tolist(), cols.tolist(), levels.tolist())) == [
+        (0, 0, 2),
+        (0, 1, 2),
+        (0, 2, 1),
+        (0, 4, 1),
+        (1, 0, 2),
+        (1, 1, 2),
+        (2, 0, 1),
+        (2, 2, 1),
+        (2, 4, 1),
+        (4, 0, 1),
+        (4, 2, 1),
+        (4, 4, 2),
+        (4, 5, 2),
+        (5, 4, 2),
+    ]
+    covered = np.zeros((6, 6), dtype=int)
+    for row, col, level in zip(rows, cols, levels):
+        size = 2 ** (2 - level)
+        covered[row : row + size, col : col + size] += 1
+    assert (covered == inside).all()
+
+
+def test_quadtree_cells_sparse():
+    """
+    root cells without more than split_count offers are not split
+    """
+
+    rows, cols, levels = quadtree_cells(
+        np.ones((8, 8), dtype=int),
+        np.ones((8, 8), dtype=bool),
+        depth=2,
+        split_count=16,
+    )
+
+    assert rows.tolist() == [0, 0, 4, 4]
+    assert cols.tolist() == [0, 4, 0, 4]
+    assert levels.tolist() == [0, 0, 0, 0]
+
+
+def test_quad_ids():
+    """
+    id of parent cell is prefix of ids of its cells
+    """
+
+    rows, cols = np.array([4, 4, 5, 6, 7]), np.array([4, 5, 4, 0, 7])
+
+    ids = quad_ids(rows, cols, np.array([0, 2, 2, 1, 2]), depth=2)
+
+    assert ids == ["1_1", "1_1-01", "1_1-02", "1_0-2", "1_1-33"]
+    assert quad_ids(np.array([4]), np.array([4]), np.array([1]), depth=2) == ["1_1-0"]
@@ -0,0 +1,156 @@
+"""
+test smoothed prices and offers density surfaces
+"""
+
+import numpy as np
+import pytest
+from scipy.signal import convolve2d
+
+import smoothing
+from price_raster import raster_header, read_raster
+from smoothing import (
+    cell_size,
+    coarse_factor,
+    coarse_sums,
+    gaussian_blur,
+    smooth_file,
+    smooth_prices,
+    smooth_surfaces,
+    upsample,
+)
+
+
+@pytest.fixture
+def header():
+    """
+    grid 0.4 x 0.2 degrees in Saint Petersburg, 80 x 80 cells about 280 m
+    """
+
+    return raster_header(np.linspace(30.0, 30.4, 81), np.linspace(59.8, 60.0, 81))
+
+
+def test_gaussian_blur():
+    """
+    the same as direct convolution with normalized kernel, zeros out of arrays
+    """
+
+    rng = np.random.default_rng(0)
+    arrays = rng.random((2, 17, 23))
+
+    blurred = gaussian_blur(arrays, 1.5, 2.5)
+
+    kernel_rows = np.exp(-0.5 * (np.arange(-5, 6) / 1.5) ** 2)
+    kernel_cols = np.exp(-0.5 * (np.arange(-8, 9) / 2.5) ** 2)
+    kernel = np.outer(kernel_rows, kernel_cols) / kernel_rows.sum() / kernel_cols.sum()
+    for array, result in zip(arrays, blurred):
+        np.testing.assert_allclose(
+            result, convolve2d(array, kernel, mode="same"), atol=1e-12
+        )
+
+
+def test_coarse_factor():
+    assert coarse_factor(1.8, 2.0) == 1
+    assert coarse_factor(18.0, 20.0) == 7
+    assert coarse_factor(18.0, 20.0, coarse_sigma=1.0) == 18
+
+
+def test_coarse_sums():
+    """
+    values are split between nearest centers of coarse cells, sums are kept
+    """
+
+    rows, cols = np.array([0, 2, 3]), np.array([1, 2, 5])
+    values = np.array([[1.0, 2.0, 4.0], [1.0, 1.0, 1.0]])
+
+    fine = coarse_sums(rows, cols, values, (5, 6), 1)
+    coarse = coarse_sums(rows, cols, values, (5, 6), 2)
+
+    assert fine.shape == (2, 5, 6)
+    assert fine[0, 0, 1] == 1.0 and fine[0, 2, 2] == 2.0 and fine[0, 3, 5] == 4.0
+    assert coarse.shape == (2, 3, 3)
+    np.testing.assert_allclose(coarse.sum(axis=(1, 2)), [7.0, 3.0])
+    # ячейка (2, 2) на 3/4 пути от центра крупной ячейки (0, 0) к (1, 1),
+    # ячейка (0, 1) левее центров крупных ячеек строки 0
+    np.testing.assert_allclose(
+        coarse[1, :2, :2], [[3 / 4 + 1 / 16, 1 / 4 + 3 / 16], [3 / 16, 9 / 16]]
+    )
+
+
+def test_upsample():
+    """
+    linear functions are not changed between centers of coarse cells
+    """
+
+    coarse_rows, coarse_cols = np.meshgrid(
+        np.arange(4.0), np.arange(3.0), indexing="ij"
+    )
+    coarse = np.stack([coarse_rows, 10 * coarse_cols])
+
+    arrays = upsample(coarse, 3, (11, 8))
+
+    rows, cols = np.meshgrid(np.arange(11.0), np.arange(8.0), indexing="ij")
+    assert arrays.shape == (2, 11, 8)
+    np.testing.assert_allclose(arrays[0, 1:], ((rows + 0.5) / 3 - 0.5)[1:])
+    np.testing.assert_allclose(arrays[1, :, 1:7], 10 * ((cols + 0.5) / 3 - 0.5)[:, 1:7])
+    np.testing.assert_allclose(arrays[0, 0], 0.0)
+    np.testing.assert_allclose(arrays[1, :, 7], 20.0)
+
+
+@pytest.mark.parametrize("bandwidth", [0.5, 3.0])
+def test_smooth_surfaces(header, bandwidth):
+    """
+    constant prices are not changed, density integral is number of offers
+    (kernel 3 km is computed on coarse grid)
+    """
+
+    rng = np.random.default_rng(0)
+    rows, cols = np.nonzero(rng.random((20, 20)) < 0.3)
+    rows, cols = rows + 30, cols + 30
+    counts = rng.integers(1, 5, len(rows))
+
+    smoothed, density = smooth_surfaces(
+        rows, cols, np.full(len(rows), 200000.0), counts, header, bandwidth
+    )
+
+    assert smoothed.shape == density.shape == tuple(header["shape"])
+    assert np.isnan(smoothed[0, 0]) == (bandwidth == 0.5)
+    np.testing.assert_allclose(smoothed[rows, cols], 200000.0, rtol=1e-6)
+    assert np.isfinite(smoothed).sum() > len(rows)
+    height, width = cell_size(header)
+    assert density.sum() * height * width == pytest.approx(counts.sum(), 0.01)
+
+
+def test_smooth_surfaces_coarse(monkeypatch):
+    """
+    surfaces computed on coarse grid are close to surfaces of the grid
+    """
+
+    header = raster_header(np.linspace(30.0, 30.4, 601), np.linspace(59.8, 60.0, 501))
+    rng = np.random.default_rng(1)
+    rows, cols = np.nonzero(rng.random(header["shape"]) < 0.005)
+    prices = rng.uniform(1e5, 3e5, len(rows))
+    counts = rng.integers(1, 5, len(rows))
+
+    smoothed, density = smooth_surfaces(rows, cols, prices, counts, header)
+    monkeypatch.setattr(smoothing, "coarse_factor", lambda *sigmas: 1)
+    exact_smoothed, exact_density = smooth_surfaces(rows, cols, prices, counts, header)
+
+    assert coarse_factor(*(0.5 / size for size in cell_size(header))) == 4
+    np.testing.assert_allclose(smoothed, exact_smoothed, rtol=0.05)
+    assert np.nanmean(np.abs(smoothed / exact_smoothed - 1)) < 0.005
+    np.testing.assert_allclose(density, exact_density, atol=0.05 * density.max())
+
+
+def test_smooth_prices(grid_dir, grid_header):
+    """
+    surfaces rasters have the grid of predictions and NaN out of city cells
+    """
+
+    smooth_prices("city", "sec", bandwidth=100.0)
+
+    smoothed, smooth_header = read_raster(smooth_file("city", "sec", "smooth"))
+    density, _ = read_raster(smooth_file("city", "sec", "density"))
+    assert smooth_header == grid_header
+    np.testing.assert_allclose(smoothed[:2], 50.0)
+    assert np.isnan(smoothed[2, 2]) and np.isnan(density[2, 2])
+    assert density[1, 0] == np.nanmax(density) > 0